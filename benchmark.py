@@ -0,0 +1,274 @@
+'''
+Time the functions in utils.py on synthetic records (see synthetic.py) of increasing numbers
+of records, and track how much memory each one uses at most:
+    python benchmark.py                                  # 1,000 and 10,000 records
+    python benchmark.py --sizes 1000 10000 100000 1000000
+    python benchmark.py --save                           # save the results as the baseline
+    python benchmark.py --threshold 0.2                  # compare with the baseline
+
+The throughput of each function (records per second) is compared with the saved baseline
+(`config.benchmark_baseline`), if there is one, and the script exits with an error if any
+function is slower than the baseline by more than `threshold` (e.g., 0.2 for 20%).
+'''
+import argparse, contextlib, io, json, os, shutil, sys, tempfile, time, tracemalloc
+from collections import OrderedDict
+import config
+import synthetic
+import utils
+
+default_sizes = [1000, 10000]
+
+
+'''
+Benchmarks, in the order they're run (later benchmarks use the files written by earlier
+ones).  Each benchmark is a function given the corpus (see `Corpus`) that runs the function
+being measured and returns the number of records it ran on.
+'''
+benchmarks = OrderedDict()
+
+
+def registerBenchmark(name):
+    def register(run):
+        benchmarks[name] = run
+        return run
+    return register
+
+
+'''
+Synthetic records for the benchmarks: `n` records per metadata standard, generated from
+`seed`, and the folders the record files are written to under `root`.
+'''
+class Corpus:
+    def __init__(self, root, n, seed=0, n_fields=8):
+        self.root, self.n = root, n
+        self.records = {standard: synthetic.generateRecords(n, standard, seed, n_fields) for standard in synthetic.record_generators}
+        self.dirs = {}
+        for standard in self.records:
+            self.dirs[standard] = os.path.join(root, "cleaned", standard) + "/"
+            os.makedirs(self.dirs[standard], exist_ok=True)
+            os.makedirs(self.dirs[standard].replace("cleaned", "corrected"), exist_ok=True)
+        self.texts = None
+
+    def files(self, standard, extension):
+        return utils.listRecordFiles([self.dirs[standard]], extension)
+
+    # The text of the Dublin Core TXT files (read once, for the string checks)
+    def dcTexts(self):
+        if self.texts is None:
+            self.texts = []
+            for file_path in self.files("dublin_core", ".txt"):
+                with open(file_path) as f:
+                    self.texts.append(f.read())
+        return self.texts
+
+
+@registerBenchmark("write_xml")
+def benchWriteXML(corpus):
+    records = corpus.records["dublin_core"]
+    utils.write_xml(list(records.id), list(records.record), corpus.dirs["dublin_core"], "dc_record_", ".xml")
+    utils.write_xml(list(records.id), list(records.record), corpus.dirs["dublin_core"], "dc_record_", ".txt")
+    return len(records)
+
+
+@registerBenchmark("write_json")
+def benchWriteJSON(corpus):
+    for standard, prefix in (("schema_org", "sdo_record_"), ("cidoc_crm", "cidoccrm_record_")):
+        records = corpus.records[standard]
+        utils.write_json(list(records.id), list(records.record), corpus.dirs[standard], prefix, ".json")
+        utils.write_json(list(records.id), list(records.record), corpus.dirs[standard], prefix, ".txt")
+    return len(corpus.records["schema_org"]) + len(corpus.records["cidoc_crm"])
+
+
+@registerBenchmark("namespace_prolog_checks")
+def benchStringChecks(corpus):
+    texts = corpus.dcTexts()
+    for f_string in texts:
+        utils.hasDCNamespaces(f_string)
+        utils.hasRDFNamespace(f_string)
+        utils.hasProlog(f_string)
+        utils.hasPrologWithEncoding(f_string)
+    return len(texts)
+
+
+@registerBenchmark("scanRecords")
+def benchScanRecords(corpus):
+    return len(utils.scanRecords(corpus.files("dublin_core", ".txt")))
+
+
+@registerBenchmark("findEmptyFields_dc")
+def benchEmptyDC(corpus):
+    file_paths = corpus.files("dublin_core", ".txt")
+    utils.findEmptyFields(utils.dc_empty_pattern, file_paths)
+    return len(file_paths)
+
+
+@registerBenchmark("findEmptyFields_json")
+def benchEmptyJSON(corpus):
+    file_paths = corpus.files("schema_org", ".txt") + corpus.files("cidoc_crm", ".txt")
+    utils.findEmptyFields(utils.json_empty_pattern, file_paths)
+    return len(file_paths)
+
+
+@registerBenchmark("emptyFieldReports")
+def benchEmptyReports(corpus):
+    files = {"Schema.org": corpus.files("schema_org", ".txt"), "CIDOC-CRM": corpus.files("cidoc_crm", ".txt")}
+    utils.emptyFieldReports(files, syntax="json", empty_pattern=utils.json_empty_pattern)
+    return sum(len(file_paths) for file_paths in files.values())
+
+
+@registerBenchmark("contextInclusion")
+def benchContextInclusion(corpus):
+    loader = utils.ContextLoader(allow_remote=False)
+    schema_files, cidoc_files = corpus.files("schema_org", ".json"), corpus.files("cidoc_crm", ".json")
+    utils.contextInclusion(schema_files, "Schema.org", utils.schema_context_pattern, utils.schema_context_url_pattern, document_loader=loader)
+    utils.contextInclusion(cidoc_files, "CIDOC-CRM", utils.cidoc_context_pattern, utils.cidoc_context_url_pattern, document_loader=loader)
+    return len(schema_files) + len(cidoc_files)
+
+
+@registerBenchmark("structuralConformance")
+def benchStructuralConformance(corpus):
+    loader = utils.ContextLoader(allow_remote=False)
+    dc_files, schema_files, cidoc_files = corpus.files("dublin_core", ".xml"), corpus.files("schema_org", ".json"), corpus.files("cidoc_crm", ".json")
+    utils.structuralConformance(dc_files, "dublin_core")
+    utils.structuralConformance(schema_files, "schema_org")
+    utils.structuralConformance(cidoc_files, "cidoc_crm", document_loader=loader)
+    return len(dc_files) + len(schema_files) + len(cidoc_files)
+
+
+@registerBenchmark("validateShapes")
+def benchValidateShapes(corpus):
+    file_paths = corpus.files("dublin_core", ".xml") + corpus.files("schema_org", ".json") + corpus.files("cidoc_crm", ".json")
+    utils.validateShapes(file_paths, document_loader=utils.ContextLoader(allow_remote=False))
+    return len(file_paths)
+
+
+@registerBenchmark("nearDuplicates")
+def benchNearDuplicates(corpus):
+    file_paths = corpus.files("dublin_core", ".txt") + corpus.files("schema_org", ".txt") + corpus.files("cidoc_crm", ".txt")
+    utils.nearDuplicateClusters(utils.minhashSignatures(file_paths))
+    return len(file_paths)
+
+
+@registerBenchmark("correctXML")
+def benchCorrectXML(corpus):
+    if not hasattr(corpus, "xml_errors"):
+        # Find the malformed files (not timed: only the first run, to measure time, finds them)
+        syntax = utils.xmlSyntaxErrors(corpus.files("dublin_core", ".xml"))
+        syntax = syntax.loc[syntax.exception_type.notna()]
+        corpus.xml_errors = ([file_path.replace(".xml", ".txt") for file_path in syntax.file_path], list(syntax.exception_message))
+    utils.correctXML(*corpus.xml_errors)
+    return len(corpus.xml_errors[0])
+
+
+@registerBenchmark("correctJSON")
+def benchCorrectJSON(corpus):
+    if not hasattr(corpus, "json_errors"):
+        syntax = utils.jsonSyntaxErrors(corpus.files("schema_org", ".json") + corpus.files("cidoc_crm", ".json"))
+        corpus.json_errors = [file_path.replace(".json", ".txt") for file_path in syntax.loc[syntax.exception_type.notna()].file_path]
+    utils.correctJSON(corpus.json_errors)
+    return len(corpus.json_errors)
+
+
+'''
+Run a benchmark once and return how long it took and how many records it ran on; with
+`memory=True`, also return the most memory (in bytes) allocated while it ran.  The messages
+the functions print are hidden.
+'''
+def runBenchmark(run, corpus, memory=False):
+    # Start with an empty cache of parsed records, so each benchmark parses the records itself
+    utils.default_parse_cache.clear()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        records = run(corpus)
+        seconds = time.perf_counter() - start
+        peak = None
+        if memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return seconds, records, peak
+
+
+'''
+Run every benchmark in `names` (by default, all of them) on corpora of each size in `sizes`.
+Each benchmark is timed on its own, then (if `memory` is True) run again while tracking
+memory, since tracking memory slows it down.  Returns a list of results, one dictionary per
+benchmark per size.
+'''
+def runBenchmarks(sizes, names=None, seed=0, memory=True, root=None):
+    if names is None:
+        names = list(benchmarks)
+    results = []
+    for n in sizes:
+        corpus_root = tempfile.mkdtemp(prefix="lada_benchmark_", dir=root)
+        try:
+            corpus = Corpus(corpus_root, n, seed)
+            # The benchmarks that write the files are always run, so the others have files to read
+            for name in benchmarks:
+                if not name in names and not name.startswith("write_"):
+                    continue
+                seconds, records, peak = runBenchmark(benchmarks[name], corpus)
+                if memory:
+                    peak = runBenchmark(benchmarks[name], corpus, memory=True)[2]
+                result = {
+                    "benchmark": name, "size": n, "records": records, "seconds": seconds,
+                    "records_per_second": records / seconds if seconds > 0 else float("inf"), "peak_memory_mb": peak / 2**20 if peak is not None else None
+                    }
+                results.append(result)
+                print(f"{name:<26} {n:>9,} records  {seconds:8.2f}s  {result['records_per_second']:>12,.0f} records/s" +
+                      (f"  {result['peak_memory_mb']:8.1f} MB peak" if peak is not None else ""))
+        finally:
+            shutil.rmtree(corpus_root, ignore_errors=True)
+    return results
+
+
+'''
+Compare results with a baseline (from an earlier run) and return a list of the benchmarks
+whose throughput dropped by more than `threshold` (e.g., 0.2 for 20%).
+'''
+def findRegressions(results, baseline, threshold=0.2):
+    baseline_throughput = {(result["benchmark"], result["size"]): result["records_per_second"] for result in baseline}
+    regressions = []
+    for result in results:
+        before = baseline_throughput.get((result["benchmark"], result["size"]))
+        if before is not None and result["records_per_second"] < before * (1 - threshold):
+            regressions.append(dict(result, baseline_records_per_second=before, change=result["records_per_second"] / before - 1))
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark the functions in utils.py on synthetic records.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=default_sizes, help="numbers of records to run each benchmark on")
+    parser.add_argument("--benchmarks", nargs="+", default=None, choices=list(benchmarks), help="benchmarks to run (default: all)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for generating the records")
+    parser.add_argument("--no-memory", action="store_true", help="don't track memory use (runs each benchmark once)")
+    parser.add_argument("--baseline", default=config.benchmark_baseline, help="baseline results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="largest drop in throughput allowed before failing (0.2 = 20%%)")
+    parser.add_argument("--save", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--tmp", default=None, help="folder to write the synthetic records in (default: the system's temporary folder)")
+    args = parser.parse_args(args)
+
+    results = runBenchmarks(args.sizes, args.benchmarks, seed=args.seed, memory=not args.no_memory, root=args.tmp)
+
+    status = 0
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = findRegressions(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION: {regression['benchmark']} ({regression['size']:,} records) ran at {regression['records_per_second']:,.0f} records/s,",
+                  f"{-regression['change']:.0%} slower than the baseline ({regression['baseline_records_per_second']:,.0f} records/s).")
+        print(len(regressions), "regression(s) beyond the threshold of", f"{args.threshold:.0%}", "compared with", args.baseline)
+        status = 1 if len(regressions) > 0 else 0
+    if args.save:
+        if os.path.dirname(args.baseline):
+            os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=1)
+        print("Saved the results as the baseline:", args.baseline)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
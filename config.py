@@ -1,3 +1,17 @@
 task1_data = "data/data_task1/"
 playgrd1_data = "data/data_playground_task1/"
-playgrd3_data = "data/data_playground_task3/"
\ No newline at end of file
+playgrd3_data = "data/data_playground_task3/"
+
+url_cache = "data/cache/url_checks.sqlite"
+context_cache = "data/cache/contexts/"
+record_store = "data/records.dat"
+manifest = "data/cache/results/"
+vocabulary_index = "data/cache/vocabularies.pkl"
+ontology_index = "data/cache/cidoc_crm.idx"
+parse_cache = "data/cache/parsed/"
+benchmark_baseline = "data/benchmarks/baseline.json"
+trace_dir = "data/traces/"
+
+# The formats the notebooks save reports in: "csv", and/or "parquet" for Parquet files (which
+# load faster and use less memory, and require pyarrow)
+report_formats = ["csv"]
@@ -0,0 +1,290 @@
+'''
+Run the data preparation and evaluation checks without Jupyter, for example in a batch job:
+    python pipeline.py                                  # prepare the data and run every check
+    python pipeline.py syntax completeness              # only the checks of some notebooks
+    python pipeline.py --no-prepare --workers 4         # use the record files already written
+    python pipeline.py --batch-workers 8                # check each stage's files in 8 processes
+    python pipeline.py --list                           # list the stages
+    python pipeline.py --trace data/traces/             # record where the time goes
+
+Each stage is run once the stages it depends on have finished, and stages that don't
+depend on each other are run at the same time in separate processes.  The results of each
+check are saved with `utils.Manifest` in `config.manifest` (see `utils.runIncremental`), so
+running the pipeline again only checks records that have changed, and the evaluation
+notebooks read the same saved results instead of running the checks again.
+Records parsed by one check are kept for the others in a `utils.ParseCache` (one per
+process, see `stageParseCache`), and expanded JSON-LD documents are saved in `config.parse_cache`, so stages running in different
+processes expand each record only once; how often the cache was used is printed at the end.
+With `--trace`, each stage records a trace (see `utils.Trace`) of how long it spent on each
+operation and file, saved as "{stage}.json" in the trace folder, and a summary table of
+every stage's trace is printed and saved as "summary.csv".
+'''
+import argparse, functools, os, sys, time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import pandas as pd
+import config
+import utils
+
+# The outcomes spreadsheet for each dataset (see data-prep.ipynb)
+datasets = {
+    "prepare_task1": (config.task1_data, "4-H Data Experiment Assignments and Outcomes - Outcomes - Task 1.csv"),
+    "prepare_playground_task1": (config.playgrd1_data, "4-H Data Experiment Assignments and Outcomes - Playground Outcomes - Task 1.csv"),
+    "prepare_playground_task3": (config.playgrd3_data, "4-H Data Experiment Assignments and Outcomes - Playground Outcomes - Task 3.csv"),
+}
+
+# The checks run by the evaluation notebooks: the function run on each file, the metadata
+# standard(s) and file extension of the files (or a dictionary of extensions by standard), and the function's other arguments (using
+# the same names for the checks as the notebooks, so they share the saved results)
+checks = {
+    "dublin_core_xml_syntax": {"function": utils.xmlSyntaxErrors, "standards": ["dublin_core"], "extension": ".xml"},
+    "json_syntax": {"function": utils.jsonSyntaxErrors, "standards": ["cidoc_crm", "schema_org"], "extension": ".json"},
+    "dublin_core_scan": {"function": utils.scanRecords, "standards": ["dublin_core"], "extension": ".txt"},
+    "cidoc_crm_empty_fields": {
+        "function": utils.findEmptyFields, "standards": ["cidoc_crm"], "extension": ".txt",
+        "kwargs": {"empty_pattern": utils.json_empty_pattern}
+        },
+    "schema_org_empty_fields": {
+        "function": utils.findEmptyFields, "standards": ["schema_org"], "extension": ".txt",
+        "kwargs": {"empty_pattern": utils.json_empty_pattern}
+        },
+    "schema_org_context_inclusion": {
+        "function": utils.contextInclusion, "standards": ["schema_org"], "extension": ".json",
+        "kwargs": {"data_model": "Schema.org", "context_pattern": utils.schema_context_pattern, "context_url_pattern": utils.schema_context_url_pattern}
+        },
+    "cidoc_crm_context_inclusion": {
+        "function": utils.contextInclusion, "standards": ["cidoc_crm"], "extension": ".json",
+        "kwargs": {"data_model": "CIDOC-CRM", "context_pattern": utils.cidoc_context_pattern, "context_url_pattern": utils.cidoc_context_url_pattern}
+        },
+    "dublin_core_structure": {"function": utils.structuralConformance, "standards": ["dublin_core"], "extension": ".xml", "kwargs": {"standard": "dublin_core"}},
+    "schema_org_structure": {"function": utils.structuralConformance, "standards": ["schema_org"], "extension": ".json", "kwargs": {"standard": "schema_org"}},
+    "cidoc_crm_structure": {"function": utils.structuralConformance, "standards": ["cidoc_crm"], "extension": ".json", "kwargs": {"standard": "cidoc_crm"}},
+    "dublin_core_minhash": {"function": utils.minhashSignatures, "standards": ["dublin_core"], "extension": ".txt"},
+    "schema_org_minhash": {"function": utils.minhashSignatures, "standards": ["schema_org"], "extension": ".txt"},
+    "cidoc_crm_minhash": {"function": utils.minhashSignatures, "standards": ["cidoc_crm"], "extension": ".txt"},
+    "shape_validation": {
+        "function": utils.validateShapes, "standards": ["dublin_core", "schema_org", "cidoc_crm"],
+        "extension": {"dublin_core": ".xml", "schema_org": ".json", "cidoc_crm": ".json"}
+        },
+}
+
+# The check functions that parse records, which are given the process's cache of parsed records
+parsing_checks = (utils.xmlSyntaxErrors, utils.jsonSyntaxErrors, utils.contextInclusion, utils.structuralConformance, utils.validateShapes)
+
+# The checks of each evaluation notebook
+evaluations = {
+    "syntax": ["dublin_core_xml_syntax", "dublin_core_scan", "json_syntax"],
+    "completeness": ["dublin_core_scan", "cidoc_crm_empty_fields", "schema_org_empty_fields", "shape_validation"],
+    "conformance": ["dublin_core_scan", "dublin_core_structure", "schema_org_context_inclusion", "schema_org_structure", "cidoc_crm_context_inclusion", "cidoc_crm_structure",
+                    "dublin_core_minhash", "schema_org_minhash", "cidoc_crm_minhash"],
+}
+
+
+'''
+Return the folders of the cleaned record files for a metadata standard (e.g.,
+"dublin_core") in every dataset.
+'''
+def recordDirs(standard):
+    return [data_dir + "cleaned/" + standard + "/" for data_dir, f in datasets.values()]
+
+
+'''
+List the record files with the file extension `extension` (or, if it's a dictionary, the
+extension for each standard) for each metadata standard in `standards`, in every dataset
+(from `store`, a `utils.RecordStore`, if provided).
+'''
+def recordFiles(standards, extension, store=None):
+    file_paths = []
+    for standard in standards:
+        dirs = recordDirs(standard)
+        if store is None:
+            dirs = [dir for dir in dirs if os.path.isdir(dir)]
+        file_paths += utils.listRecordFiles(dirs, extension[standard] if isinstance(extension, dict) else extension, store=store)
+    return file_paths
+
+
+'''
+Return the stage graph: the stages each stage has to wait for.  The checks wait for the
+data to be prepared, and if the records are saved to a record store, the datasets are
+prepared one after another so only one process writes to the store at a time.
+'''
+def stageGraph(prepare=True, store_path=None):
+    graph, previous = {}, []
+    if prepare:
+        for name in datasets:
+            graph[name] = list(previous) if store_path is not None else []
+            if store_path is not None:
+                previous = [name]
+    for name in checks:
+        graph[name] = [stage for stage in datasets if stage in graph]
+    return graph
+
+
+'''
+Run one stage (in a worker process), recording a trace of it in `trace_dir` if given.
+Returns a dictionary of what the stage did.
+'''
+def runStage(name, store_path=None, offline=False, trace_dir=None, batch_workers=None):
+    if trace_dir is None:
+        return stageResult(name, store_path, offline, batch_workers)
+    utils.startTrace()
+    try:
+        return stageResult(name, store_path, offline, batch_workers)
+    finally:
+        utils.stopTrace().export(os.path.join(trace_dir, name + ".json"))
+
+
+# The cache of parsed records kept between the stages run in this process, which shares
+# expanded JSON-LD with other processes through `config.parse_cache`
+@functools.lru_cache(maxsize=None)
+def stageParseCache():
+    return utils.ParseCache(cache_dir=config.parse_cache)
+
+
+def stageResult(name, store_path=None, offline=False, batch_workers=None):
+    start = time.time()
+    store = utils.openStore(store_path) if store_path is not None else None
+    if name in datasets:
+        data_dir, f = datasets[name]
+        if not os.path.exists(data_dir + f):
+            print(name + ": skipped,", data_dir + f, "not found.")
+            return {"stage": name, "files": 0, "seconds": time.time() - start}
+        files_written = utils.prepareRecords(data_dir, f, store=store)
+        return {"stage": name, "files": sum(files_written.values()), "seconds": time.time() - start}
+
+    check = checks[name]
+    parse_cache = stageParseCache()
+    stats_before = dict(parse_cache.stats)
+    kwargs = dict(check.get("kwargs", {}))
+    if check["function"] in parsing_checks:
+        kwargs["parse_cache"] = parse_cache
+    if check["function"] in (utils.contextInclusion, utils.validateShapes) or kwargs.get("standard") == "cidoc_crm":
+        kwargs["document_loader"] = utils.ContextLoader(cache_dir=config.context_cache, allow_remote=not offline)
+    if check["function"] is utils.structuralConformance:
+        if kwargs["standard"] == "cidoc_crm":
+            utils.loadOntologyIndex(config.ontology_index)
+        else:
+            utils.loadVocabularyIndex(config.vocabulary_index)
+    file_paths = recordFiles(check["standards"], check["extension"], store=store)
+    results = utils.runIncremental(check["function"], file_paths, check=name, manifest=utils.Manifest(config.manifest), workers=batch_workers, **kwargs)
+    summary = {"stage": name, "files": len(results), "seconds": time.time() - start}
+    # With batch workers, the records are parsed (and counted) in the workers' copies of the cache
+    if batch_workers is None:
+        summary["parse_cache"] = {key: count - stats_before[key] for key, count in parse_cache.stats.items()}
+    return summary
+
+
+'''
+Run the stages in `names` (and the stages they depend on) in `workers` processes at once,
+starting each stage as soon as the stages it depends on have finished.  If a stage raises
+an exception, the stages that depend on it are skipped.  With `batch_workers`, each stage
+checks its files in that many processes (see `utils.runIncremental`).  Returns a list of
+what each stage did and a dictionary of the exceptions raised, by stage.
+'''
+def runStages(names, graph, workers=None, store_path=None, offline=False, trace_dir=None, batch_workers=None):
+    needed, to_add = set(), list(names)
+    while len(to_add) > 0:
+        name = to_add.pop()
+        if not name in needed:
+            needed.add(name)
+            to_add += graph[name]
+
+    summaries, errors, done, running = [], {}, set(), {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while len(done) < len(needed):
+            for name in [name for name in graph if name in needed]:
+                if name in done or name in running.values():
+                    continue
+                if any(stage in errors for stage in graph[name]):
+                    errors[name] = "Skipped: a stage it depends on failed"
+                    done.add(name)
+                elif all(stage in done for stage in graph[name]):
+                    running[executor.submit(runStage, name, store_path, offline, trace_dir, batch_workers)] = name
+            if len(running) == 0:
+                continue
+            finished, not_finished = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    summaries += [future.result()]
+                except Exception as e:
+                    errors[name] = e
+                done.add(name)
+    return summaries, errors
+
+
+'''
+Combine the traces saved by the stages in `names` in `trace_dir` into one summary table
+(see `utils.traceSummary`) and save it as "summary.csv".
+'''
+def summarizeTraces(trace_dir, names):
+    tables = []
+    for name in names:
+        if os.path.exists(os.path.join(trace_dir, name + ".json")):
+            tables.append(utils.traceSummary(os.path.join(trace_dir, name + ".json")))
+    if len(tables) == 0:
+        return None
+    summary = pd.concat(tables, ignore_index=True).sort_values("seconds", ascending=False).reset_index(drop=True)
+    summary.to_csv(os.path.join(trace_dir, "summary.csv"), index=False)
+    return summary
+
+
+'''
+Return the saved results of a check (see `checks`) as a DataFrame, or None if the check
+hasn't been run.
+'''
+def loadResults(name):
+    return utils.Manifest(config.manifest).loadResults(name)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Prepare the data and run the evaluation checks without Jupyter.")
+    parser.add_argument("stages", nargs="*", help="evaluations (" + ", ".join(evaluations) + ") or stages to run (default: all)")
+    parser.add_argument("--no-prepare", action="store_true", help="use the record files already written instead of preparing the data again")
+    parser.add_argument("--store", default=None, help="read and write the records in a record store at this path (e.g., " + config.record_store + ")")
+    parser.add_argument("--workers", type=int, default=None, help="number of stages to run at once (default: one per CPU)")
+    parser.add_argument("--batch-workers", type=int, default=None, help="number of processes to check each stage's files in (see utils.runBatch; default: the stage's own process)")
+    parser.add_argument("--offline", action="store_true", help="don't load JSON-LD contexts over the network")
+    parser.add_argument("--trace", default=None, help="save a trace of each stage in this folder (e.g., " + config.trace_dir + ")")
+    parser.add_argument("--list", action="store_true", help="list the stages and the stages each one depends on")
+    args = parser.parse_args(args)
+
+    graph = stageGraph(prepare=not args.no_prepare, store_path=args.store)
+    if args.list:
+        for name, after in graph.items():
+            print(name, "(after " + ", ".join(after) + ")" if len(after) > 0 else "")
+        return 0
+
+    names = []
+    for stage in (args.stages or list(evaluations)):
+        if stage in evaluations:
+            names += evaluations[stage]
+        elif stage in graph:
+            names += [stage]
+        else:
+            parser.error("unknown stage: " + stage)
+    names = list(dict.fromkeys(names + [stage for stage in datasets if stage in graph]))
+
+    start = time.time()
+    if args.trace is not None:
+        os.makedirs(args.trace, exist_ok=True)
+    summaries, errors = runStages(names, graph, workers=args.workers, store_path=args.store, offline=args.offline, trace_dir=args.trace, batch_workers=args.batch_workers)
+    print()
+    for summary in summaries:
+        print(f"{summary['stage']}: {summary['files']} files in {summary['seconds']:.1f}s")
+    for name, e in errors.items():
+        print(f"{name}: {type(e).__name__ if isinstance(e, Exception) else ''} {e}")
+    print(f"Finished {len(summaries)} stage(s) in {time.time() - start:.1f}s;", len(errors), "failed or skipped.")
+    stats = [summary["parse_cache"] for summary in summaries if "parse_cache" in summary]
+    if len(stats) > 0:
+        print(utils.parseCacheReport({key: sum(stage_stats[key] for stage_stats in stats) for key in stats[0]}))
+    if args.trace is not None:
+        summary = summarizeTraces(args.trace, [summary["stage"] for summary in summaries])
+        if summary is not None:
+            print()
+            print(summary.head(20).to_string(index=False))
+            print("Traces saved in", args.trace)
+    return 1 if len(errors) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+'''
+Generate synthetic metadata records like the ones in the outcomes spreadsheets, for testing
+and benchmarking the functions in utils.py without the real data.  Records are generated
+from a seed, so the same arguments always give the same records, and known rates of each
+kind of error the evaluation notebooks look for are added to them:
+  * Dublin Core XML (simple or qualified): missing namespaces, missing prologs, empty or
+    "unknown" values, and doubled quotes
+  * Schema.org and CIDOC-CRM JSON-LD: comments, doubled quotes, missing closing braces,
+    empty or "unknown" values, and missing contexts
+For example:
+    records = synthetic.generateRecords(1000, "dublin_core", seed=1)
+    synthetic.writeSpreadsheet("data/data_synthetic/", "synthetic.csv", 1000)
+'''
+import os, json, random
+import pandas as pd
+import utils
+
+# The rate (from 0 to 1) of records with each kind of error, by metadata standard
+error_rates = {
+    "dublin_core": {"missing_namespace": 0.1, "missing_prolog": 0.1, "empty_value": 0.2, "doubled_quotes": 0.05},
+    "schema_org": {"comment": 0.05, "doubled_quotes": 0.05, "missing_brace": 0.05, "empty_value": 0.2, "missing_context": 0.05},
+    "cidoc_crm": {"comment": 0.05, "doubled_quotes": 0.05, "missing_brace": 0.05, "empty_value": 0.2, "missing_context": 0.05},
+}
+# The rate of Dublin Core records that use qualified Dublin Core (dcterms) fields
+qualified_rate = 0.5
+# The values used for empty fields (the values the notebooks count as empty)
+empty_values = ["unknown", "none", "", "not specified", "Unknown"]
+
+words = [
+    "4-H", "club", "annual", "report", "photograph", "letter", "meeting", "county", "fair", "youth",
+    "agriculture", "program", "poster", "pledge", "camp", "national", "center", "student", "poem", "award",
+    "garden", "livestock", "leader", "newsletter", "extension", "community", "history", "project", "exhibit", "record",
+]
+dc_fields = ["title", "creator", "subject", "description", "publisher", "date", "type", "format", "identifier", "language", "rights"]
+dc_qual_fields = ["created", "extent", "spatial", "temporal", "isPartOf"]
+
+
+def text(rng, n_words=4):
+    return " ".join(rng.choice(words) for i in range(n_words))
+
+
+def year(rng):
+    return str(rng.randint(1902, 2024))
+
+
+'''
+Return a list of the errors to add to a record, picking each error in `rates` with its rate.
+'''
+def pickErrors(rng, rates):
+    return [error for error, rate in rates.items() if rng.random() < rate]
+
+
+'''
+Generate a Dublin Core XML record with `n_fields` fields (plus a subject per extra field,
+so records can be made larger).  Returns the record and whether it is qualified.
+'''
+def dublinCoreRecord(rng, record_id, n_fields, errors):
+    qualified = rng.random() < qualified_rate
+    values = []
+    for i in range(n_fields):
+        field = dc_fields[i] if i < len(dc_fields) else "subject"
+        value = year(rng) if field == "date" else text(rng)
+        values.append(("dc", field, value))
+    if qualified:
+        values += [("dcterms", field, year(rng) if field in ("created", "temporal") else text(rng)) for field in dc_qual_fields]
+    if "empty_value" in errors:
+        i = rng.randrange(len(values))
+        values[i] = (values[i][0], values[i][1], rng.choice(empty_values))
+    if "doubled_quotes" in errors:
+        i = rng.randrange(len(values))
+        values[i] = (values[i][0], values[i][1], '""' + values[i][2] + '""')
+
+    lines = []
+    if not "missing_prolog" in errors:
+        lines.append('<?xml version="1.0" encoding="UTF-8"?>')
+    if "missing_namespace" in errors:
+        lines.append("<metadata>")
+    else:
+        lines.append(utils.dc_prefix_open_tag_qual if qualified else utils.dc_prefix_open_tag_simple)
+        lines.append('<rdf:Description rdf:about="http://example.org/records/' + str(record_id) + '">')
+    lines += ["<" + prefix + ":" + field + ">" + value + "</" + prefix + ":" + field + ">" for prefix, field, value in values]
+    if "missing_namespace" in errors:
+        lines.append("</metadata>")
+    else:
+        lines.append("</rdf:Description>")
+        lines.append(utils.dc_prefix_close_tag)
+    return "\n".join(lines), qualified
+
+
+# Write a JSON record (as a dictionary) with one field per line and add the errors to it
+def jsonRecord(rng, record, errors):
+    lines = json.dumps(record, indent=2).split("\n")
+    if "doubled_quotes" in errors:
+        # Double the quotes around the first "name" value
+        i = [line.strip().startswith('"name": "') for line in lines].index(True)
+        key, value = lines[i].split(": ", 1)
+        comma = "," if value.endswith(",") else ""
+        lines[i] = key + ': "' + value.rstrip(",") + '"' + comma
+    if "comment" in errors:
+        lines.insert(rng.randrange(1, len(lines)-1), rng.choice(["  // generated record", "  # generated record", "  /* generated record */"]))
+    f_string = "\n".join(lines)
+    if "missing_brace" in errors:
+        f_string = f_string[:f_string.rindex("}")]
+    return f_string
+
+
+def schemaRecord(rng, record_id, n_fields, errors):
+    record = {} if "missing_context" in errors else {"@context": {"@vocab": "https://schema.org/"}}
+    record.update({
+        "@type": "CreativeWork",
+        "@id": "http://example.org/records/" + str(record_id),
+        "name": text(rng),
+        "description": text(rng, 12),
+        "dateCreated": year(rng),
+        "creator": {"@type": "Organization", "name": text(rng, 2)},
+        "keywords": [text(rng, 2) for i in range(max(n_fields - 5, 1))],
+    })
+    if "empty_value" in errors:
+        record[rng.choice(["description", "dateCreated"])] = rng.choice(empty_values)
+    return jsonRecord(rng, record, errors)
+
+
+def cidocRecord(rng, record_id, n_fields, errors):
+    record = {} if "missing_context" in errors else {"@context": {"@vocab": "http://www.cidoc-crm.org/cidoc-crm/"}}
+    record.update({
+        "@id": "http://example.org/records/" + str(record_id),
+        "@type": "E22_Human-Made_Object",
+        "name": text(rng),
+        "P102_has_title": {"@type": "E35_Title", "P190_has_symbolic_content": text(rng)},
+        "P108i_was_produced_by": {
+            "@type": "E12_Production",
+            "P4_has_time-span": {"@type": "E52_Time-Span", "P82_at_some_time_within": year(rng)},
+            "P14_carried_out_by": {"@type": "E74_Group", "P1_is_identified_by": text(rng, 2)},
+        },
+        "P129_is_about": [{"@type": "E55_Type", "P1_is_identified_by": text(rng, 2)} for i in range(max(n_fields - 5, 1))],
+    })
+    if "empty_value" in errors:
+        record["P102_has_title"]["P190_has_symbolic_content"] = rng.choice(empty_values)
+    return jsonRecord(rng, record, errors)
+
+
+record_generators = {"dublin_core": dublinCoreRecord, "schema_org": schemaRecord, "cidoc_crm": cidocRecord}
+
+
+'''
+Generate `n` records in a metadata standard ("dublin_core", "schema_org", or "cidoc_crm")
+with `n_fields` fields each, from `seed`.  Each record is written like a spreadsheet cell,
+with a line of text before it, as the records in the outcomes spreadsheets are.  Returns a
+DataFrame with one row per record: its ID, the record, and the errors added to it.
+'''
+def generateRecords(n, standard, seed=0, n_fields=8, rates=None):
+    if rates is None:
+        rates = error_rates[standard]
+    rng = random.Random(str(seed) + standard)
+    ids, records, errors_per_record = [], [], []
+    for record_id in range(1, n+1):
+        errors = pickErrors(rng, rates)
+        record = record_generators[standard](rng, record_id, n_fields, errors)
+        if standard == "dublin_core":
+            record, qualified = record
+        ids.append(record_id)
+        records.append("Here is the metadata record:\n" + record)
+        errors_per_record.append(errors)
+    return pd.DataFrame({"id": ids, "record": records, "errors": errors_per_record})
+
+
+'''
+Write an outcomes spreadsheet with `n` rows of synthetic records (one record per metadata
+standard per row) to `data_dir + f`, which can be prepared with data-prep.ipynb or
+`utils.prepareRecords`.  Returns the generated records by metadata standard.
+'''
+def writeSpreadsheet(data_dir, f, n, seed=0, n_fields=8):
+    generated = {standard: generateRecords(n, standard, seed, n_fields) for standard in record_generators}
+    df = pd.DataFrame({
+        "ID": generated["dublin_core"]["id"],
+        "Filename": ["synthetic_" + str(record_id) for record_id in generated["dublin_core"]["id"]],
+        "Metadata record": generated["dublin_core"]["record"],
+        "Schema.org Record": generated["schema_org"]["record"],
+        "CIDOC-CRM Record": generated["cidoc_crm"]["record"],
+    })
+    if os.path.dirname(data_dir + f):
+        os.makedirs(os.path.dirname(data_dir + f), exist_ok=True)
+    df.to_csv(data_dir + f, index=False)
+    return generated
@@ -0,0 +1,90 @@
+'''
+Check that `utils.runBatch` keeps its output lined up with the files it's given when some
+of them raise an exception, and that it only runs the functions that write files once per
+file:
+    python -m pytest test_batch.py
+'''
+import os, re
+import utils
+
+
+record = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" xmlns:dc="http://purl.org/dc/elements/1.1/">'
+    '<rdf:Description rdf:about="record-%d"><dc:title>Record %d</dc:title><dc:creator>%s</dc:creator></rdf:Description>'
+    '</rdf:RDF>\n'
+    )
+
+
+# Write `n` Dublin Core records to a folder (every third one with an empty creator), and
+# return their paths with a missing file's path at `missing`
+def writeRecords(folder, n, missing):
+    file_paths = []
+    for i in range(n):
+        file_path = os.path.join(str(folder), "record_%d.xml" % i)
+        with open(file_path, "w") as f:
+            f.write(record % (i, i, "unknown" if i % 3 == 0 else "Someone"))
+        file_paths.append(file_path)
+    file_paths.insert(missing, os.path.join(str(folder), "missing.xml"))
+    return file_paths
+
+
+
+############################################################
+########################## TESTS ###########################
+############################################################
+
+
+
+def test_missing_file_gets_a_row(tmp_path):
+    for workers in [1, 2]:
+        folder = tmp_path / str(workers)
+        folder.mkdir()
+        file_paths = writeRecords(folder, 7, missing=4)
+        results, errors = utils.runBatch(utils.scanRecords, file_paths, workers=workers, chunk_size=3)
+        assert list(results.file_path) == file_paths
+        assert [error["file"] for error in errors] == [file_paths[4]]
+        assert errors[0]["exception_type"] is FileNotFoundError
+        assert results.exception_type[4] == str(FileNotFoundError)
+        assert results.exception_type.drop(4).isna().all()
+        assert results.has_prolog.drop(4).all()
+
+
+def test_missing_file_gets_none(tmp_path):
+    file_paths = writeRecords(tmp_path, 7, missing=2)
+    empty = re.compile(r"<dc:creator>unknown</dc:creator>")
+    files_with_empty, empty_counts, empty_fields = utils.runBatch(
+        utils.findEmptyFields, file_paths, empty_pattern=empty, workers=1, chunk_size=3
+        )[0]
+    assert len(empty_counts) == len(empty_fields) == len(file_paths)
+    assert empty_counts[2] is None and empty_fields[2] is None
+    # Records 0, 3 and 6 have an empty creator, and come after the missing file from record 2 on
+    assert empty_counts == [1, 0, None, 0, 1, 0, 0, 1]
+    assert files_with_empty == [file_paths[0], file_paths[4], file_paths[7]]
+
+
+def test_writers_run_once_per_file(tmp_path, monkeypatch):
+    cleaned, corrected = tmp_path / "cleaned", tmp_path / "corrected"
+    cleaned.mkdir()
+    corrected.mkdir()
+    txt_files = []
+    for i in range(5):
+        txt_file = str(cleaned / ("record_%d.txt" % i))
+        with open(txt_file, "w") as f:
+            f.write("<record><dc:title>Record %d</dc:title></record>" % i)
+        txt_files.append(txt_file)
+    txt_files.insert(3, str(cleaned / "missing.txt"))
+    messages = ["Namespace prefix dc on title is not defined, line 1, column 20"] * len(txt_files)
+
+    written = []
+    def countingOpen(file, mode="r", *args, **kwargs):
+        if "w" in mode:
+            written.append(file)
+        return open(file, mode, *args, **kwargs)
+    monkeypatch.setattr(utils, "open", countingOpen, raising=False)
+    still_incorrect, errors = utils.runBatch(utils.correctXML, txt_files, messages, workers=1, chunk_size=3)
+    assert sorted(written) == sorted(set(written))
+    assert len(written) == 5
+    assert [error["file"] for error in errors] == [txt_files[3]]
+    # The missing file couldn't be corrected; the others could
+    assert [row if isinstance(row, str) else row["file"] for row in still_incorrect] == [txt_files[3]]
@@ -0,0 +1,122 @@
+'''
+Check the repairs `utils.correctXML` and `utils.correctJSON` make to malformed records, and
+the outputs they return:
+    python -m pytest test_correct.py
+'''
+import json
+import xml.etree.ElementTree as ET
+import pandas as pd
+import utils
+
+
+settings = {
+    "dc_prefix_open_tag_simple": utils.dc_prefix_open_tag_simple, "dc_prefix_open_tag_qual": utils.dc_prefix_open_tag_qual,
+    "dc_prefix_close_tag": utils.dc_prefix_close_tag, "xml_prolog": utils.xml_prolog
+    }
+dc_message = "Namespace prefix dc on title is not defined, line 1, column 20"
+
+
+# Write records to a 'cleaned' folder (and make the 'corrected' folder for the corrected
+# versions), and return their paths
+def writeRecords(tmp_path, records):
+    (tmp_path / "cleaned").mkdir()
+    (tmp_path / "corrected").mkdir()
+    file_paths = []
+    for name, text in records.items():
+        file_path = str(tmp_path / "cleaned" / name)
+        with open(file_path, "w") as f:
+            f.write(text)
+        file_paths.append(file_path)
+    return file_paths
+
+
+
+############################################################
+########################## TESTS ###########################
+############################################################
+
+
+
+def test_repair_json():
+    cases = [
+        ('{"a": ""b"", "c": 1}', {"a": "b", "c": 1}, ["doubled_quotes"]),
+        ('{"a": 1, // a note\n "b": 2}', {"a": 1, "b": 2}, ["comment"]),
+        ('{"a": {"b": 1}', {"a": {"b": 1}}, ["missing_close"]),
+        ('{"a": 1}}', {"a": 1}, ["extra_close"]),
+        ('{"a": 1}', {"a": 1}, []),
+        ]
+    for text, data, repairs in cases:
+        repaired, found = utils.repairJSON(text)
+        assert json.loads(repaired) == data
+        assert [repair["repair"] for repair in found] == repairs
+    repaired, found = utils.repairJSON('{"a": 1, // a note\n "b": 2}')
+    assert found[0]["line"] == 1 and "a note" in found[0]["text"]
+
+
+def test_repair_xml_wraps_root():
+    repaired, fired = utils.repairXML(
+        '<record><dc:title>T</dc:title><dcterms:created>1900</dcterms:created></record>', dc_message, settings
+        )
+    assert fired == ["wrap_rdf_root", "add_prolog"]
+    assert repaired.startswith(utils.xml_prolog + "\n" + utils.dc_prefix_open_tag_qual)
+    assert repaired.endswith(utils.dc_prefix_close_tag)
+    ET.fromstring(repaired)
+
+
+def test_repair_xml_description():
+    message = dc_message + "\nNamespace prefix rdf for about on Description is not defined"
+    repaired, fired = utils.repairXML(
+        '<record><rdf:Description rdf:about=""x""><dc:title>T</dc:title></rdf:Description></record>', message, settings
+        )
+    assert fired == ["dedupe_quotes", "wrap_rdf_root", "fix_rdf_description", "add_prolog"]
+    assert '<rdf:Description rdf:about="http://www.w3.org/TR/rdf-syntax-grammar">' in repaired
+    ET.fromstring(repaired)
+
+
+def test_repair_xml_only_fixers_given():
+    fixers = utils.registerFixer("add_prolog", lambda message: True, utils.addProlog, fixers=utils.OrderedDict())
+    repaired, fired = utils.repairXML('<record><dc:title>T</dc:title></record>', dc_message, settings, fixers)
+    assert fired == ["add_prolog"]
+    assert repaired == utils.xml_prolog + "\n<record><dc:title>T</dc:title></record>"
+
+
+def test_correct_xml_outputs(tmp_path):
+    txt_files = writeRecords(tmp_path, {
+        "fixed.txt": '<record><dc:title>T</dc:title></record>',
+        "broken.txt": '<record><dc:title>T</dc:title>',
+        })
+    messages = [dc_message, "Opening and ending tag mismatch"]
+    still_incorrect = utils.correctXML(txt_files, messages)
+    assert isinstance(still_incorrect, list)
+    assert [error["file"] for error in still_incorrect] == [txt_files[1]]
+    with open(str(tmp_path / "corrected" / "fixed.xml")) as f:
+        ET.fromstring(f.read())
+
+    still_incorrect, fixes = utils.correctXML(txt_files, messages, include_prolog=True, report=True)
+    assert [error["file"] for error in still_incorrect] == [txt_files[1]]
+    assert isinstance(fixes, pd.DataFrame)
+    assert list(fixes.columns) == ["file_path", "fixers", "corrected"]
+    assert list(fixes.corrected) == [True, False]
+    assert fixes.fixers[0] == ["wrap_rdf_root", "add_prolog"]
+
+
+def test_correct_json_outputs(tmp_path):
+    txt_files = writeRecords(tmp_path, {
+        "fixed.txt": '{"name": ""T"", // a note\n "date": "1900"',
+        "broken.txt": '{"name": "T" "date": "1900"}',
+        })
+    outputs = utils.correctJSON(txt_files)
+    assert len(outputs) == 3
+    still_incorrect, comments_found, new_syntax_errors = outputs
+    assert still_incorrect == [txt_files[1]]
+    assert comments_found == [{"errored_file": txt_files[0], "comment": ["// a note"]}]
+    assert [error["file"] for error in new_syntax_errors] == [txt_files[1].replace(".txt", ".json")]
+    with open(str(tmp_path / "corrected" / "fixed.json")) as f:
+        assert json.load(f) == {"name": "T", "date": "1900"}
+
+    outputs = utils.correctJSON(txt_files, report=True)
+    assert len(outputs) == 4
+    assert outputs[:3] == (still_incorrect, comments_found, new_syntax_errors)
+    repairs = outputs[3]
+    assert list(repairs.columns) == ["file_path", "position", "line", "repair", "text"]
+    assert list(repairs.loc[repairs.file_path == txt_files[0], "repair"]) == ["doubled_quotes", "comment", "missing_close"]
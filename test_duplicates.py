@@ -0,0 +1,75 @@
+'''
+Check which records `utils.nearDuplicateClusters` groups together, with signatures made up
+so that which bands records share is known:
+    python -m pytest test_duplicates.py
+'''
+import numpy as np
+import pandas as pd
+import utils
+
+
+rng = np.random.default_rng(0)
+bands, rows = utils.lshParameters(0.8, utils.minhash_permutations)
+
+
+def randomSignature():
+    return rng.integers(0, 2**32, utils.minhash_permutations, dtype=np.uint32)
+
+
+# A DataFrame of signatures like `minhashSignatures` outputs, one record per signature
+def signatureTable(signatures, standards=None, shingle_counts=None):
+    n = len(signatures)
+    return pd.DataFrame({
+        "file_path": ["record_%d.xml" % i for i in range(n)],
+        "standard": standards or ["dublin_core"] * n,
+        "dataset": ["dataset"] * n,
+        "shingle_count": shingle_counts or [10] * n,
+        "signature": list(signatures),
+        })
+
+
+
+############################################################
+########################## TESTS ###########################
+############################################################
+
+
+
+def test_all_pairs_in_bucket():
+    # b and c are the same except for one value in every band but the first, so they only
+    # share a bucket in the first band (with a, which comes before them and isn't similar to
+    # either), but they're still more than 80% similar
+    b = randomSignature()
+    c = b.copy()
+    for band in range(1, bands):
+        c[band*rows] += 1
+    a = randomSignature()
+    a[:rows] = b[:rows]
+    assert (b == c).mean() >= 0.8 and (a == b).mean() < 0.8
+    clusters = utils.nearDuplicateClusters(signatureTable([a, b, c]))
+    assert list(clusters.cluster_size) == [1, 2, 2]
+    assert clusters.cluster[1] == clusters.cluster[2]
+    assert list(clusters.first_record) == ["record_0.xml", "record_1.xml", "record_1.xml"]
+    assert clusters.similarity[2] == (b == c).mean()
+
+
+def test_large_bucket():
+    # More records than `max_bucket_size` share every bucket; they're still all joined
+    signature = randomSignature()
+    signatures = [signature] * 10 + [randomSignature()]
+    clusters = utils.nearDuplicateClusters(signatureTable(signatures), max_bucket_size=3)
+    assert list(clusters.cluster_size) == [10] * 10 + [1]
+    assert (clusters.first_record[:10] == "record_0.xml").all()
+
+
+def test_groups_and_empty_records():
+    signature = randomSignature()
+    standards = ["dublin_core", "schema_org", "dublin_core", "dublin_core"]
+    table = signatureTable([signature] * 4, standards=standards, shingle_counts=[10, 10, 10, 0])
+    clusters = utils.nearDuplicateClusters(table)
+    # Records of different standards aren't compared, and records without shingles aren't
+    # compared at all
+    assert list(clusters.cluster_size) == [2, 1, 2, 1]
+    assert np.isnan(clusters.similarity[3])
+    clusters = utils.nearDuplicateClusters(table, by=())
+    assert list(clusters.cluster_size) == [3, 3, 3, 1]
@@ -0,0 +1,92 @@
+'''
+Check that `utils.runIncremental` only checks the files that have changed since the last
+run, and that its results stay in the order of the files it's given:
+    python -m pytest test_incremental.py
+'''
+import functools, os
+import utils
+
+
+# Write a Dublin Core record, with or without a prolog, and return its path
+def writeRecord(folder, name, prolog=True):
+    file_path = os.path.join(str(folder), name)
+    with open(file_path, "w") as f:
+        f.write(
+            (utils.xml_prolog + "\n" if prolog else "") +
+            '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" xmlns:dc="http://purl.org/dc/elements/1.1/">'
+            '<rdf:Description rdf:about="' + name + '"><dc:title>' + name + '</dc:title></rdf:Description></rdf:RDF>\n'
+            )
+    return file_path
+
+
+# Wrap `utils.scanRecords` to save the files it's run on in `checked`
+def spyScan(checked):
+    @functools.wraps(utils.scanRecords)
+    def scanRecords(file_paths, **kwargs):
+        checked.extend(file_paths)
+        return utils.scanRecords(file_paths, **kwargs)
+    return scanRecords
+
+
+
+############################################################
+########################## TESTS ###########################
+############################################################
+
+
+
+def test_only_edited_file_checked(tmp_path):
+    file_paths = [writeRecord(tmp_path, "record_%d.xml" % i) for i in range(5)]
+    manifest = utils.Manifest(str(tmp_path / "manifest"))
+    checked = []
+    results = utils.runIncremental(spyScan(checked), file_paths, check="scan", manifest=manifest)
+    assert checked == file_paths
+    assert results.has_prolog.all()
+
+    writeRecord(tmp_path, "record_2.xml", prolog=False)
+    checked.clear()
+    results = utils.runIncremental(spyScan(checked), file_paths, check="scan", manifest=manifest)
+    assert checked == [file_paths[2]]
+    assert list(results.file_path) == file_paths
+    assert list(results.has_prolog) == [True, True, False, True, True]
+
+    # Nothing changed, so nothing is checked, and the saved results follow the order given
+    checked.clear()
+    reordered = file_paths[::-1]
+    results = utils.runIncremental(spyScan(checked), reordered, check="scan", manifest=manifest)
+    assert checked == []
+    assert list(results.file_path) == reordered
+    assert list(results.has_prolog) == [True, True, False, True, True]
+
+
+def test_new_file_checked_in_order(tmp_path):
+    file_paths = [writeRecord(tmp_path, "record_%d.xml" % i) for i in range(3)]
+    manifest = utils.Manifest(str(tmp_path / "manifest"))
+    utils.runIncremental(utils.scanRecords, file_paths, check="scan", manifest=manifest)
+    new_file = writeRecord(tmp_path, "record_new.xml", prolog=False)
+    file_paths.insert(1, new_file)
+    checked = []
+    results = utils.runIncremental(spyScan(checked), file_paths, check="scan", manifest=manifest)
+    assert checked == [new_file]
+    assert list(results.file_path) == file_paths
+    assert list(results.has_prolog) == [True, False, True, True]
+
+
+def test_failed_file_checked_again(tmp_path):
+    file_paths = [writeRecord(tmp_path, "record_%d.xml" % i) for i in range(3)]
+    bad_file = str(tmp_path / "bad.xml")
+    with open(bad_file, "wb") as f:
+        f.write(b"\xff\xfe\x00<bad")
+    file_paths.insert(1, bad_file)
+    manifest = utils.Manifest(str(tmp_path / "manifest"))
+    results = utils.runIncremental(utils.scanRecords, file_paths, check="scan", manifest=manifest, workers=1)
+    assert list(results.file_path) == file_paths
+    assert results.exception_type[1] == str(UnicodeDecodeError)
+
+    checked = []
+    results = utils.runIncremental(spyScan(checked), file_paths, check="scan", manifest=manifest, workers=1)
+    # (The file is checked twice: once in its chunk, then again on its own after the chunk fails)
+    assert set(checked) == {bad_file}
+    assert list(results.file_path) == file_paths
+    assert results.exception_type[1] == str(UnicodeDecodeError)
+    assert results.exception_type.drop(1).isna().all()
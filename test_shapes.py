@@ -0,0 +1,75 @@
+'''
+Check the violations `utils.evaluateShapes` finds in Dublin Core records for the rules in
+`utils.shape_rules` and for rules added with `utils.registerShapeRule`:
+    python -m pytest test_shapes.py
+'''
+import os
+from collections import OrderedDict
+import pandas as pd
+import utils
+
+
+complete = (
+    "<dc:title>Title</dc:title><dc:creator>Someone</dc:creator><dc:date>1900-01-01</dc:date>"
+    "<dc:description>A record</dc:description><dc:subject>Fairs</dc:subject><dc:language>en</dc:language>"
+    )
+
+
+# Write Dublin Core records with the given fields to a folder and load their triples (with
+# a missing file's path at the end)
+def loadRecords(folder, records):
+    file_paths = []
+    for i, fields in enumerate(records):
+        file_path = os.path.join(str(folder), "record_%d.xml" % i)
+        with open(file_path, "w") as f:
+            f.write(
+                utils.xml_prolog + "\n" + utils.dc_prefix_open_tag_simple +
+                '<rdf:Description rdf:about="record-%d">' % i + fields + "</rdf:Description>" + utils.dc_prefix_close_tag
+                )
+        file_paths.append(file_path)
+    file_paths.append(os.path.join(str(folder), "missing.xml"))
+    return utils.loadTriples(file_paths, standard="dublin_core")
+
+
+# The violations as (record, rule, constraint, value) tuples, by record
+def found(violations):
+    return sorted(
+        (record, rule, constraint, None if pd.isna(value) else value)
+        for record, rule, constraint, value in zip(violations.record, violations.rule, violations.constraint, violations.value)
+        )
+
+
+
+############################################################
+########################## TESTS ###########################
+############################################################
+
+
+
+def test_default_rules(tmp_path):
+    incomplete = complete.replace("Someone", "unknown").replace("1900-01-01", "last year").replace(">en<", ">english!!<")
+    store = loadRecords(tmp_path, [complete, incomplete, complete.replace("<dc:subject>Fairs</dc:subject>", "")])
+    violations = utils.evaluateShapes(store)
+    assert found(violations) == [
+        (1, "creator", "minCount", None),
+        (1, "date_format", "pattern", "last year"),
+        (1, "language_code", "pattern", "english!!"),
+        (2, "subject", "minCount", None),
+        ]
+    assert list(violations.category[violations.rule == "creator"]) == ["completeness"]
+    assert list(violations.category[violations.rule == "date_format"]) == ["conformance"]
+    # The missing record couldn't be loaded, so it isn't checked
+    assert not (violations.record == 3).any()
+
+
+def test_registered_rules(tmp_path):
+    store = loadRecords(tmp_path, [complete, complete + "<dc:title>Another title</dc:title>"])
+    rules = utils.registerShapeRule("one_title", "dc:title", max_count=1, rules=OrderedDict())
+    utils.registerShapeRule("year", "dc:date", pattern="^\\d{4}$", rules=rules)
+    assert list(rules) == ["one_title", "year"]
+    violations = utils.evaluateShapes(store, rules)
+    assert found(violations) == [
+        (0, "year", "pattern", "1900-01-01"),
+        (1, "one_title", "maxCount", None),
+        (1, "year", "pattern", "1900-01-01"),
+        ]
@@ -0,0 +1,210 @@
+'''
+Check `utils.checkURL` and `utils.checkURLs` against a local HTTP server (see `Handler`), so
+no requests leave the machine:
+    python test_urls.py
+    python -m pytest test_urls.py
+'''
+import os, socket, struct, tempfile, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import utils
+
+
+'''
+Request handler for the local server.  The path picks the response:
+    /ok             200
+    /missing        404
+    /redirect       301 to /ok, through /redirect-2
+    /loop           302 to itself
+    /no-head        405 for HEAD requests, 200 for GET requests
+    /reset-head     resets the connection for HEAD requests, 200 for GET requests
+    /slow           200 after `slow_seconds`, counting how many requests are handled at once
+    /counted        200, counting how many requests are made for it
+'''
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep connections open, like most hosts do
+    slow_seconds = 0.2
+    lock = threading.Lock()
+    active, max_active = 0, 0
+    counted = 0
+
+    def respond(self, status, headers={}, body=b"ok"):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command == "GET":
+            self.wfile.write(body)
+
+    def reset(self):
+        # Close the socket straight away with a TCP reset instead of a response
+        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+        self.close_connection = True
+
+    def slow(self):
+        with Handler.lock:
+            Handler.active += 1
+            Handler.max_active = max(Handler.max_active, Handler.active)
+        time.sleep(self.slow_seconds)
+        with Handler.lock:
+            Handler.active -= 1
+        self.respond(200)
+
+    def route(self):
+        path = self.path.split("?")[0]
+        if path == "/ok":
+            self.respond(200)
+        elif path == "/redirect":
+            self.respond(301, {"Location": "/redirect-2"})
+        elif path == "/redirect-2":
+            self.respond(302, {"Location": "/ok"})
+        elif path == "/loop":
+            self.respond(302, {"Location": "/loop"})
+        elif path == "/no-head":
+            self.respond(405 if self.command == "HEAD" else 200)
+        elif path == "/reset-head":
+            if self.command == "HEAD":
+                self.reset()
+            else:
+                self.respond(200)
+        elif path == "/slow":
+            self.slow()
+        elif path == "/counted":
+            with Handler.lock:
+                Handler.counted += 1
+            self.respond(200)
+        else:
+            self.respond(404, body=b"not found")
+
+    do_HEAD = route
+    do_GET = route
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Start the local server on a free port, in a background thread
+def startServer():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:%d" % server.server_address[1]
+
+
+server, base_url = startServer()
+
+
+def check(path):
+    pool = utils.HostConnectionPool(timeout=5)
+    try:
+        return utils.checkURL(base_url + path, pool)
+    finally:
+        pool.close()
+
+
+
+############################################################
+########################## TESTS ###########################
+############################################################
+
+
+
+def test_ok():
+    assert check("/ok") == ("No error", 200, base_url + "/ok")
+
+
+def test_missing():
+    request_error, status, final_url = check("/missing")
+    assert request_error == "HTTP Error 404: Not Found"
+    assert status == 404
+
+
+def test_redirects():
+    assert check("/redirect") == ("No error", 200, base_url + "/ok")
+
+
+def test_redirect_loop():
+    request_error, status, final_url = check("/loop")
+    assert request_error.startswith("HTTP Error 302: The HTTP server returned a redirect error that would lead to an infinite loop.")
+    assert status == 302
+
+
+def test_head_not_allowed():
+    assert check("/no-head") == ("No error", 200, base_url + "/no-head")
+
+
+def test_head_connection_reset():
+    assert check("/reset-head") == ("No error", 200, base_url + "/reset-head")
+
+
+def test_whitespace():
+    assert check("/ok \n")[0] == "No error"
+
+
+def test_no_server():
+    # Find a port nothing is listening on
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    pool = utils.HostConnectionPool(timeout=5)
+    request_error, status, final_url = utils.checkURL("http://127.0.0.1:%d/" % port, pool)
+    assert request_error.startswith("<urlopen error")
+    assert status is None
+
+
+def test_check_urls():
+    urls = [base_url + "/ok", None, float("nan"), base_url + "/missing", base_url + "/ok"]
+    request_errors = utils.checkURLs(urls)
+    assert request_errors[0] == "No error"
+    assert request_errors[1] == "Invalid format (no request made)"
+    assert "strip" in request_errors[2]  # Not a string, reported like any other error
+    assert request_errors[3] == "HTTP Error 404: Not Found"
+    assert request_errors[4] == "No error"
+
+
+def test_max_per_host():
+    Handler.max_active = 0
+    urls = [base_url + "/slow?" + str(i) for i in range(12)]
+    start = time.time()
+    request_errors = utils.checkURLs(urls, max_workers=12, max_per_host=3)
+    assert request_errors == ["No error"] * len(urls)
+    assert Handler.max_active == 3
+    # With 3 requests at a time, the 12 requests take at least 4 rounds
+    assert time.time() - start >= len(urls) / 3 * Handler.slow_seconds * 0.9
+
+
+def test_cache_expiry():
+    url = base_url + "/counted"
+    Handler.counted = 0
+    with tempfile.TemporaryDirectory() as folder:
+        cache = utils.URLCache(os.path.join(folder, "url_cache.sqlite"), ttl=60)
+        try:
+            assert utils.checkURLs([url], cache=cache) == ["No error"]
+            assert utils.checkURLs([url], cache=cache) == ["No error"]
+            assert Handler.counted == 1
+            # Make the saved result older than the cache's time to live
+            cache.db.execute("UPDATE url_checks SET checked_at = checked_at - 120")
+            cache.db.commit()
+            assert cache.get(url) is None
+            assert utils.checkURLs([url], cache=cache) == ["No error"]
+            assert Handler.counted == 2
+            # Offline, the old result is still used
+            assert utils.checkURLs([url], cache=cache, offline=True) == ["No error"]
+            assert Handler.counted == 2
+        finally:
+            cache.close()
+
+
+
+if __name__ == "__main__":
+    tests = [(name, test) for name, test in list(globals().items()) if name.startswith("test_")]
+    failed = 0
+    for name, test in tests:
+        try:
+            test()
+            print("passed", name)
+        except Exception as e:
+            failed += 1
+            print("FAILED", name, repr(e))
+    print(len(tests) - failed, "of", len(tests), "passed")
+    raise SystemExit(1 if failed else 0)
@@ -1,6 +1,12 @@
-import os, re, json
+import os, re, sys, json, copy, copyreg, contextlib, functools, hashlib, heapq, io, mmap, pickle, tempfile, zlib
+import http.client, sqlite3, ssl, threading, time, urllib.error, urllib.parse
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pyld import jsonld
 import xml.etree.ElementTree as ET
+from lxml import etree
+import numpy as np
 import pandas as pd
 
 dc_namespace = 'xmlns:dc="http://purl.org/dc/elements/1.1/"'
@@ -9,6 +15,235 @@ rdf_namespace = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
 dc_prefix_open_tag_qual = '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:dcterms="http://purl.org/dc/terms/">'
 dc_prefix_open_tag_simple = '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" xmlns:dc="http://purl.org/dc/elements/1.1/">'
 dc_prefix_close_tag = '</rdf:RDF>'
+contexts_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "contexts")
+# Local snapshots of the JSON-LD contexts used by the metadata records, by context URL
+# (without "http(s)://" or a trailing slash, in lowercase)
+bundled_contexts = {
+    "schema.org": "schema_org.jsonld",
+    "www.schema.org": "schema_org.jsonld",
+    "schema.org/docs/jsonldcontext.json": "schema_org.jsonld",
+    "schema.org/docs/jsonldcontext.jsonld": "schema_org.jsonld",
+    "www.cidoc-crm.org/cidoc-crm": "cidoc_crm.jsonld",
+    "cidoc-crm.org/cidoc-crm": "cidoc_crm.jsonld",
+    "cidoc-crm.org/rdfs/7.1.3/cidoc_crm_v7.1.3_json-ld_context.jsonld": "cidoc_crm.jsonld",
+    "www.cidoc-crm.org/rdfs/7.1.3/cidoc_crm_v7.1.3_json-ld_context.jsonld": "cidoc_crm.jsonld",
+}
+# Patterns for finding empty fields, Dublin Core tags, and RDF tags in Dublin Core records
+dc_empty_pattern = re.compile('(<[a-z]+:[a-z]+>|<[a-z=" ]+>)((unknown|none|na|""|\\?|not specified|\\n|)|[^<>]+(not specified|unknown))(</[a-z]+:[a-z]+>|</[a-z]+>)')
+dc_simple_tag = re.compile('<dc:[a-z]+>')
+dc_qual_tag = re.compile('<dcterms:[a-z]+>')
+rdf_tags = re.compile('<\\/?rdf:RDF\\s*[^>]*>')
+rdf_desc_tags = re.compile('<\\/?rdf:Description\\s*[^>]*>')
+prolog = '<?xml version="1.0"'
+# Patterns for finding empty fields and checking the JSON-LD context in Schema.org and CIDOC-CRM records
+json_empty_pattern = re.compile('("[^"]+":\\s?)(("(unknown|none|na|\\?|not specified)")|"")')
+schema_context_pattern = re.compile('"@context":\\s*\\{\\s*"@vocab":\\s*"https?://schema.org/"\\s*\\}')
+schema_context_url_pattern = re.compile("https?://schema.org/?")
+cidoc_context_pattern = re.compile('"@context":\\s*\\{\\s*"@vocab":\\s*"https?://www.cidoc-crm.org/cidoc-crm/"\\s*\\}')
+cidoc_context_url_pattern = re.compile("https?://www.cidoc-crm.org/cidoc-crm/?")
+request_headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
+
+
+
+############################################################
+####################### TRACING RUNS #######################
+############################################################
+
+
+
+# The upper edges (in seconds) of the buckets of the latency histograms in a trace; the
+# last bucket holds everything slower than the last edge
+trace_buckets = [0.0001, 0.0003, 0.001, 0.003, 0.01, 0.03, 0.1, 0.3, 1, 3, 10]
+# The trace being recorded (see `startTrace`), or None when tracing is off
+tracer = None
+
+
+'''
+A record of where the time goes while the evaluation functions run: how long each stage
+took (each call to a traced function, or a block of code in `traceStage`), how long each
+operation on each file took (reading, parsing, expanding, repairing, requesting, ...) and
+how many bytes it read, cache hits and misses, and the slowest `slowest` file operations.
+Stages are named by the stages they ran in as well (e.g., "dublin_core_scan/scanRecords"),
+and operations are grouped by the stage running when they happened.  Only what runs
+in this process is recorded (not the worker processes of `runBatch`).
+'''
+class Trace:
+    def __init__(self, slowest=20):
+        self.slowest_n = slowest
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.stages, self.stage_stack = [], []
+        self.latencies, self.bytes = OrderedDict(), {}
+        self.counters = OrderedDict()
+        self.slowest = []  # A heap of (seconds, number, operation) of the slowest operations
+        self.n_recorded = 0
+
+    # The stages running now, outermost first (e.g., "schema_org_context_inclusion/contextInclusion")
+    def currentStage(self):
+        return "/".join(self.stage_stack)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        entry = {"stage": "/".join(self.stage_stack + [name]), "started": time.time() - self.started}
+        start = time.perf_counter()
+        self.stage_stack.append(name)
+        try:
+            yield entry
+        finally:
+            self.stage_stack.pop()
+            entry["seconds"] = time.perf_counter() - start
+            self.stages.append(entry)
+
+    def record(self, op, seconds, file_path=None, nbytes=0):
+        key = (self.currentStage(), op)
+        with self.lock:
+            if not key in self.latencies:
+                self.latencies[key], self.bytes[key] = array("d"), 0
+            self.latencies[key].append(seconds)
+            self.bytes[key] += nbytes
+            if file_path is not None and self.slowest_n > 0:
+                self.n_recorded += 1
+                if len(self.slowest) < self.slowest_n or seconds > self.slowest[0][0]:
+                    slow = {"stage": key[0], "op": op, "file_path": str(file_path), "seconds": seconds, "bytes": nbytes}
+                    item = (seconds, self.n_recorded, slow)
+                    if len(self.slowest) < self.slowest_n:
+                        heapq.heappush(self.slowest, item)
+                    else:
+                        heapq.heapreplace(self.slowest, item)
+
+    def count(self, counter, n=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    # The trace as a dictionary (as saved by `export`)
+    def toDict(self):
+        operations = []
+        for (stage, op), latencies in self.latencies.items():
+            seconds = np.frombuffer(latencies, dtype=np.float64) if len(latencies) > 0 else np.zeros(1)
+            p50, p90, p99 = np.percentile(seconds, [50, 90, 99])
+            operations.append({
+                "stage": stage, "op": op, "count": len(latencies), "seconds": float(seconds.sum()), "bytes": self.bytes[(stage, op)],
+                "p50_ms": p50 * 1000, "p90_ms": p90 * 1000, "p99_ms": p99 * 1000, "max_ms": float(seconds.max()) * 1000,
+                "histogram": {"buckets": trace_buckets, "counts": np.bincount(np.searchsorted(trace_buckets, seconds), minlength=len(trace_buckets)+1).tolist()}
+                })
+        return {
+            "started": self.started, "seconds": time.time() - self.started,
+            "stages": list(self.stages), "operations": operations, "counters": dict(self.counters),
+            "slowest": [slow for seconds, n, slow in sorted(self.slowest, key=lambda item: -item[0])]
+            }
+
+    # Save the trace as a JSON file
+    def export(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.toDict(), f, indent=1)
+
+    def summary(self):
+        return traceSummary(self.toDict())
+
+    def slowestFiles(self):
+        return pd.DataFrame(self.toDict()["slowest"], columns=["stage", "op", "file_path", "seconds", "bytes"])
+
+
+'''
+Turn a trace (from `Trace.toDict`, or a JSON file saved by `Trace.export`) into a summary
+table with one row per operation per stage: how many times it ran, the total time and
+bytes read, the throughput, and the median, 90th and 99th percentile and slowest latency.
+'''
+def traceSummary(trace):
+    if isinstance(trace, str):
+        with open(trace) as f:
+            trace = json.load(f)
+    columns = ["stage", "op", "count", "seconds", "bytes", "p50_ms", "p90_ms", "p99_ms", "max_ms"]
+    df = pd.DataFrame([{col: operation[col] for col in columns} for operation in trace["operations"]], columns=columns)
+    df["mb_per_second"] = [b / s / 2**20 if s > 0 and b > 0 else None for b, s in zip(df["bytes"], df["seconds"])]
+    return df.sort_values("seconds", ascending=False).reset_index(drop=True)
+
+
+'''
+Start recording a trace (see `Trace`) of every traced function and operation from now on,
+and return it.  Tracing is off by default, and costs almost nothing while it's off.
+'''
+def startTrace(slowest=20):
+    global tracer
+    tracer = Trace(slowest=slowest)
+    return tracer
+
+
+# Stop recording and return the trace (or None if tracing was off)
+def stopTrace():
+    global tracer
+    trace, tracer = tracer, None
+    return trace
+
+
+# Time a block of code as a stage of the trace, e.g., `with utils.traceStage("syntax"):`
+def traceStage(name):
+    if tracer is None:
+        return contextlib.nullcontext()
+    return tracer.stage(name)
+
+
+def traceCount(counter, n=1):
+    if tracer is not None:
+        tracer.count(counter, n)
+
+
+'''
+Times one operation on one file for the trace.  The bytes the operation read are taken
+from the position in `f` (an open file) at the end, if given, or can be set as `nbytes`.
+'''
+class TraceOp:
+    __slots__ = ("trace", "op", "file_path", "f", "nbytes", "start")
+
+    def __init__(self, trace, op, file_path=None, f=None):
+        self.trace, self.op, self.file_path, self.f, self.nbytes = trace, op, file_path, f, 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        if self.f is not None and not self.f.closed:
+            self.nbytes = self.f.tell()
+        self.trace.record(self.op, seconds, self.file_path, self.nbytes)
+        return False
+
+
+no_trace = contextlib.nullcontext()
+
+
+# Time an operation on a file, e.g., `with traceOp("parse_xml", file_path, f):`
+def traceOp(op, file_path=None, f=None):
+    if tracer is None:
+        return no_trace
+    return TraceOp(tracer, op, file_path, f)
+
+
+# Read an open record, recording the time it took and the bytes read if tracing is on
+def traceRead(f, file_path=None):
+    if tracer is None:
+        return f.read()
+    with TraceOp(tracer, "read", file_path) as op:
+        data = f.read()
+        op.nbytes = len(data)
+    return data
+
+
+'''
+Decorator that records each call to a function as a stage of the trace (named after the
+function), if tracing is on.
+'''
+def traced(function):
+    @functools.wraps(function)
+    def run(*args, **kwargs):
+        if tracer is None:
+            return function(*args, **kwargs)
+        with tracer.stage(function.__name__):
+            return function(*args, **kwargs)
+    return run
 
 
 
@@ -18,6 +253,43 @@ dc_prefix_close_tag = '</rdf:RDF>'
 
 
 
+'''
+Pad a record ID with leading zeros (to at least three digits) and return the file name for
+the record.
+'''
+def recordFileName(record_id, file_prefix, file_suffix):
+    id = str(int(record_id))
+    if len(id) == 1:
+        file_id = "00" + id
+    elif len(id) == 2:
+        file_id = "0" + id
+    else:
+        file_id = id
+    return file_prefix + file_id + file_suffix
+
+
+'''
+Remove extraneous text from a record so only data between tags (< >) remains, returning
+None if there isn't any.
+'''
+def extractXML(record):
+    xml_data = re.findall(r"<.+>", record)
+    if len(xml_data) > 0:
+        return "".join([line + "\n" for line in xml_data])
+    return None
+
+
+'''
+Remove extraneous text from a record so only data between curly braces ({ }) remains,
+returning None if there isn't any.
+'''
+def extractJSON(record):
+    json_data = re.findall(r"\{[\W\w]*\}", record)
+    if len(json_data) > 0:
+        return "".join([line + "\n" for line in json_data])
+    return None
+
+
 '''
 Write XML records to a directory as files in the format specified by `file_suffix`
 (the XML may be malformed, in which case corrections will need to be made by
@@ -26,35 +298,16 @@ reading the data from a TXT and then re-writing it as XML).
 def write_xml(records_ids_list, records_list, dir, file_prefix, file_suffix):
     i, maxI = 0, len(records_ids_list)
     while i < maxI:
-        id = str(int(records_ids_list[i]))
-        record = records_list[i]
-        
-        '''
-        Remove extraneous text so only data between tags (< >) remains
-        '''
-        xml_data = re.findall(r"<.+>", record)
+        xml_data = extractXML(records_list[i])
 
         '''
-        If xml_data isn't an empty list, define the file name, 
-        padding the ID with leading zeros, and write the data
-        to an XML file
+        If there is XML data, define the file name, padding the ID with leading zeros, 
+        and write the data to an XML file
         '''
-        if len(xml_data) > 0:
-            # file_suffix = ".xml"
-            if len(id) == 1:
-                file_id = "00" + id
-            elif len(id) == 2:
-                file_id = "0" + id
-            else:
-                file_id = id
-            filename = file_prefix + file_id + file_suffix
-            filepath = dir+filename
-
-            with open(filepath, "w") as file:
-                for line in xml_data:
-                    file.write(line)
-                    file.write("\n")
-            file.close()
+        if xml_data is not None:
+            filename = recordFileName(records_ids_list[i], file_prefix, file_suffix)
+            with open(dir+filename, "w") as file:
+                file.write(xml_data)
             print("Wrote", filename+"!")
 
         i += 1
@@ -68,40 +321,696 @@ reading the data from a TXT and then re-writing it as JSON).
 def write_json(records_ids_list, records_list, dir, file_prefix, file_suffix):
     i, maxI = 0, len(records_ids_list)
     while i < maxI:
-        id = str(int(records_ids_list[i]))
-        record = records_list[i]
-        
-        '''
-        Remove extraneous text so only data between curly braces ({ }) remains
-        '''
-        json_data = re.findall(r"\{[\W\w]*\}", record)
+        json_data = extractJSON(records_list[i])
 
         '''
-        If json_data isn't an empty list, define the file name, 
-        padding the ID with leading zeros, and write the data
-        to a JSON file
+        If there is JSON data, define the file name, padding the ID with leading zeros, 
+        and write the data to a JSON file
         '''
-        if len(json_data) > 0:
-            # file_suffix = ".json"
-            if len(id) == 1:
-                file_id = "00" + id
-            elif len(id) == 2:
-                file_id = "0" + id
-            else:
-                file_id = id
-            filename = file_prefix + file_id + file_suffix
-            filepath = dir+filename
-
-            with open(filepath, "w") as file:
-                for line in json_data:
-                    file.write(line)
-                    file.write("\n")
-            file.close()
+        if json_data is not None:
+            filename = recordFileName(records_ids_list[i], file_prefix, file_suffix)
+            with open(dir+filename, "w") as file:
+                file.write(json_data)
             print("Wrote", filename+"!")
 
         i += 1
 
 
+# The columns of the outcomes spreadsheet with metadata records, the names data-prep.ipynb
+# gives them, and where and how each column's records are written as files
+record_columns = {
+    "Metadata record": {"column": "dc_record", "dir": "dublin_core/", "prefix": "dc_record_", "suffixes": [".xml", ".txt"], "extract": extractXML},
+    "Schema.org Record": {"column": "sdo_record", "dir": "schema_org/", "prefix": "sdo_record_", "suffixes": [".json", ".txt"], "extract": extractJSON},
+    "CIDOC-CRM Record": {"column": "cidoccrm_record", "dir": "cidoc_crm/", "prefix": "cidoccrm_record_", "suffixes": [".json", ".txt"], "extract": extractJSON},
+}
+
+
+'''
+Find the column of unique identifiers in a CSV file (a column named "id" or "identifier", or
+with "_id" in its name, whose values are all different), reading the file `chunk_size` rows
+at a time.  Also find which columns aren't empty.  Only rows with a value in
+`required_column` are considered.  Returns the name of the identifier column ("" if there
+isn't one) and a list of the non-empty columns.
+'''
+def scanCSV(csv_path, chunk_size=1000, required_column="Metadata record"):
+    id_candidates, seen_ids, unique, non_empty = [], {}, {}, None
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+        if non_empty is None:
+            non_empty = {col: False for col in chunk.columns}
+            id_candidates = [col for col in chunk.columns if (col.lower() == "id") or (col.lower() == "identifier") or ("_id" in col.lower())]
+            seen_ids = {col: set() for col in id_candidates}
+            unique = {col: True for col in id_candidates}
+        for col, has_values in chunk.notna().any().items():
+            non_empty[col] = non_empty[col] or bool(has_values)
+        chunk = chunk.dropna(subset=[required_column])
+        for col in id_candidates:
+            if unique[col]:
+                values = list(chunk[col])
+                unique[col] = (len(values) == len(set(values))) and seen_ids[col].isdisjoint(values)
+                seen_ids[col].update(values)
+    identifier_col = ""
+    for col in id_candidates:
+        if unique[col]:
+            identifier_col = col
+    return identifier_col, [col for col, has_values in (non_empty or {}).items() if has_values]
+
+
+'''
+Streaming version of data-prep.ipynb for CSV files of any size: read the CSV file
+`chunk_size` rows at a time, save the cleaned rows to `data_dir + "cleaned/" + f`, and write
+each record (see `record_columns`) as a file per suffix, extracting the data from each
+record only once.  Only the clean-up and writing happen per chunk, so memory use doesn't
+grow with the number of rows.  If `store` (a `RecordStore`) is provided, the records are
+saved to the store instead of as separate files.  Prints a summary when finished and returns the number of
+files written per metadata standard.
+'''
+@traced
+def prepareRecords(data_dir, f, chunk_size=1000, record_columns=record_columns, verbose=False, store=None):
+    csv_path = data_dir + f
+    identifier_col, columns = scanCSV(csv_path, chunk_size)
+    cleaned_dir = data_dir + "cleaned/"
+    for settings in record_columns.values():
+        os.makedirs(cleaned_dir + settings["dir"], exist_ok=True)
+
+    rename = {"Filename": "filename"}
+    rename.update({original: settings["column"] for original, settings in record_columns.items()})
+    if len(identifier_col) > 0:
+        rename[identifier_col] = "id"
+
+    files_written = {settings["dir"].rstrip("/"): 0 for settings in record_columns.values()}
+    total_rows, next_id = 0, 0
+    for i, chunk in enumerate(pd.read_csv(csv_path, chunksize=chunk_size)):
+        # Clean up the rows the same way as data-prep.ipynb
+        chunk = chunk[columns].dropna(subset=["Metadata record"])
+        if len(identifier_col) == 0:
+            chunk.insert(0, "id", list(range(next_id, next_id + chunk.shape[0])))
+            next_id += chunk.shape[0]
+        chunk = chunk.rename(columns=rename)
+        chunk.to_csv(cleaned_dir + f, mode="w" if i == 0 else "a", header=(i == 0))
+        total_rows += chunk.shape[0]
+
+        # Write each record's data once per suffix
+        for settings in record_columns.values():
+            col = settings["column"]
+            if not col in chunk.columns:
+                continue
+            records = chunk.loc[chunk[col].notna(), ["id", col]]
+            for record_id, record in zip(records["id"], records[col]):
+                data = settings["extract"](record)
+                if data is None:
+                    continue
+                for suffix in settings["suffixes"]:
+                    filename = recordFileName(record_id, settings["prefix"], suffix)
+                    if store is not None:
+                        store.add(cleaned_dir + settings["dir"] + filename, data)
+                    else:
+                        with open(cleaned_dir + settings["dir"] + filename, "w") as file:
+                            file.write(data)
+                    files_written[settings["dir"].rstrip("/")] += 1
+        if store is not None:
+            store.flush()
+        if verbose:
+            print("Processed", total_rows, "rows...")
+
+    print("Wrote", total_rows, "cleaned rows to", cleaned_dir + f, "and", sum(files_written.values()), "record files" + (" to the record store:" if store is not None else ":"),
+          ", ".join([str(count) + " in " + cleaned_dir + d + "/" for d, count in files_written.items()]))
+    return files_written
+
+
+
+############################################################
+##################### STORING RECORDS ######################
+############################################################
+
+
+
+# Work out a record's metadata standard and dataset from its path, e.g.,
+# "data/data_task1/cleaned/dublin_core/dc_record_001.txt" -> "dublin_core", "data_task1"
+def recordPathInfo(file_path):
+    parts = str(file_path).replace("\\", "/").split("/")
+    standard = parts[-2] if len(parts) > 1 else ""
+    dataset = parts[parts.index("cleaned")-1] if ("cleaned" in parts[1:]) else (parts[-3] if len(parts) > 2 else "")
+    return standard, dataset
+
+
+'''
+Packed store of record files: the text of every record is appended to a single data file
+(`path`) and an index file (`path + ".idx"`, one JSON line per record) saves where each
+record's text starts and how long it is, along with the record's metadata standard and
+dataset.  Records are saved under the path they would have as separate files (e.g.,
+"data/data_task1/cleaned/dublin_core/dc_record_001.txt"), so `records()` returns paths that
+can be used everywhere a file path can (see `openRecord`), and `export()` writes them back
+out as separate files.  Saving a record under the same path again replaces it.
+'''
+class RecordStore:
+    def __init__(self, path):
+        self.path, self.index_path = path, path + ".idx"
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.data_file = open(path, "ab")
+        self.index_file = open(self.index_path, "a")
+        self.index = {}
+        with open(self.index_path, "r") as f:
+            for line in f:
+                entry = json.loads(line)
+                self.index[entry["path"]] = entry
+        self.mm = None
+        open_stores[os.path.abspath(path)] = self
+
+    def pathInfo(self, file_path):
+        return recordPathInfo(file_path)
+
+    def add(self, file_path, text, standard=None, dataset=None):
+        path_standard, path_dataset = self.pathInfo(file_path)
+        data = text.encode("utf-8")
+        offset = self.data_file.tell()
+        self.data_file.write(data)
+        entry = {"path": file_path, "offset": offset, "length": len(data),
+                 "standard": standard or path_standard, "dataset": dataset or path_dataset}
+        self.index_file.write(json.dumps(entry) + "\n")
+        self.index[file_path] = entry
+
+    # Pack existing record files into the store
+    def addFiles(self, file_paths, standard=None, dataset=None):
+        for file_path in file_paths:
+            with open(file_path, "r") as f:
+                self.add(file_path, f.read(), standard, dataset)
+        self.flush()
+
+    def flush(self):
+        self.data_file.flush()
+        self.index_file.flush()
+
+    def read(self, file_path):
+        entry = self.index[file_path]
+        end = entry["offset"] + entry["length"]
+        if (self.mm is None) or (len(self.mm) < end):
+            self.flush()
+            if self.mm is not None:
+                self.mm.close()
+            with open(self.path, "rb") as f:
+                self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.mm[entry["offset"]:end].decode("utf-8")
+
+    '''
+    Return a sorted list of the paths of the records in the store, optionally only those
+    for a metadata standard (e.g., "dublin_core"), from a dataset (e.g., "data_task1"), or
+    with a file extension (e.g., ".txt").
+    '''
+    def records(self, standard=None, dataset=None, suffix=None):
+        paths = []
+        for file_path, entry in self.index.items():
+            if (standard is None or entry["standard"] == standard) and (dataset is None or entry["dataset"] == dataset) \
+                    and (suffix is None or file_path.endswith(suffix)):
+                paths += [StoredRecord(file_path, self)]
+        paths.sort()
+        return paths
+
+    # Write every record in the store (or only those in `file_paths`) to a separate file at
+    # its path under the `root` directory
+    def export(self, root="", file_paths=None):
+        if file_paths is None:
+            file_paths = list(self.index)
+        for file_path in file_paths:
+            out_path = os.path.join(root, file_path)
+            if os.path.dirname(out_path):
+                os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            with open(out_path, "w") as f:
+                f.write(self.read(file_path))
+        print("Exported", len(file_paths), "records.")
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        self.flush()
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        self.data_file.close()
+        self.index_file.close()
+        open_stores.pop(os.path.abspath(self.path), None)
+
+
+# Stores opened in this process, by the absolute path of their data file
+open_stores = {}
+
+
+def openStore(path):
+    store = open_stores.get(os.path.abspath(path))
+    if store is None:
+        store = RecordStore(path)
+    return store
+
+
+'''
+The path of a record in a `RecordStore`.  It works like the string of the path (so it can be
+saved in DataFrames and reports as usual), but `openRecord` reads it from the store.
+'''
+class StoredRecord(str):
+    def __new__(cls, file_path, store):
+        record = str.__new__(cls, file_path)
+        record.store = store
+        return record
+
+    # When copied to another process (see `runBatch`), re-open the store there
+    def __reduce__(self):
+        self.store.flush()
+        return (loadStoredRecord, (str(self), self.store.path))
+
+
+def loadStoredRecord(file_path, store_path):
+    return StoredRecord(file_path, openStore(store_path))
+
+
+'''
+Write the file at `path` (making its folder if needed) by calling `write` with a new
+temporary file in the same folder and then moving it into place, so other threads and
+processes reading or saving the same file never see a partly written one.
+'''
+def writeAtomically(path, write, mode="w"):
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    f = tempfile.NamedTemporaryFile(mode, dir=folder or ".", prefix=os.path.basename(path) + ".", suffix=".tmp", delete=False)
+    try:
+        with f:
+            write(f)
+        os.replace(f.name, path)
+    except Exception:
+        with contextlib.suppress(OSError):
+            os.remove(f.name)
+        raise
+
+
+'''
+Open a record for reading, whether it's a file path or a record in a `RecordStore`.
+'''
+def openRecord(file_path, mode="r"):
+    if isinstance(file_path, StoredRecord):
+        text = file_path.store.read(file_path)
+        if "b" in mode:
+            f = io.BytesIO(text.encode("utf-8"))
+        else:
+            f = io.StringIO(text)
+        f.name = str(file_path)
+        return f
+    return open(file_path, mode)
+
+
+'''
+List the record files with the file extension `extension` in each directory in `dirs`,
+reading them from `store` (a `RecordStore`) if provided.  Returns a sorted list of paths.
+'''
+def listRecordFiles(dirs, extension, store=None):
+    file_paths = []
+    if store is not None:
+        for file_path in store.records(suffix=extension):
+            if any(file_path.startswith(dir) for dir in dirs):
+                file_paths += [file_path]
+    else:
+        for dir in dirs:
+            file_paths += [dir+f for f in os.listdir(dir) if f.endswith(extension)]
+    file_paths.sort()
+    return file_paths
+
+
+
+############################################################
+################# LOADING JSON-LD CONTEXTS #################
+############################################################
+
+
+
+# A copy of an exception to raise again, so the saved exception's traceback doesn't grow every
+# time it's raised (exceptions that can't be copied are raised as a pyld loading error with
+# the same message)
+def copyError(error):
+    try:
+        return copy.copy(error)
+    except Exception:
+        return jsonld.JsonLdError(str(error), "jsonld.LoadDocumentError", code="loading document failed")
+
+
+'''
+Document loader for pyld (pass it to `jsonld.expand` as the `documentLoader` option) that
+loads remote `@context` URLs from the local snapshots in `bundled_contexts` first, then from
+an in-memory LRU of previously loaded documents, then from the optional `cache_dir` on disk,
+and only goes over the network (with pyld's default loader) if `allow_remote` is True.
+Loaded contexts are tagged as static so pyld keeps the processed version of each context in
+its own LRU and later expansions skip processing it again.
+The `stats` dictionary counts where each document came from: "hits" (from a snapshot,
+memory, or disk) and "misses" (loaded over the network or not found, where a URL that
+couldn't be loaded isn't requested again for `failure_ttl` seconds).
+'''
+class ContextLoader:
+    def __init__(self, snapshots=bundled_contexts, snapshots_dir=contexts_dir, cache_dir=None, allow_remote=True, max_size=100, failure_ttl=10*60):
+        self.snapshots, self.snapshots_dir = snapshots, snapshots_dir
+        self.cache_dir, self.allow_remote, self.max_size = cache_dir, allow_remote, max_size
+        self.failure_ttl = failure_ttl
+        self.documents = OrderedDict()
+        self.failures = {}  # Remember URLs that couldn't be loaded so they aren't tried again for every record
+        self.lock = threading.Lock()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.resetStats()
+
+    def resetStats(self):
+        self.stats = {"hits": 0, "misses": 0, "snapshot": 0, "memory": 0, "disk": 0, "remote": 0, "failed": 0}
+
+    def count(self, source):
+        self.stats[source] += 1
+        traceCount("context_loader." + source)
+        if source in ("snapshot", "memory", "disk"):
+            self.stats["hits"] += 1
+        else:
+            self.stats["misses"] += 1
+
+    def key(self, url):
+        return re.sub("^https?://", "", url.strip().lower()).split("#")[0].rstrip("/")
+
+    def diskPath(self, key):
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def remember(self, key, remote_doc):
+        with self.lock:
+            self.documents[key] = remote_doc
+            self.documents.move_to_end(key)
+            while len(self.documents) > self.max_size:
+                self.documents.popitem(last=False)
+
+    def load(self, key, url, options):
+        with self.lock:
+            if key in self.documents:
+                self.documents.move_to_end(key)
+                return self.documents[key], "memory"
+
+        if key in self.snapshots:
+            with open(os.path.join(self.snapshots_dir, self.snapshots[key]), "r") as f:
+                document = json.load(f)
+            return {"contentType": "application/ld+json", "contextUrl": None, "documentUrl": url, "document": document}, "snapshot"
+
+        if self.cache_dir is not None and os.path.exists(self.diskPath(key)):
+            with open(self.diskPath(key), "r") as f:
+                return json.load(f), "disk"
+
+        if not self.allow_remote:
+            raise jsonld.JsonLdError(
+                "No local copy of the remote document and remote loading is disabled.",
+                "jsonld.LoadDocumentError", {"url": url}, code="loading document failed"
+                )
+        remote_doc = jsonld.get_document_loader()(url, options)
+        remote_doc = {key: remote_doc.get(key) for key in ("contentType", "contextUrl", "documentUrl", "document")}
+        if self.cache_dir is not None:
+            with open(self.diskPath(key), "w") as f:
+                json.dump(remote_doc, f)
+        return remote_doc, "remote"
+
+    # Leave out the lock when copying the loader to another process (see `runBatch`)
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def __call__(self, url, options=None):
+        if options is None:
+            options = {}
+        key = self.key(url)
+        with self.lock:
+            failure = self.failures.get(key)
+            if failure is not None and time.time() - failure[1] >= self.failure_ttl:
+                # The failure may have been temporary (e.g. a network error), so try again
+                del self.failures[key]
+                failure = None
+        if failure is not None:
+            self.count("failed")
+            raise copyError(failure[0]) from failure[0]
+        try:
+            remote_doc, source = self.load(key, url, options)
+        except Exception as e:
+            with self.lock:
+                self.failures[key] = (e, time.time())
+            self.count("failed")
+            raise
+        self.count(source)
+        if source != "memory":
+            self.remember(key, remote_doc)
+        # Copy the document since pyld may modify the contexts it loads
+        remote_doc = copy.deepcopy(remote_doc)
+        remote_doc["tag"] = "static"
+        return remote_doc
+
+
+# Shared by every call to `contextInclusion` that doesn't provide its own loader
+context_loader = ContextLoader()
+
+
+
+############################################################
+################## CACHING PARSED RECORDS ##################
+############################################################
+
+
+
+'''
+Cache of parsed records shared by the checks, so that each record is parsed (or, for
+JSON-LD, expanded) at most once in a run: lxml trees ("xml"), JSON documents ("json"), and
+expanded JSON-LD documents ("jsonld"), by the SHA-256 hash of the record's contents, so a
+record checked by several checks (or records with the same contents) share one parse.
+The `max_size` most recently used documents are kept in memory.  If a `cache_dir` is given,
+expanded JSON-LD documents, which take the longest to make, are also saved there (as JSON
+files named by hash) so other processes, like the pipeline's stages, load them instead of
+expanding the records again; lxml trees and JSON documents are only kept in memory, since
+loading them from disk would take as long as parsing the record.  Records that can't be
+parsed aren't cached, so every check gets the error for its own file.
+The `stats` dictionary counts where each document came from: "hits" (from "memory" or
+"disk") and "misses" (records "parsed", or that "failed" to parse), and the number of
+documents "evicted" from memory.  The cached documents are shared, so don't modify them.
+The checks that parse records take the cache to use as their `parse_cache` argument (by
+default, the shared `default_parse_cache`, which only keeps documents in memory).
+'''
+class ParseCache:
+    disk_kinds = ("jsonld",)
+
+    def __init__(self, max_size=10000, cache_dir=None):
+        self.max_size, self.cache_dir = max_size, cache_dir
+        self.documents = OrderedDict()
+        self.lock = threading.Lock()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.resetStats()
+
+    def resetStats(self):
+        self.stats = {"hits": 0, "misses": 0, "memory": 0, "disk": 0, "parsed": 0, "failed": 0, "evicted": 0}
+
+    # Forget the documents kept in memory (those saved in `cache_dir` are kept)
+    def clear(self):
+        with self.lock:
+            self.documents.clear()
+
+    def count(self, source):
+        with self.lock:
+            self.stats[source] += 1
+            if source in ("memory", "disk"):
+                self.stats["hits"] += 1
+            elif source in ("parsed", "failed"):
+                self.stats["misses"] += 1
+        traceCount("parse_cache." + source)
+
+    def diskPath(self, kind, digest):
+        return os.path.join(self.cache_dir, kind, digest[:2], digest + ".json")
+
+    def remember(self, key, document):
+        evicted = 0
+        with self.lock:
+            self.documents[key] = document
+            self.documents.move_to_end(key)
+            while len(self.documents) > self.max_size:
+                self.documents.popitem(last=False)
+                evicted += 1
+        for i in range(evicted):
+            self.count("evicted")
+
+    '''
+    Return the parsed version (of a `kind`, e.g., "xml") of a record's contents (`data`, as
+    bytes), calling `parse(data)` only if it isn't in the cache.
+    '''
+    def get(self, kind, data, parse):
+        digest = hashlib.sha256(data).hexdigest()
+        key = (kind, digest)
+        with self.lock:
+            found = key in self.documents
+            if found:
+                self.documents.move_to_end(key)
+                document = self.documents[key]
+        if found:
+            self.count("memory")
+            return document
+
+        source = "parsed"
+        disk_path = self.diskPath(kind, digest) if self.cache_dir is not None and kind in self.disk_kinds else None
+        if disk_path is not None and os.path.exists(disk_path):
+            try:
+                with open(disk_path, "r") as f:
+                    document, source = json.load(f), "disk"
+            except Exception:
+                source = "parsed"
+        if source == "parsed":
+            try:
+                document = parse(data)
+            except Exception:
+                self.count("failed")
+                raise
+            if disk_path is not None:
+                # Other threads and processes may be saving the document too
+                writeAtomically(disk_path, lambda f: json.dump(document, f))
+        self.count(source)
+        self.remember(key, document)
+        return document
+
+    # Leave out the lock and the documents (lxml trees can't be pickled) when copying the
+    # cache to another process (see `runBatch`)
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        state["documents"] = OrderedDict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+# Used by the checks (through `parseXML`, `parseJSON`, and `expandJSONLD`) when they aren't
+# given a `ParseCache`; give them one with a `cache_dir` to share expanded JSON-LD between
+# processes
+default_parse_cache = ParseCache()
+
+
+# Describe how many records were taken from the cache (from a `ParseCache`'s `stats`, or
+# several added together)
+def parseCacheReport(stats):
+    return (f"Parsed records: {stats['hits']} taken from the cache ({stats['memory']} from memory, {stats['disk']} from disk) and "
+            f"{stats['misses']} parsed ({stats['failed']} couldn't be parsed); {stats['evicted']} evicted from memory.")
+
+
+'''
+Parse a record's contents (bytes) with lxml, or take the tree from `parse_cache` (by
+default, the shared `default_parse_cache`).  The `file_path` is used in the messages of
+syntax errors.
+'''
+def parseXML(data, file_path=None, parse_cache=None):
+    if parse_cache is None:
+        parse_cache = default_parse_cache
+    return parse_cache.get("xml", data, lambda data: etree.parse(io.BytesIO(data), base_url=file_path))
+
+
+# Load a JSON record's contents (bytes), or take the document from `parse_cache` (by default,
+# the shared `default_parse_cache`)
+def parseJSON(data, parse_cache=None):
+    if parse_cache is None:
+        parse_cache = default_parse_cache
+    return parse_cache.get("json", data, lambda data: json.loads(data.decode("utf-8")))
+
+
+'''
+Expand a JSON-LD record's contents (bytes) with pyld, using `document_loader` (by default,
+the shared `context_loader`) to load remote contexts, or take the expanded document from
+`parse_cache` (by default, the shared `default_parse_cache`).  Expanded documents are cached
+by the record's contents only, so they're shared by checks that use different loaders.
+'''
+def expandJSONLD(data, document_loader=None, parse_cache=None):
+    if document_loader is None:
+        document_loader = context_loader
+    if parse_cache is None:
+        parse_cache = default_parse_cache
+    expand = lambda data: jsonld.expand(parseJSON(data, parse_cache), {"documentLoader": document_loader})
+    return parse_cache.get("jsonld", data, expand)
+
+
+
+############################################################
+################### BUILDING RESULT TABLES #################
+############################################################
+
+
+
+# Columns of result tables and reports with only a few different values, which are saved as
+# categorical columns (each different value is stored once)
+categorical_columns = ["exception_type", "exception_subtype", "error_type", "data_model", "model"]
+
+
+# The name saved for the type of an exception (the same text as the type shows in CSV files)
+def exceptionType(e):
+    return str(type(e))
+
+
+'''
+Return a copy of a result table with the columns in `categorical` as categorical columns
+and any other column that only has True and False values as a boolean column.
+'''
+def compactTable(df, categorical=categorical_columns):
+    df = df.copy()
+    for col in df.columns:
+        values = df[col]
+        if col in categorical:
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                # Save types of exceptions (in older results) as text
+                if values.dtype == object:
+                    values = values.map(lambda v: v if (v is None) or isinstance(v, str) or (v != v) else str(v))
+                df[col] = values.astype("category")
+        elif values.dtype == object and len(values) > 0 and values.notna().all() and pd.api.types.infer_dtype(values) == "boolean":
+            df[col] = values.astype(bool)
+    return df
+
+
+'''
+Return a copy of a report that can be saved as a Parquet file: columns of Python objects
+(e.g., exceptions, or a mix of lists and False) are saved as the text they would have in a
+CSV file, while columns of text, numbers, True/False values, or lists of text are kept.
+'''
+def parquetTable(df):
+    df = df.copy()
+    for col in df.columns:
+        values = df[col]
+        if values.dtype != object:
+            continue
+        kind = pd.api.types.infer_dtype(values, skipna=True)
+        if kind in ("string", "empty", "boolean", "integer", "floating"):
+            continue
+        if all(isinstance(v, (list, tuple)) and all(isinstance(item, str) for item in v) for v in values.dropna()):
+            df[col] = values.map(lambda v: list(v) if isinstance(v, (list, tuple)) else v)
+            continue
+        df[col] = values.map(lambda v: v if v is None or (not isinstance(v, (list, tuple)) and v != v) else str(v))
+    df.columns = [str(col) for col in df.columns]
+    return df
+
+
+'''
+Save a report as "{metadata_standard}_{data_serialization}_{report_type}" in `report_dir`
+in each format in `formats` ("csv" and/or "parquet", which requires pyarrow; the notebooks
+use `config.report_formats`).  The Parquet file has the same columns (and index, if `index`
+is True) as the CSV file.
+'''
+def writeReport(df, report_dir, metadata_standard, data_serialization, report_type, index=True, formats=("csv",)):
+    path = report_dir+"{metadata_standard}_{data_serialization}_{report_type}".format(
+        metadata_standard=metadata_standard,
+        data_serialization=data_serialization,
+        report_type=report_type
+        )
+    if "csv" in formats:
+        df.to_csv(path + ".csv", index=index)
+    if "parquet" in formats:
+        table = parquetTable(df if index else df.reset_index(drop=True))
+        if index:
+            table.index = table.index.set_names([str(name) if name is not None else None for name in table.index.names])
+        table.to_parquet(path + ".parquet", index=index)
+
+
 
 ############################################################
 ################### EVALUATING METADATA ####################
@@ -143,12 +1052,54 @@ By default check for UTF-8 encoding, but allow for other encodings with the enco
 '''
 def hasPrologWithEncoding(f, encoding="UTF-8"):
     f = f.lower()
-    if '<?xml version="1.0" encoding="UTF-8"?>' in f:
+    if ('<?xml version="1.0" encoding="' + encoding.lower() + '"?>') in f:
         return True
     else:
         return False
     
 
+'''
+Parse each Dublin Core XML file with lxml and output a DataFrame with one row per file and
+the type (a categorical column) and message of the exception raised when parsing it (None
+for well-formed files).  Parsed trees are kept in `parse_cache` (see `parseXML`).
+'''
+@traced
+def xmlSyntaxErrors(file_paths, parse_cache=None):
+    exception_types, exception_messages = [None]*len(file_paths), [None]*len(file_paths)
+    for i, file_path in enumerate(file_paths):
+        try:
+            with openRecord(file_path, "rb") as f, traceOp("parse_xml", file_path, f):
+                parseXML(f.read(), file_path, parse_cache)
+        except Exception as e:
+            exception_types[i] = exceptionType(e)
+            exception_messages[i] = str(e)
+    return pd.DataFrame({
+        "file_path": list(file_paths), "exception_type": pd.Categorical(exception_types),
+        "exception_message": pd.Series(exception_messages, dtype=object)
+        })
+
+
+'''
+Load each JSON file and output a DataFrame with one row per file and the type (a categorical
+column) and message of the exception raised when loading it (None for valid JSON files).
+Loaded documents are kept in `parse_cache` (see `parseJSON`).
+'''
+@traced
+def jsonSyntaxErrors(file_paths, parse_cache=None):
+    exception_types, exception_messages = [None]*len(file_paths), [None]*len(file_paths)
+    for i, file_path in enumerate(file_paths):
+        try:
+            with openRecord(file_path, "rb") as f, traceOp("parse_json", file_path, f):
+                parseJSON(f.read(), parse_cache)
+        except Exception as e:
+            exception_types[i] = exceptionType(e)
+            exception_messages[i] = str(e)
+    return pd.DataFrame({
+        "file_path": list(file_paths), "exception_type": pd.Categorical(exception_types),
+        "exception_message": pd.Series(exception_messages, dtype=object)
+        })
+
+
 '''
 Input a compiled regex pattern, indicating where to look for emptiness in specified 
 files, and a list of file paths (as strings), indicating which files to check for 
@@ -158,22 +1109,24 @@ one empty field, a list of lists of the empty fields of each file (one sublist p
 for each file in the input list of file paths), and a list of the total number of empty 
 fields per file (one total for each file in the input list of file paths).
 '''
+@traced
 def findEmptyFields(empty_pattern, file_paths):
     files_with_empty, empty_fields_per_file, fields_per_file = [], [], []
     for file_path in file_paths:
-        with open(file_path, "r") as f:
-            f_string = f.read().lower()
-            # Look for empty fields in the file
-            is_empty = re.finditer(empty_pattern, f_string)
-            # Save the empty fields, including the opening and closing tags and any text in between
-            empty_fields = [field[0] for field in is_empty]
-            fields_per_file += [empty_fields]
+        with openRecord(file_path) as f:
+            f_string = traceRead(f, file_path).lower()
+            with traceOp("match_empty", file_path):
+                # Look for empty fields in the file
+                is_empty = re.finditer(empty_pattern, f_string)
+                # Save the empty fields, including the opening and closing tags and any text in between
+                empty_fields = [field[0] for field in is_empty]
+            fields_per_file.append(empty_fields)
             # # Save the file path to the XML version of the file
             if len(empty_fields) > 0:
                 file_path.replace(".txt", ".xml")
-                files_with_empty += [file_path]
+                files_with_empty.append(file_path)
             # Save the number of empty fields in the file
-            empty_fields_per_file += [len(empty_fields)]
+            empty_fields_per_file.append(len(empty_fields))
             f.close()
     print(sum(empty_fields_per_file), "empty field(s) across", len(files_with_empty), "files found.")
     return files_with_empty, empty_fields_per_file, fields_per_file
@@ -198,139 +1151,2385 @@ def emptyErrorReportValues(df, col):
     return df
 
 
-def contextInclusion(file_paths, data_model, context_pattern, context_url_pattern, context_var="@context"):
-    error_raised, error_type, context_correct, has_context_var, has_model_url = [], [], [], [], []
-    for file_path in file_paths:
-        with open(file_path, "r") as f:
-            f_string = f.read().lower()
+# Regexes for the parts of each empty field found by `findEmptyFields` (or the "empty_fields"
+# check of `scanRecords`), by syntax: the field's tag (for a Dublin Core field given as an
+# attribute, such as '<dc element="title">', the attribute's value) and its value
+empty_field_parts = {
+    "xml": {"tag": '(?<=<)([a-z:]+)(?=>)|(?<=")([a-z]+)(?=")', "value": '>([^<]*)<'},
+    "json": {"tag": '^"([^"]+)":', "value": ':\\s?"([^"]*)"$'},
+}
+
+
+'''
+Turn the empty fields found in each file into a long-form table with one row per empty
+field: the file, its metadata model, the field as it was found, and its tag, category (the
+tag without its namespace prefix, e.g., "title" for "dc:title"), and value.  `results` is a
+DataFrame with "file_path" and "empty_fields" columns (e.g., from `runIncremental` with
+`findEmptyFields` or `scanRecords`), or a dictionary of them by metadata model, and `syntax`
+is "xml" (Dublin Core) or "json" (JSON-LD).  The parts of every field are extracted at once
+with pandas' string methods.
+'''
+def emptyFieldTable(results, syntax="xml", model=None):
+    if isinstance(results, dict):
+        tables = [emptyFieldTable(df, syntax, model) for model, df in results.items()]
+        return compactTable(pd.concat(tables, ignore_index=True), categorical=categorical_columns + ["tag", "category"])
+    fields = results[["file_path", "empty_fields"]].explode("empty_fields").dropna(subset=["empty_fields"])
+    fields = fields.rename(columns={"empty_fields": "field"}).reset_index(drop=True)
+    fields["field"] = fields["field"].astype(object)
+    parts = empty_field_parts[syntax]
+    tag = fields.field.str.extract(parts["tag"]).bfill(axis=1).iloc[:, 0].astype(object)
+    fields.insert(1, "model", pd.Series([model]*len(fields), dtype=object))
+    fields["tag"] = tag
+    fields["category"] = tag.str.extract("([^:]*)$")[0]
+    fields["value"] = fields.field.str.extract(parts["value"])[0].fillna("")
+    return compactTable(fields, categorical=categorical_columns + ["tag", "category"])
+
+
+'''
+Count the empty fields in a table from `emptyFieldTable` by the values of the column(s)
+`cols` (e.g., "tag"): the number of empty fields and of files with at least one, in total
+and (if the table has more than one model) for each model.
+'''
+def emptyFieldCounts(fields, cols):
+    cols = [cols] if isinstance(cols, str) else list(cols)
+    stats = {"field_count": ("file_path", "size"), "file_count": ("file_path", "nunique")}
+    counts = fields.groupby(cols, observed=True).agg(**stats)
+    models = fields.model.dropna().unique()
+    if len(models) > 1:
+        by_model = fields.groupby(cols + ["model"], observed=True).agg(**stats).unstack("model", fill_value=0)
+        by_model.columns = [stat + "_" + str(model) for stat, model in by_model.columns]
+        counts = counts.join(by_model)
+    return counts.sort_values("field_count", ascending=False, kind="stable").reset_index()
+
+
+'''
+Find the empty fields of one or more metadata models and count them in one call.  `results`
+is a dictionary by metadata model (e.g., {"Schema.org": schema_results}) of DataFrames with
+"file_path" and "empty_fields" columns (see `emptyFieldTable`) or of lists of file paths to
+check for empty fields with `empty_pattern` (see `findEmptyFields`).
+Output the long-form table of empty fields from `emptyFieldTable` and a dictionary of
+reports: the number of empty fields per file ("by_file"), per model ("by_model", with a
+TOTAL row), and per tag, category, and value ("by_tag", "by_category", "by_value").
+'''
+def emptyFieldReports(results, syntax="xml", empty_pattern=None):
+    if not isinstance(results, dict):
+        results = {None: results}
+    tables = {}
+    for model, result in results.items():
+        if not isinstance(result, pd.DataFrame):
+            if empty_pattern is None:
+                raise ValueError("An empty_pattern is needed to check the files of " + str(model) + " for empty fields")
+            result = result_tables["findEmptyFields"](result, findEmptyFields(empty_pattern, result))
+        tables[model] = result
+    fields = emptyFieldTable(tables, syntax)
+
+    by_file = pd.concat([
+        pd.DataFrame({"file_path": list(df.file_path), "model": pd.Series([model]*len(df), dtype=object), "empty_field_count": df.empty_fields.map(len).to_numpy(dtype=int)})
+        for model, df in tables.items()
+        ], ignore_index=True).sort_values("empty_field_count", ascending=False, kind="stable").reset_index(drop=True)
+    by_model = by_file.groupby("model", dropna=False, sort=False).agg(
+        field_count=("empty_field_count", "sum"), files_with_empty=("empty_field_count", lambda counts: int((counts > 0).sum())), file_count=("file_path", "size")
+        ).reset_index()
+    by_model = pd.concat([by_model, pd.DataFrame({
+        "model": ["TOTAL"], "field_count": [by_model.field_count.sum()], "files_with_empty": [by_model.files_with_empty.sum()], "file_count": [by_model.file_count.sum()]
+        })], ignore_index=True)
+    reports = {
+        "by_file": compactTable(by_file), "by_model": by_model,
+        "by_tag": emptyFieldCounts(fields, ["tag", "category"]), "by_category": emptyFieldCounts(fields, "category"), "by_value": emptyFieldCounts(fields, "value")
+        }
+    return fields, reports
+
+
+'''
+Check whether each JSON-LD file can be expanded and whether it includes the context for
+`data_model` correctly.  Remote contexts are loaded with `document_loader` (by default, the
+shared `context_loader`, which uses local snapshots of the Schema.org and CIDOC-CRM contexts
+and remembers every other context it loads), and the loader's hits and misses for this call
+are printed at the end.  Expanded documents are kept in `parse_cache` (see `expandJSONLD`).
+Output a DataFrame with one row per file: the type (a categorical column) and message of the
+exception raised when expanding it (None if it expanded without errors), and a boolean
+column for each context check.
+'''
+@traced
+def contextInclusion(file_paths, data_model, context_pattern, context_url_pattern, context_var="@context", document_loader=None, parse_cache=None):
+    if document_loader is None:
+        document_loader = context_loader
+    stats_before = dict(getattr(document_loader, "stats", {}))
+    n = len(file_paths)
+    error_type, error_message = [None]*n, [None]*n
+    context_correct, has_context_var, has_model_url = np.zeros(n, dtype=bool), np.zeros(n, dtype=bool), np.zeros(n, dtype=bool)
+    for i, file_path in enumerate(file_paths):
+        with openRecord(file_path, "rb") as f:
+            data = traceRead(f, file_path)
+            f_string = data.decode("utf-8").lower()
 
             try:
-                jsonld.expand(f_string)
-                error_raised += [False]
+                with traceOp("expand", file_path):
+                    # Expand the record as written (not the lowercase text), so the expanded document is
+                    # the one the other checks use (see `expandJSONLD`)
+                    expandJSONLD(data, document_loader, parse_cache)
             except Exception as e:
-                error_raised += [e]
-                error_type += [type(e)]
+                error_type[i] = exceptionType(e)
+                error_message[i] = str(e)
 
-            if re.search(context_pattern, f_string):
-                context_correct += [True]
-                has_context_var += [True]
-                has_model_url += [True]
-            else:
-                context_correct += [False]
-                if context_var in f_string:
-                    has_context_var += [True]
+            with traceOp("match_context", file_path):
+                if re.search(context_pattern, f_string):
+                    context_correct[i] = has_context_var[i] = has_model_url[i] = True
                 else:
-                    has_context_var += [False]
-                if re.search(context_url_pattern, f_string):
-                    has_model_url += [True]
-                else:
-                    has_model_url += [False]
+                    has_context_var[i] = context_var in f_string
+                    has_model_url[i] = re.search(context_url_pattern, f_string) is not None
 
             f.close()
-    df = pd.DataFrame.from_dict({
-        "file_path":file_paths, "data_model":[data_model]*len(file_paths), "error_type":error_type, "error_message":error_raised,
+    df = pd.DataFrame({
+        "file_path":list(file_paths), "data_model":pd.Categorical([data_model]*n), "error_type":pd.Categorical(error_type),
+        "error_message":pd.Series(error_message, dtype=object),
         "includes_context_correctly":context_correct, "includes_@context":has_context_var, "includes_data_model_url":has_model_url
         })
 
+    if hasattr(document_loader, "stats"):
+        hits = document_loader.stats["hits"] - stats_before.get("hits", 0)
+        misses = document_loader.stats["misses"] - stats_before.get("misses", 0)
+        print("Context documents loaded:", hits, "from local copies (cache hits) and", misses, "over the network or not found (cache misses).")
+    return df
+
+
+############################################################
+##################### SCANNING RECORDS #####################
+############################################################
+
+
+
+'''
+Add a check to a set of checks (by default, `dc_checks`) for `scanRecords` to run.  The
+`kind` of check determines the value saved for each file:
+  * "contains": whether the text contains `pattern` (a string)
+  * "matches": a list of the matches of `pattern` (a regex) in the text
+  * "count": the number of matches of `pattern` (a regex) in the text
+  * "derived": the output of `pattern` (a function), given a dictionary of the results of
+    the checks added before this one
+If `lowercase` is True, the check looks at the lowercase version of the text.
+'''
+def registerCheck(name, kind, pattern, lowercase=True, checks=None):
+    if checks is None:
+        checks = dc_checks
+    if not kind in ("contains", "matches", "count", "derived"):
+        raise ValueError("Unknown kind of check: " + kind)
+    if kind in ("matches", "count"):
+        pattern = re.compile(pattern)
+    checks[name] = {"kind": kind, "pattern": pattern, "lowercase": lowercase}
+    return checks
+
+
+# The checks that the syntax, completeness, and conformance notebooks run on Dublin Core records
+dc_checks = OrderedDict()
+registerCheck("has_dcterms", "contains", "dcterms")
+registerCheck("has_dc_namespace", "contains", dc_namespace)
+registerCheck("has_dc_qual_namespace", "contains", dc_qual_namespace)
+registerCheck("has_dc_namespaces", "derived", lambda r: r["has_dc_namespace"] and (r["has_dc_qual_namespace"] or not r["has_dcterms"]))
+registerCheck("has_rdf_namespace", "contains", rdf_namespace)
+registerCheck("has_prolog", "contains", prolog)
+registerCheck("has_prolog_with_encoding", "contains", '<?xml version="1.0" encoding="utf-8"?>')
+registerCheck("empty_fields", "matches", dc_empty_pattern)
+registerCheck("simple_tags", "matches", dc_simple_tag, lowercase=False)
+registerCheck("qualified_tags", "matches", dc_qual_tag, lowercase=False)
+registerCheck("rdf_tags", "matches", rdf_tags, lowercase=False)
+registerCheck("rdf_desc_tags", "matches", rdf_desc_tags, lowercase=False)
+
+
+'''
+Run a set of checks on a single string of text and return a dictionary of the results.
+'''
+def scanText(f_string, checks=None):
+    if checks is None:
+        checks = dc_checks
+    f_lower = f_string.lower()
+    results = {}
+    for name, check in checks.items():
+        kind, pattern = check["kind"], check["pattern"]
+        text = f_lower if check["lowercase"] else f_string
+        if kind == "contains":
+            results[name] = pattern in text
+        elif kind == "matches":
+            results[name] = [match[0] for match in pattern.finditer(text)]
+        elif kind == "count":
+            results[name] = sum(1 for match in pattern.finditer(text))
+        else:
+            results[name] = pattern(results)
+    return results
+
+
+'''
+Read each file in a list of file paths once and run every check in `checks` (by default,
+all the checks in `dc_checks`) on it, instead of re-reading the file for each check.
+Output a DataFrame with one row per file (in the same order as the list of file paths)
+and one column per check.
+'''
+@traced
+def scanRecords(file_paths, checks=None):
+    if checks is None:
+        checks = dc_checks
+    columns = {name: [] for name in checks}
+    for file_path in file_paths:
+        with openRecord(file_path) as f:
+            f_string = traceRead(f, file_path)
+        with traceOp("scan", file_path):
+            results = scanText(f_string, checks)
+        for name in checks:
+            columns[name].append(results[name])
+    df = pd.DataFrame({"file_path": list(file_paths), **columns})
     return df
 
 
+
+############################################################
+################### CHECKING CONFORMANCE ###################
+############################################################
+
+
+
+vocabularies_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vocabularies")
+# Local snapshots of the vocabularies that records are checked against (see `VocabularyIndex`)
+vocabulary_snapshots = {"dcmi": "dcmi_terms.json", "schema_org": "schema_org.json"}
+# Increase when `VocabularyIndex` changes, so indexes saved by older versions are rebuilt
+vocabulary_index_version = 1
+# Prefixes of Schema.org terms written in full (other prefixed terms are from other vocabularies)
+schema_prefixes = ("http://schema.org/", "https://schema.org/", "http://www.schema.org/", "https://www.schema.org/", "schema:")
+# Local snapshot of the CIDOC-CRM classes and properties (see `OntologyIndex`)
+ontology_snapshots = {"cidoc_crm": "cidoc_crm.json"}
+# Increase when `OntologyIndex` or its file format changes, so saved indexes are rebuilt
+ontology_index_version = 1
+# Namespaces of CIDOC-CRM terms in expanded JSON-LD
+cidoc_namespaces = ("http://www.cidoc-crm.org/cidoc-crm/", "https://www.cidoc-crm.org/cidoc-crm/", "http://cidoc-crm.org/cidoc-crm/", "https://cidoc-crm.org/cidoc-crm/")
+
+
+'''
+Save a snapshot of the Schema.org vocabulary from the CSV files of a Schema.org release
+(e.g., schemaorg-current-https-types.csv and schemaorg-current-https-properties.csv): the
+direct supertypes of each type, the domain and range of each property, and the enumeration
+(s) each enumeration member belongs to.
+'''
+def schemaVocabularySnapshot(types_csv, properties_csv, path, source=None):
+    def labels(ids):
+        if not isinstance(ids, str):
+            return []
+        return sorted(term.strip().split("schema.org/")[-1] for term in ids.split(",") if "schema.org/" in term)
+
+    types, properties = pd.read_csv(types_csv, dtype=str), pd.read_csv(properties_csv, dtype=str)
+    snapshot = {"source": source, "types": {}, "members": {}, "properties": {}}
+    for row in types.itertuples():
+        term = labels(row.id)[0]
+        if isinstance(row.enumerationtype, str):
+            snapshot["members"][term] = labels(row.enumerationtype)
+        elif term in ("True", "False"):
+            snapshot["members"][term] = ["Boolean"]
+        else:
+            snapshot["types"][term] = labels(row.subTypeOf)
+    for row in properties.itertuples():
+        snapshot["properties"][labels(row.id)[0]] = {"domain": labels(row.domainIncludes), "range": labels(row.rangeIncludes)}
+    with open(path, "w") as f:
+        json.dump(snapshot, f, indent=0, sort_keys=True)
+    return snapshot
+
+
+'''
+Save a snapshot of the CIDOC-CRM classes and properties from the ontology's RDFS file (e.g.,
+CIDOC_CRM_v7.1.3.rdfs from cidoc-crm.org): the direct superclasses of each class, and the
+domain, range, direct superproperties, and inverse of each property.  Properties without an
+owl:inverseOf are paired with their inverse by their codes (e.g., P108 and P108i).
+'''
+def cidocOntologySnapshot(rdfs_path, path, source=None):
+    rdfs, owl = "http://www.w3.org/2000/01/rdf-schema#", "http://www.w3.org/2002/07/owl#"
+    prefixes = {rdfs: "rdfs:", "http://www.w3.org/2001/XMLSchema#": "xsd:", rdf_namespace: "rdf:"}
+
+    def name(iri):
+        for namespace, prefix in prefixes.items():
+            if iri.startswith(namespace):
+                return prefix + iri[len(namespace):]
+        return re.split("[/#]", iri)[-1]
+
+    def resources(element, tag):
+        return [name(child.get("{" + rdf_namespace + "}resource", "")) for child in element.iterfind(tag)]
+
+    root = etree.parse(rdfs_path).getroot()
+    classes, properties = {}, {}
+    for element in root.iterfind("{" + rdfs + "}Class"):
+        classes[name(element.get("{" + rdf_namespace + "}about"))] = resources(element, "{" + rdfs + "}subClassOf")
+    for element in root.iterfind("{" + rdf_namespace + "}Property"):
+        properties[name(element.get("{" + rdf_namespace + "}about"))] = {
+            "domain": (resources(element, "{" + rdfs + "}domain") + [None])[0],
+            "range": (resources(element, "{" + rdfs + "}range") + [None])[0],
+            "superproperties": resources(element, "{" + rdfs + "}subPropertyOf"),
+            "inverse": (resources(element, "{" + owl + "}inverseOf") + [None])[0],
+            }
+    # Leave out superclasses and superproperties from other ontologies
+    for term, superclasses in classes.items():
+        classes[term] = sorted(superclass for superclass in superclasses if superclass in classes)
+    by_code = {term.split("_", 1)[0]: term for term in properties}
+    for term, definition in properties.items():
+        definition["superproperties"] = sorted(prop for prop in definition["superproperties"] if prop in properties)
+        code = term.split("_", 1)[0]
+        if definition["inverse"] is None:
+            definition["inverse"] = by_code.get(code[:-1] if code.endswith("i") else code + "i")
+
+    snapshot = {"source": source, "namespace": cidoc_namespaces[0], "classes": classes, "properties": properties}
+    with open(path, "w") as f:
+        json.dump(snapshot, f, indent=0, sort_keys=True)
+    return snapshot
+
+
+# A hash of the vocabulary snapshots, which changes whenever a snapshot is updated
+def snapshotDigest(snapshots_dir=vocabularies_dir, snapshots=vocabulary_snapshots, version=None):
+    if version is None:
+        version = vocabulary_index_version
+    digest = hashlib.sha256(str(version).encode("utf-8"))
+    for name in sorted(snapshots):
+        with open(os.path.join(snapshots_dir, snapshots[name]), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+'''
+Hash-set indexes of the DCMI terms and the Schema.org vocabulary, built from the snapshots
+in `snapshots_dir`, so that each element, property, and type of a record is checked in
+constant time:
+  * `dc_elements`, `dcterms`: the 15 Dublin Core elements and every DCMI term (properties,
+    classes, datatypes, and vocabulary encoding schemes), by namespace in `dc_namespaces`
+  * `schema_types`, `schema_properties`, `schema_members`: every Schema.org type, property,
+    and enumeration member
+  * `type_ancestors`: each Schema.org type and all of its supertypes
+  * `type_properties`: the properties that can be used on each type (those whose domain
+    includes the type or any of its supertypes)
+  * `property_ranges`: the types each property's values can have
+Build it once with `loadVocabularyIndex`, which saves it to disk to load quickly later.
+'''
+class VocabularyIndex:
+    def __init__(self, snapshots_dir=vocabularies_dir, snapshots=vocabulary_snapshots):
+        self.digest = snapshotDigest(snapshots_dir, snapshots)
+        with open(os.path.join(snapshots_dir, snapshots["dcmi"])) as f:
+            dcmi = json.load(f)
+        with open(os.path.join(snapshots_dir, snapshots["schema_org"])) as f:
+            schema = json.load(f)
+        # Keep one copy of each term so the saved index stays small
+        intern = lambda terms: frozenset(sys.intern(term) for term in terms)
+
+        self.dc_namespaces = {namespace: prefix for prefix, namespace in dcmi["namespaces"].items()}
+        self.dc_elements = intern(dcmi["elements"])
+        self.dcterms = intern(dcmi["properties"] + dcmi["classes"] + dcmi["datatypes"] + dcmi["vocabulary_encoding_schemes"])
+        self.dcmitype = intern(dcmi["dcmitype"])
+
+        supertypes = schema["types"]
+        self.schema_types = intern(supertypes)
+        self.schema_properties = intern(schema["properties"])
+        self.schema_members = intern(schema["members"])
+        self.type_ancestors = {}
+        for term in supertypes:
+            ancestors, to_visit = set(), [term]
+            while len(to_visit) > 0:
+                ancestor = to_visit.pop()
+                if not ancestor in ancestors:
+                    ancestors.add(ancestor)
+                    to_visit += supertypes.get(ancestor, [])
+            self.type_ancestors[sys.intern(term)] = intern(ancestors)
+        by_domain = {}
+        for prop, definition in schema["properties"].items():
+            for domain in definition["domain"]:
+                by_domain.setdefault(domain, []).append(prop)
+        self.type_properties = {
+            term: intern(prop for ancestor in ancestors for prop in by_domain.get(ancestor, []))
+            for term, ancestors in self.type_ancestors.items()
+            }
+        self.property_ranges = {sys.intern(prop): intern(definition["range"]) for prop, definition in schema["properties"].items()}
+
+
+# The index used when none is given to `structuralConformance` (see `loadVocabularyIndex`)
+vocabulary_index = None
+
+
+'''
+Return the vocabulary index, building it from the snapshots the first time.  If a
+`cache_path` is given, the index is saved there as a pickle and loaded from it afterwards
+(unless the snapshots have changed since it was saved).  The index is kept in memory, so
+later calls return it right away.
+'''
+def loadVocabularyIndex(cache_path=None, snapshots_dir=vocabularies_dir):
+    global vocabulary_index
+    digest = snapshotDigest(snapshots_dir)
+    if vocabulary_index is not None and vocabulary_index.digest == digest:
+        return vocabulary_index
+    index = None
+    if cache_path is not None and os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as f:
+                index = pickle.load(f)
+        except Exception:
+            index = None
+        if getattr(index, "digest", None) != digest:
+            index = None
+    if index is None:
+        index = VocabularyIndex(snapshots_dir)
+        if cache_path is not None:
+            # Other processes may be saving the index too
+            writeAtomically(cache_path, lambda f: pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL), "wb")
+    vocabulary_index = index
+    return index
+
+
+# The position of a CIDOC-CRM class or property in the order of their codes (E1, E2, ..., P1,
+# P1i, P2, ...)
+def cidocOrder(term):
+    code = re.match("([A-Z]+)([0-9]+)([a-z]*)", term)
+    return (code.group(1), int(code.group(2)), code.group(3), term) if code else ("", 0, "", term)
+
+
+'''
+Compile the CIDOC-CRM snapshot at `snapshot_path` into the bytes of an `OntologyIndex`: a
+header (the names of the classes and properties, and where each array starts) followed by
+the arrays, each starting at a multiple of 64 bytes so they can be used in place.
+'''
+def compileOntologyIndex(snapshot_path, digest):
+    with open(snapshot_path) as f:
+        snapshot = json.load(f)
+    classes = sorted(snapshot["classes"], key=cidocOrder)
+    properties = sorted(snapshot["properties"], key=cidocOrder)
+    class_ids, property_ids = {term: i for i, term in enumerate(classes)}, {term: i for i, term in enumerate(properties)}
+
+    # Row i has the bits of class i and every one of its superclasses
+    subclasses = np.zeros((len(classes), len(classes)), dtype=bool)
+    for i, term in enumerate(classes):
+        to_visit = [term]
+        while len(to_visit) > 0:
+            ancestor = class_ids[to_visit.pop()]
+            if not subclasses[i, ancestor]:
+                subclasses[i, ancestor] = True
+                to_visit += snapshot["classes"][classes[ancestor]]
+    # Ranges that aren't classes (e.g., "rdfs:Literal") are -1
+    definitions = [snapshot["properties"][term] for term in properties]
+    arrays = {
+        "subclass_bits": np.packbits(subclasses, axis=1, bitorder="little"),
+        "property_domain": np.array([class_ids.get(d["domain"], -1) for d in definitions], dtype=np.int16),
+        "property_range": np.array([class_ids.get(d["range"], -1) for d in definitions], dtype=np.int16),
+        "property_inverse": np.array([property_ids.get(d["inverse"], -1) for d in definitions], dtype=np.int16),
+        }
+
+    header = {"version": ontology_index_version, "digest": digest, "classes": classes, "properties": properties, "arrays": {}}
+    offset = 0
+    for name, values in arrays.items():
+        header["arrays"][name] = [offset, values.dtype.str, list(values.shape)]
+        offset += -(-values.nbytes // 64) * 64
+    header_bytes = json.dumps(header).encode("utf-8")
+    data = bytearray(OntologyIndex.magic + len(header_bytes).to_bytes(8, "little") + header_bytes)
+    data += bytes(-len(data) % 64)
+    start = len(data)
+    data += bytes(offset)
+    for name, values in arrays.items():
+        array_start = start + header["arrays"][name][0]
+        data[array_start:array_start+values.nbytes] = values.tobytes()
+    return bytes(data)
+
+
+'''
+Compact index of the CIDOC-CRM ontology for checking records without any reasoning: classes
+and properties are numbered in the order of their codes, and the hierarchy and the domains
+and ranges are kept in small NumPy arrays:
+  * `subclass_bits`: one row of bits per class, with the bits of the class and all of its
+    superclasses set (the subclass closure), so `isSubclass` is a single lookup
+  * `property_domain`, `property_range`, `property_inverse`: the class number of each
+    property's domain and range (-1 for a literal range) and its inverse's number (or -1)
+The arrays are read in place from `buffer` (see `compileOntologyIndex`), which can be a
+memory-mapped index file (see `openOntologyIndex`) so that every process checking records
+shares one copy.  `class_codes` and `property_codes` find terms by their codes (e.g., "E22")
+when a record uses an older or misspelled name.
+'''
+class OntologyIndex:
+    magic = b"LADA-OI\n"
+
+    def __init__(self, buffer, path=None):
+        self.buffer, self.path = buffer, path
+        if bytes(buffer[:len(self.magic)]) != self.magic:
+            raise ValueError("Not a CIDOC-CRM ontology index: " + str(path))
+        start = len(self.magic) + 8
+        length = int.from_bytes(buffer[len(self.magic):start], "little")
+        header = json.loads(bytes(buffer[start:start+length]).decode("utf-8"))
+        self.version, self.digest = header["version"], header["digest"]
+        self.class_names, self.property_names = header["classes"], header["properties"]
+        arrays_start = -(-(start + length) // 64) * 64
+        for name, (offset, dtype, shape) in header["arrays"].items():
+            values = np.frombuffer(buffer, dtype=dtype, count=int(np.prod(shape)), offset=arrays_start + offset)
+            setattr(self, name, values.reshape(shape))
+
+        self.class_ids = {term: i for i, term in enumerate(self.class_names)}
+        self.property_ids = {term: i for i, term in enumerate(self.property_names)}
+        # Only terms named with a single code (not, e.g., "E33_E41_Linguistic_Appellation")
+        codes = lambda terms: {term.split("_", 1)[0]: i for i, term in enumerate(terms) if not re.match("[A-Z][0-9]", term.split("_", 1)[-1])}
+        self.class_codes, self.property_codes = codes(self.class_names), codes(self.property_names)
+
+    # Whether class `a` is class `b` or one of its subclasses (by their numbers)
+    def isSubclass(self, a, b):
+        return bool(self.subclass_bits[a, b >> 3] >> (b & 7) & 1)
+
+    # Find a term by its name, or else by its code; returns its number (-1 if it isn't found)
+    # and whether the name matched
+    def find(self, term, ids, codes):
+        i = ids.get(term)
+        if i is not None:
+            return i, True
+        return codes.get(term.split("_", 1)[0], -1), False
+
+    # Copied to another process by the path of its file (mapped again there), or by its bytes
+    def __reduce__(self):
+        if self.path is not None:
+            return (openOntologyIndex, (self.path,))
+        return (OntologyIndex, (bytes(self.buffer),))
+
+
+def openOntologyIndex(path):
+    with open(path, "rb") as f:
+        return OntologyIndex(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), path)
+
+
+# The index used when none is given to `structuralConformance` for CIDOC-CRM records (see
+# `loadOntologyIndex`)
+ontology_index = None
+
+
+'''
+Return the CIDOC-CRM ontology index, compiling it from the snapshot the first time.  If a
+`cache_path` is given, the index is saved there and memory-mapped from it afterwards (unless
+the snapshot has changed since it was saved).  The index is kept in memory, so later calls
+return it right away.
+'''
+def loadOntologyIndex(cache_path=None, snapshots_dir=vocabularies_dir):
+    global ontology_index
+    digest = snapshotDigest(snapshots_dir, ontology_snapshots, ontology_index_version)
+    if ontology_index is not None and ontology_index.digest == digest:
+        return ontology_index
+    index = None
+    if cache_path is not None and os.path.exists(cache_path):
+        try:
+            index = openOntologyIndex(cache_path)
+        except Exception:
+            index = None
+        if getattr(index, "digest", None) != digest:
+            index = None
+    if index is None:
+        data = compileOntologyIndex(os.path.join(snapshots_dir, ontology_snapshots["cidoc_crm"]), digest)
+        index = OntologyIndex(data)
+        if cache_path is not None:
+            writeAtomically(cache_path, lambda f: f.write(data), "wb")
+            index = openOntologyIndex(cache_path)
+    ontology_index = index
+    return index
+
+
+'''
+Check the structure of a Dublin Core RDF/XML record (parsed with `parseXML`, so the tree is
+shared with the syntax check): every element in a Dublin Core namespace has to be one of
+the DCMI elements or terms for its namespace, and be inside an rdf:Description inside the
+rdf:RDF root.  Returns the number of Dublin Core elements and a list of issues ("kind:
+term").
+'''
+def checkDublinCoreStructure(f, index, parse_cache=None):
+    split = lambda tag: tuple(tag[1:].split("}", 1)) if tag[0] == "{" else ("", tag)
+    terms, issues = 0, []
+    seen_root = seen_description = False
+    for element in parseXML(f.read(), getattr(f, "name", None), parse_cache).getroot().iter(tag=etree.Element):
+        namespace, name = split(element.tag)
+        parent = element.getparent()
+        parent = split(parent.tag) if parent is not None else None
+        if namespace == rdf_namespace:
+            if name == "RDF":
+                seen_root = True
+                if parent is not None:
+                    issues.append("misplaced_rdf_root: rdf:RDF")
+            elif name == "Description":
+                seen_description = True
+                if parent != (rdf_namespace, "RDF"):
+                    issues.append("misplaced_description: rdf:Description")
+            continue
+
+        prefix = index.dc_namespaces.get(namespace)
+        if prefix is None:
+            if parent is not None or not name in ("metadata", "record"):
+                issues.append(("no_namespace: " if namespace == "" else "other_namespace: {" + namespace + "}") + name)
+            continue
+        terms += 1
+        if prefix == "dc" and not name in index.dc_elements:
+            issues.append("unknown_dc_element: dc:" + name)
+        elif prefix == "dcterms" and not name in index.dcterms:
+            issues.append("unknown_dcterms_term: dcterms:" + name)
+        elif prefix == "dcmitype":
+            if not name in index.dcmitype:
+                issues.append("unknown_dcmitype_term: dcmitype:" + name)
+            continue
+        if parent != (rdf_namespace, "Description"):
+            issues.append("outside_description: " + prefix + ":" + name)
+    if not seen_root:
+        issues.append("missing_rdf_root: rdf:RDF")
+    if not seen_description:
+        issues.append("missing_description: rdf:Description")
+    return terms, issues
+
+
+# The Schema.org term for a type or property (without any Schema.org prefix), or None if
+# it's from another vocabulary
+def schemaTerm(term):
+    if not ":" in term:
+        return term
+    for prefix in schema_prefixes:
+        if term.startswith(prefix):
+            return term[len(prefix):]
+    return None
+
+
+'''
+Check the structure of a Schema.org JSON-LD record (loaded with `parseJSON`): every type
+has to be a Schema.org type, every property a Schema.org property that can be used on (one
+of) the types of the node it's in, and every node that's the value of a property a type in
+the property's range.  Terms from other vocabularies (e.g., "dcterms:title") are skipped.
+Returns the number of Schema.org types and properties and a list of issues ("kind: term").
+'''
+def checkSchemaStructure(f, index, parse_cache=None):
+    terms, issues = 0, []
+    nodes = [(parseJSON(f.read(), parse_cache), None, None)]
+    while len(nodes) > 0:
+        node, key, expected = nodes.pop()
+        if isinstance(node, list):
+            nodes += [(value, key, expected) for value in reversed(node)]
+            continue
+        if not isinstance(node, dict):
+            continue
+        if "@graph" in node:
+            nodes.append((node["@graph"], None, None))
+
+        types = node.get("@type", node.get("type", []))
+        known = []
+        for term in ([types] if isinstance(types, str) else types if isinstance(types, list) else []):
+            name = schemaTerm(term) if isinstance(term, str) else None
+            if name is None:
+                continue
+            terms += 1
+            if name in index.schema_types:
+                known.append(name)
+            elif name in index.schema_members:
+                issues.append("enumeration_member_as_type: " + term)
+            else:
+                issues.append("unknown_type: " + term)
+        if expected and len(known) > 0 and not any(expected & index.type_ancestors[name] for name in known):
+            issues.append("unexpected_type: " + "/".join(known) + " (" + key + ")")
+
+        values = []
+        for key, value in node.items():
+            if key.startswith("@") or key in ("id", "type"):
+                continue
+            name = schemaTerm(key)
+            if name is None:
+                continue
+            terms += 1
+            if not name in index.schema_properties:
+                issues.append("unknown_property: " + key)
+                values.append((value, key, None))
+                continue
+            if len(known) > 0 and not any(name in index.type_properties[t] for t in known):
+                issues.append("property_not_for_type: " + "/".join(known) + "." + key)
+            values.append((value, key, index.property_ranges[name]))
+        nodes += reversed(values)
+    return terms, issues
+
+
+# The CIDOC-CRM term for an expanded type or property IRI, or None if it's from another
+# vocabulary
+def cidocTerm(iri):
+    for namespace in cidoc_namespaces:
+        if iri.startswith(namespace):
+            return iri[len(namespace):]
+    return None
+
+
+'''
+Check a CIDOC-CRM JSON-LD record against the ontology index after expanding it with
+`expandJSONLD` (with `document_loader`, by default the loader shared with
+`contextInclusion`, which expands the same records), so terms are checked by their full
+IRIs whatever the context calls them.  Every class and property has to be in the ontology,
+each property has to be used on a node whose class is (a subclass of) its domain, and each
+value has to fit its range: a node of (a subclass of) the range class, or a literal if the
+range isn't a class.  Terms from other vocabularies are skipped.
+Returns the number of CIDOC-CRM classes and properties and a list of issues ("kind: term").
+'''
+def checkCidocStructure(f, index, document_loader=None, parse_cache=None):
+    expanded = expandJSONLD(f.read(), document_loader, parse_cache)
+    terms, issues = 0, []
+    # Each node with the property it's the value of (its name and number, -1 if none)
+    nodes = [(node, None, -1) for node in reversed(expanded)]
+    while len(nodes) > 0:
+        node, key, prop = nodes.pop()
+        if not isinstance(node, dict):
+            continue
+        if "@list" in node or "@set" in node:
+            nodes += [(value, key, prop) for value in reversed(node.get("@list", node.get("@set")))]
+            continue
+        expected = index.property_range[prop] if prop >= 0 else -1
+        if "@value" in node:
+            if expected >= 0:
+                issues.append("literal_for_class: " + key + " (" + index.class_names[expected] + ")")
+            continue
+        if prop >= 0 and expected < 0:
+            issues.append("node_for_literal: " + key)
+        if "@graph" in node:
+            nodes += [(value, None, -1) for value in reversed(node["@graph"])]
+
+        classes = []
+        for iri in node.get("@type", []):
+            name = cidocTerm(iri)
+            if name is None:
+                continue
+            terms += 1
+            i, exact = index.find(name, index.class_ids, index.class_codes)
+            if i < 0:
+                issues.append("unknown_class: " + name)
+                continue
+            if not exact:
+                issues.append("renamed_class: " + name + " (" + index.class_names[i] + ")")
+            classes.append(i)
+        class_names = "/".join(index.class_names[i] for i in classes)
+        if expected >= 0 and len(classes) > 0 and not any(index.isSubclass(i, expected) for i in classes):
+            issues.append("unexpected_class: " + class_names + " (" + key + ")")
+
+        values = []
+        for iri, node_values in node.items():
+            if iri.startswith("@"):
+                continue
+            name = cidocTerm(iri)
+            p = -1
+            if name is not None:
+                terms += 1
+                p, exact = index.find(name, index.property_ids, index.property_codes)
+                if p < 0:
+                    issues.append("unknown_property: " + name)
+                elif not exact:
+                    issues.append("renamed_property: " + name + " (" + index.property_names[p] + ")")
+                domain = index.property_domain[p] if p >= 0 else -1
+                if domain >= 0 and len(classes) > 0 and not any(index.isSubclass(i, domain) for i in classes):
+                    inverse = index.property_inverse[p]
+                    if inverse >= 0 and index.property_domain[inverse] >= 0 and any(index.isSubclass(i, index.property_domain[inverse]) for i in classes):
+                        issues.append("inverse_property: " + class_names + "." + name + " (" + index.property_names[inverse] + ")")
+                    else:
+                        issues.append("property_not_for_class: " + class_names + "." + name)
+            values += [(value, name, p) for value in node_values]
+        nodes += reversed(values)
+    if terms == 0:
+        issues.append("no_cidoc_terms: record")
+    return terms, issues
+
+
+# The structural checks for each metadata standard, given an open record (in binary mode)
+# and the index of its vocabulary
+structure_checkers = {
+    "dublin_core": checkDublinCoreStructure,
+    "schema_org": checkSchemaStructure,
+    "cidoc_crm": checkCidocStructure,
+}
+# The function that loads the index each check uses by default
+structure_indexes = {
+    "dublin_core": loadVocabularyIndex,
+    "schema_org": loadVocabularyIndex,
+    "cidoc_crm": loadOntologyIndex,
+}
+
+
+'''
+Check the structure of each record of a metadata standard (a key of `structure_checkers`,
+e.g., "dublin_core") against the vocabulary `index` (by default, the one loaded with
+`loadVocabularyIndex`, or `loadOntologyIndex` for CIDOC-CRM), parsing each record only once.
+A `document_loader` is passed on to the checks that expand JSON-LD (CIDOC-CRM), and parsed
+records are kept in `parse_cache` (see `ParseCache`).
+Output a DataFrame with one row per file: the type (a categorical column) and message of
+the exception raised when parsing it (None if it was parsed), the number of terms checked,
+and the number and list of issues found (see `conformanceIssues` for one row per issue).
+'''
+@traced
+def structuralConformance(file_paths, standard, index=None, document_loader=None, parse_cache=None):
+    if index is None:
+        index = structure_indexes[standard]()
+    check = functools.partial(structure_checkers[standard], parse_cache=parse_cache)
+    if document_loader is not None:
+        check = functools.partial(check, document_loader=document_loader)
+    n = len(file_paths)
+    exception_types, exception_messages = [None]*n, [None]*n
+    term_counts, issue_counts, issues_per_file = np.zeros(n, dtype=int), np.zeros(n, dtype=int), [[] for i in range(n)]
+    for i, file_path in enumerate(file_paths):
+        try:
+            with openRecord(file_path, "rb") as f, traceOp("check_structure", file_path, f):
+                term_counts[i], issues_per_file[i] = check(f, index)
+        except Exception as e:
+            exception_types[i] = exceptionType(e)
+            exception_messages[i] = str(e)
+        issue_counts[i] = len(issues_per_file[i])
+    print(int(issue_counts.sum()), "issue(s) found in", int((issue_counts > 0).sum()), "of", n, "files;", n - exception_types.count(None), "file(s) couldn't be parsed.")
+    return pd.DataFrame({
+        "file_path": list(file_paths), "standard": pd.Categorical([standard]*n),
+        "exception_type": pd.Categorical(exception_types), "exception_message": pd.Series(exception_messages, dtype=object),
+        "term_count": term_counts, "issue_count": issue_counts, "issues": issues_per_file
+        })
+
+
+'''
+Turn the issues found by `structuralConformance` into a table with one row per issue: the
+file, the kind of issue, and the term it's about.
+'''
+def conformanceIssues(results):
+    issues = results[["file_path", "issues"]].explode("issues").dropna(subset=["issues"]).reset_index(drop=True)
+    parts = issues["issues"].astype(object).str.split(": ", n=1, expand=True).reindex(columns=[0, 1])
+    issues = pd.DataFrame({"file_path": issues.file_path, "issue": pd.Categorical(parts[0]), "term": parts[1]})
+    return issues
+
+
+
+############################################################
+##################### VALIDATING SHAPES ####################
+############################################################
+
+
+
+xsd_namespace = "http://www.w3.org/2001/XMLSchema#"
+rdfs_namespace = "http://www.w3.org/2000/01/rdf-schema#"
+rdf_type = rdf_namespace + "type"
+# The syntax each metadata standard's records are loaded into a `TripleStore` from
+record_syntaxes = {"dublin_core": "rdfxml", "schema_org": "jsonld", "cidoc_crm": "jsonld"}
+# The kinds of terms in a `TripleStore`, and the kinds each node kind of a shape rule allows
+# (as in SHACL's sh:nodeKind)
+term_kinds = {"IRI": 0, "BlankNode": 1, "Literal": 2}
+node_kinds = {
+    "IRI": (0,), "BlankNode": (1,), "Literal": (2,),
+    "BlankNodeOrIRI": (0, 1), "IRIOrLiteral": (0, 2), "BlankNodeOrLiteral": (1, 2),
+}
+# The prefixes shape rules can use, with every namespace a prefix stands for (records use
+# both http and https for Schema.org, and several forms of the CIDOC-CRM namespace)
+shape_prefixes = {
+    "rdf": rdf_namespace, "rdfs": rdfs_namespace, "xsd": xsd_namespace,
+    "dc": "http://purl.org/dc/elements/1.1/", "dcterms": "http://purl.org/dc/terms/",
+    "schema": ("http://schema.org/", "https://schema.org/"), "crm": cidoc_namespaces,
+}
+# Splits a shape rule's path into terms ("prefix:name" or "<IRI>"), "/" and "|"
+shape_token = re.compile('<[^<>]*>|[^|/<>\\s]+|[|/]')
+# Literals that don't fill in a field, for shape rules with `non_empty` (the values the
+# empty-field patterns look for)
+empty_value_pattern = re.compile('\\s*("|unknown|none|na|n/a|\\?|not specified)?\\s*"?\\s*', re.IGNORECASE)
+
+
+'''
+Triples of every record loaded into it, with each term (IRI, blank node, or literal) saved
+once in a dictionary and the triples saved as integer IDs: for each triple, the record it's
+from, its subject, predicate, and object, and the object's datatype (-1 for IRIs and blank
+nodes).  Dublin Core RDF/XML records (`loadRDFXML`) and Schema.org and CIDOC-CRM JSON-LD
+records, once expanded (`loadJSONLD`), are loaded into the same store, so the same rules
+can be checked on all of them (see `evaluateShapes`).  Triples are added to compact arrays
+and turned into NumPy arrays by `arrays()`.  Subjects and objects are only the same node
+within a record (so two records with the same IRI, or with blank nodes with the same name,
+aren't joined).
+'''
+class TripleStore:
+    columns = ("record", "subject", "predicate", "object", "datatype")
+
+    def __init__(self):
+        self.terms, self.term_ids, self.kinds = [], {}, array("b")
+        self.rows = array("i")
+        self.file_paths, self.standards, self.exception_types, self.exception_messages = [], [], [], []
+        self.cached_arrays = self.empty_terms = None
+
+    def __len__(self):
+        return len(self.rows) // len(self.columns)
+
+    # The ID of a term (of a kind in `term_kinds`), adding it to the dictionary if it's new
+    def term(self, text, kind=0):
+        key = (kind, text)
+        i = self.term_ids.get(key)
+        if i is None:
+            i = self.term_ids[key] = len(self.terms)
+            self.terms.append(text)
+            self.kinds.append(kind)
+        return i
+
+    # The IDs of the terms in the dictionary out of a list of IRIs (without the ones that aren't)
+    def find(self, iris, kind=0):
+        return np.array([self.term_ids[(kind, iri)] for iri in iris if (kind, iri) in self.term_ids], dtype=np.int32)
+
+    def add(self, record, s, p, o, datatype=-1):
+        self.rows.extend((record, s, p, o, datatype))
+
+    def addRecord(self, file_path, standard):
+        self.file_paths.append(file_path)
+        self.standards.append(standard)
+        self.exception_types.append(None)
+        self.exception_messages.append(None)
+        return len(self.file_paths) - 1
+
+    # Save the exception raised when loading a record, and remove any triples it added
+    def failed(self, record, e, start):
+        del self.rows[start:]
+        self.exception_types[record], self.exception_messages[record] = exceptionType(e), str(e)
+
+    '''
+    Add the triples of a Dublin Core RDF/XML record (the root of its lxml tree): node
+    elements (rdf:Description, or typed nodes, with an rdf:about, rdf:ID, or rdf:nodeID, or
+    a new blank node), their property attributes, and property elements with a literal
+    (with its rdf:datatype or xml:lang), an rdf:resource or rdf:nodeID, nested node
+    elements, or rdf:parseType "Resource" or "Literal".  A root other than rdf:RDF is read
+    as a node element.
+    '''
+    def loadRDFXML(self, record, root):
+        rdf, xml_lang = "{" + rdf_namespace + "}", "{http://www.w3.org/XML/1998/namespace}lang"
+        type_id = self.term(rdf_type)
+        blanks = [0]
+        iri = lambda tag: tag[1:].replace("}", "", 1) if tag[0] == "{" else tag
+
+        # Blank nodes without a name in the record are named with "#", which names can't contain
+        def newBlank():
+            blanks[0] += 1
+            return self.term("_:#" + str(blanks[0]), 1)
+
+        def literal(text, lang=None, datatype=None):
+            if datatype is None:
+                datatype = rdf_namespace + "langString" if lang else xsd_namespace + "string"
+            return self.term(text, 2), self.term(datatype)
+
+        def propertyAttributes(element, s):
+            for name, value in element.attrib.items():
+                if name.startswith(rdf) and name != rdf + "type" or name.startswith("{http://www.w3.org/XML/1998/namespace}"):
+                    continue
+                if name == rdf + "type":
+                    self.add(record, s, type_id, self.term(value))
+                else:
+                    self.add(record, s, self.term(iri(name)), *literal(value, element.get(xml_lang)))
+
+        def nodeElement(element):
+            about, rdf_id, node_id = element.get(rdf + "about"), element.get(rdf + "ID"), element.get(rdf + "nodeID")
+            if about is not None:
+                s = self.term(about)
+            elif rdf_id is not None:
+                s = self.term("#" + rdf_id)
+            elif node_id is not None:
+                s = self.term("_:" + node_id, 1)
+            else:
+                s = newBlank()
+            if element.tag != rdf + "Description":
+                self.add(record, s, type_id, self.term(iri(element.tag)))
+            propertyAttributes(element, s)
+            propertyElements(element, s)
+            return s
+
+        def propertyElements(element, s):
+            for child in element.iterchildren(tag=etree.Element):
+                p = self.term(iri(child.tag))
+                parse_type, resource, node_id = child.get(rdf + "parseType"), child.get(rdf + "resource"), child.get(rdf + "nodeID")
+                if parse_type == "Resource":
+                    o = newBlank()
+                    self.add(record, s, p, o)
+                    propertyElements(child, o)
+                elif parse_type == "Literal":
+                    text = (child.text or "") + "".join(etree.tostring(node, encoding="unicode") for node in child)
+                    self.add(record, s, p, *literal(text, datatype=rdf_namespace + "XMLLiteral"))
+                elif resource is not None or node_id is not None:
+                    o = self.term(resource) if resource is not None else self.term("_:" + node_id, 1)
+                    self.add(record, s, p, o)
+                    propertyAttributes(child, o)
+                elif len(child) > 0:
+                    for node in child.iterchildren(tag=etree.Element):
+                        self.add(record, s, p, nodeElement(node))
+                else:
+                    self.add(record, s, p, *literal(child.text or "", child.get(xml_lang), child.get(rdf + "datatype")))
+
+        if root.tag == rdf + "RDF":
+            for element in root.iterchildren(tag=etree.Element):
+                nodeElement(element)
+        else:
+            nodeElement(root)
+
+    '''
+    Add the triples of an expanded JSON-LD record (from `expandJSONLD`): a triple for each
+    type and property value of every node object (and of the nodes in "@graph" and
+    "@reverse"), with literals given the datatypes JSON-LD gives them (xsd:string,
+    xsd:integer, xsd:double, xsd:boolean, rdf:langString, rdf:JSON, or their "@type") and
+    lists turned into rdf:first/rdf:rest lists.
+    '''
+    def loadJSONLD(self, record, expanded):
+        type_id = self.term(rdf_type)
+        blanks = [0]
+        node = lambda name: self.term(name, 1 if name.startswith("_:") else 0)
+
+        def newBlank():
+            blanks[0] += 1
+            return self.term("_:#" + str(blanks[0]), 1)
+
+        def literal(value):
+            v, datatype = value["@value"], value.get("@type")
+            if datatype == "@json":
+                text, datatype = json.dumps(v, sort_keys=True, separators=(",", ":")), rdf_namespace + "JSON"
+            elif isinstance(v, bool):
+                text, default = "true" if v else "false", "boolean"
+            elif isinstance(v, int) or isinstance(v, float) and v.is_integer() and abs(v) < 1e21 and datatype is None:
+                text, default = str(int(v)), "integer"
+            elif isinstance(v, float):
+                # In the canonical form JSON-LD gives doubles, e.g., "2.5E0"
+                text, default = re.sub("(\\d)0*E\\+?0*(\\d)", "\\1E\\2", "%1.15E" % v), "double"
+            else:
+                text, default = str(v), "string"
+            if datatype is None:
+                datatype = rdf_namespace + "langString" if "@language" in value else xsd_namespace + default
+            return self.term(text, 2), self.term(datatype)
+
+        def objectTerm(value):
+            if "@value" in value:
+                return literal(value)
+            if "@list" in value:
+                head = self.term(rdf_namespace + "nil")
+                for item in reversed(value["@list"]):
+                    b = newBlank()
+                    self.add(record, b, self.term(rdf_namespace + "first"), *objectTerm(item))
+                    self.add(record, b, self.term(rdf_namespace + "rest"), head)
+                    head = b
+                return head, -1
+            return nodeObject(value), -1
+
+        def nodeObject(value):
+            s = node(value["@id"]) if isinstance(value.get("@id"), str) else newBlank()
+            for name in value.get("@type", []):
+                self.add(record, s, type_id, node(name))
+            for key, values in value.items():
+                if key.startswith("@"):
+                    continue
+                p = self.term(key)
+                for v in values:
+                    self.add(record, s, p, *objectTerm(v))
+            for key, values in value.get("@reverse", {}).items():
+                p = self.term(key)
+                for v in values:
+                    self.add(record, objectTerm(v)[0], p, s)
+            for v in value.get("@graph", []):
+                nodeObject(v)
+            return s
+
+        for value in expanded:
+            if isinstance(value, dict) and not "@value" in value:
+                nodeObject(value)
+
+    # The triples as NumPy arrays (one per column in `columns`), made again only once triples are added
+    def arrays(self):
+        if self.cached_arrays is None or len(self.cached_arrays["record"]) != len(self):
+            rows = np.frombuffer(self.rows, dtype=np.int32).reshape(-1, len(self.columns)).T.copy()
+            self.cached_arrays = dict(zip(self.columns, rows))
+        return self.cached_arrays
+
+    # Which terms are literals with an empty value (see `empty_value_pattern`), checking each term once
+    def emptyTerms(self):
+        if self.empty_terms is None or len(self.empty_terms) != len(self.terms):
+            self.empty_terms = np.array([kind == 2 and empty_value_pattern.fullmatch(text) is not None for text, kind in zip(self.terms, self.kinds)], dtype=bool)
+        return self.empty_terms
+
+    # The triples as a DataFrame of terms, for looking at them
+    def table(self):
+        t = self.arrays()
+        terms = np.array(self.terms + [None], dtype=object)
+        return pd.DataFrame({
+            "file_path": np.array(self.file_paths, dtype=object)[t["record"]], "subject": terms[t["subject"]],
+            "predicate": terms[t["predicate"]], "object": terms[t["object"]], "datatype": terms[t["datatype"]]
+            })
+
+
+'''
+Load the records in a list of file paths into a `TripleStore` (a new one, or `store`),
+reading each record's syntax from its metadata standard (`standard`, or for each file, the
+standard in its path; see `record_syntaxes`): Dublin Core RDF/XML is parsed with `parseXML`
+and JSON-LD expanded with `expandJSONLD` (with `document_loader`), so the trees and expanded
+documents are shared with the other checks (through `parse_cache`).  Records that can't be
+parsed are kept, without any triples, with the exception raised.
+'''
+def loadTriples(file_paths, standard=None, document_loader=None, store=None, parse_cache=None):
+    if store is None:
+        store = TripleStore()
+    for file_path in file_paths:
+        record_standard = standard if standard is not None else recordPathInfo(file_path)[0]
+        record, start = store.addRecord(file_path, record_standard), len(store.rows)
+        try:
+            with openRecord(file_path, "rb") as f, traceOp("load_triples", file_path, f):
+                if record_syntaxes.get(record_standard) == "rdfxml":
+                    store.loadRDFXML(record, parseXML(f.read(), getattr(f, "name", None), parse_cache).getroot())
+                else:
+                    store.loadJSONLD(record, expandJSONLD(f.read(), document_loader, parse_cache))
+        except Exception as e:
+            store.failed(record, e, start)
+    return store
+
+
+# The IRIs a term of a shape rule ("prefix:name" with a prefix in `shape_prefixes`, or "<IRI>")
+# stands for
+def shapeIRIs(term):
+    if term.startswith("<"):
+        return (term[1:-1],)
+    prefix, name = term.split(":", 1) if ":" in term else (None, term)
+    if not prefix in shape_prefixes:
+        raise ValueError("Unknown prefix in shape rule: " + term)
+    namespaces = shape_prefixes[prefix]
+    return tuple(namespace + name for namespace in ([namespaces] if isinstance(namespaces, str) else namespaces))
+
+
+'''
+Parse the path of a shape rule, written like a SPARQL property path with sequences ("/")
+and alternatives ("|"), e.g., "dc:title|crm:P102_has_title/crm:P190_has_symbolic_content".
+Returns a tuple of alternatives, each a tuple of steps, each a tuple of the IRIs of its
+property.
+'''
+def parseShapePath(path):
+    alternatives, steps = [], []
+    for token in shape_token.findall(path):
+        if token == "|":
+            alternatives.append(tuple(steps))
+            steps = []
+        elif token != "/":
+            steps.append(shapeIRIs(token))
+    alternatives.append(tuple(steps))
+    if any(len(steps) == 0 for steps in alternatives):
+        raise ValueError("Empty step in shape rule path: " + path)
+    return tuple(alternatives)
+
+
+'''
+Add a rule to a set of shape rules (by default, `shape_rules`) for `evaluateShapes` to
+check, like a SHACL property shape.  The rule checks the values of `path` (see
+`parseShapePath`) of each focus node: each record (its root nodes, the nodes that aren't the
+value of any property) if `target` is None, or each node of a class in `target` (e.g.,
+"schema:CreativeWork|crm:E22_Human-Made_Object"), in the records of the metadata standards
+in `standards` (by default, all of them).  The rule's constraints are:
+  * `min_count` and `max_count`: the number of values a focus node can have
+  * `datatype`: the datatypes (e.g., "xsd:string|xsd:date") values have to be literals of
+  * `pattern`: a regex every value has to contain a match of
+  * `node_kind`: the kind of term (a key of `node_kinds`, e.g., "Literal") values have to be
+If `non_empty` is True, literals with an empty value (e.g., "unknown"; see
+`empty_value_pattern`) aren't counted as values.  The `category` ("completeness" or
+"conformance") is used to group the rules in reports.
+'''
+def registerShapeRule(name, path, category="completeness", target=None, standards=None, min_count=None, max_count=None, datatype=None, pattern=None, node_kind=None, non_empty=False, rules=None):
+    if rules is None:
+        rules = shape_rules
+    if node_kind is not None and not node_kind in node_kinds:
+        raise ValueError("Unknown node kind: " + node_kind)
+    rules[name] = {
+        "path": parseShapePath(path), "category": category,
+        "target": tuple(iri for term in target.split("|") for iri in shapeIRIs(term.strip())) if target is not None else None,
+        "standards": tuple(standards) if standards is not None else None, "min_count": min_count, "max_count": max_count,
+        "datatype": tuple(iri for term in datatype.split("|") for iri in shapeIRIs(term.strip())) if datatype is not None else None,
+        "pattern": re.compile(pattern) if pattern is not None else None, "node_kind": node_kinds[node_kind] if node_kind is not None else None,
+        "non_empty": non_empty
+        }
+    return rules
+
+
+# The rules that `validateShapes` checks by default: the fields every record should have a
+# value for (in any of the metadata standards), and the form some of the values should have
+shape_rules = OrderedDict()
+date_path = ("dc:date|dcterms:date|dcterms:created|dcterms:issued|schema:dateCreated|schema:datePublished|"
+             "crm:P108i_was_produced_by/crm:P4_has_time-span/crm:P82_at_some_time_within")
+registerShapeRule("title", "dc:title|dcterms:title|schema:name|schema:headline|crm:P102_has_title/crm:P190_has_symbolic_content|crm:P102_has_title/rdfs:label",
+                  min_count=1, non_empty=True)
+registerShapeRule("creator", "dc:creator|dcterms:creator|schema:creator|schema:author|crm:P108i_was_produced_by/crm:P14_carried_out_by", min_count=1, non_empty=True)
+registerShapeRule("date", date_path, min_count=1, non_empty=True)
+registerShapeRule("description", "dc:description|dcterms:description|dcterms:abstract|schema:description", standards=["dublin_core", "schema_org"], min_count=1, non_empty=True)
+registerShapeRule("subject", "dc:subject|dcterms:subject|schema:keywords|schema:about|crm:P129_is_about", min_count=1, non_empty=True)
+registerShapeRule("date_format", date_path, category="conformance", node_kind="Literal", non_empty=True,
+                  datatype="xsd:string|xsd:date|xsd:gYear|xsd:gYearMonth|xsd:dateTime", pattern="^\\d{4}(-\\d{2}(-\\d{2})?)?([T ]|$)")
+registerShapeRule("language_code", "dc:language|dcterms:language|schema:inLanguage", category="conformance", non_empty=True,
+                  pattern="^([A-Za-z]{2,3}(-[A-Za-z0-9]+)*|https?://\\S+)$")
+
+
+'''
+Check every rule in `rules` (by default, `shape_rules`; see `registerShapeRule`) on every
+record in a `TripleStore` at once.  Each rule is checked with NumPy on the arrays of
+triples: the values of its path are found by matching the triples' subjects (with the record
+they're from) with sorted arrays of the triples of each step's properties, the values of
+each focus node are counted with `np.bincount`, and each value's datatype and node kind
+are compared as IDs.  Patterns are matched once per distinct term rather than once per
+value.  Records that couldn't be loaded aren't checked.
+Output a DataFrame with one row per violation: the record (its position in the store and
+its file), its metadata standard, the rule and its category, the constraint violated, the
+focus node (None for a record), and the value (None for a count).
+'''
+def evaluateShapes(store, rules=None):
+    if rules is None:
+        rules = shape_rules
+    t = store.arrays()
+    terms = np.array(store.terms + [None], dtype=object)
+    kinds = np.frombuffer(store.kinds, dtype=np.int8).copy()
+    empty = store.emptyTerms()
+    n_records = len(store.file_paths)
+    standards = np.array(store.standards, dtype=object)
+    loaded = np.array([e is None for e in store.exception_types], dtype=bool)
+    # Each node is identified by its record and term, so nodes of different records are never joined
+    width = np.int64(max(len(store.terms), 1))
+    subject_keys = t["record"].astype(np.int64) * width + t["subject"]
+    object_keys = t["record"].astype(np.int64) * width + t["object"]
+    root_keys = np.unique(subject_keys[~np.isin(subject_keys, object_keys)])
+
+    # The triples of the values of `keys` (nodes) for one step of a path, with the focus node
+    # (by position) each one is for
+    def follow(focus, keys, iris):
+        triples = np.flatnonzero(np.isin(t["predicate"], store.find(iris)))
+        order = np.argsort(subject_keys[triples], kind="stable")
+        triples, sorted_keys = triples[order], subject_keys[triples[order]]
+        start, end = np.searchsorted(sorted_keys, keys, "left"), np.searchsorted(sorted_keys, keys, "right")
+        counts = end - start
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.repeat(focus, counts), triples[np.repeat(start, counts) + offsets]
+
+    violations = []
+    def addViolations(name, rule, constraint, focus_nodes, focus_records, values=None, detail=None):
+        if len(focus_records) == 0:
+            return
+        violations.append(pd.DataFrame({
+            "record": focus_records, "rule": name, "category": rule["category"], "constraint": constraint,
+            "focus": terms[focus_nodes], "value": terms[values] if values is not None else None,
+            "detail": detail if detail is not None else None
+            }))
+
+    for name, rule in rules.items():
+        with traceOp("shape_rule:" + name):
+            checked = loaded.copy()
+            if rule["standards"] is not None:
+                checked &= np.isin(standards, rule["standards"])
+            # The focus nodes: records (their root nodes are where the path starts), or nodes of the target classes
+            if rule["target"] is None:
+                focus_records = np.flatnonzero(checked)
+                focus_nodes = np.full(len(focus_records), -1)
+                start_keys = root_keys[checked[root_keys // width]]
+                start_focus = np.searchsorted(focus_records, start_keys // width)
+            else:
+                typed = (t["predicate"] == store.term_ids.get((0, rdf_type), -1)) & np.isin(t["object"], store.find(rule["target"])) & checked[t["record"]]
+                start_keys = np.unique(subject_keys[typed])
+                focus_records, focus_nodes = start_keys // width, start_keys % width
+                start_focus = np.arange(len(start_keys))
+
+            # The values of each alternative path, following each step from the focus nodes
+            value_focus, value_triples = [], []
+            for steps in rule["path"]:
+                focus, keys = start_focus, start_keys
+                for i, iris in enumerate(steps):
+                    focus, triples = follow(focus, keys, iris)
+                    keys = object_keys[triples]
+                value_focus.append(focus)
+                value_triples.append(triples)
+            focus, triples = np.concatenate(value_focus), np.concatenate(value_triples)
+            values = t["object"][triples]
+            # The same value found by two alternatives (e.g., dc:title and dcterms:title) is one value
+            unique = np.unique(focus.astype(np.int64) * width + values, return_index=True)[1]
+            focus, triples, values = focus[unique], triples[unique], values[unique]
+            if rule["non_empty"]:
+                kept = ~empty[values]
+                focus, triples, values = focus[kept], triples[kept], values[kept]
+
+            counts = np.bincount(focus, minlength=len(focus_records))
+            if rule["min_count"] is not None:
+                bad = counts < rule["min_count"]
+                addViolations(name, rule, "minCount", focus_nodes[bad], focus_records[bad], detail=[str(n) + " < " + str(rule["min_count"]) for n in counts[bad]])
+            if rule["max_count"] is not None:
+                bad = counts > rule["max_count"]
+                addViolations(name, rule, "maxCount", focus_nodes[bad], focus_records[bad], detail=[str(n) + " > " + str(rule["max_count"]) for n in counts[bad]])
+            if rule["datatype"] is not None:
+                bad = (kinds[values] != term_kinds["Literal"]) | ~np.isin(t["datatype"][triples], store.find(rule["datatype"]))
+                addViolations(name, rule, "datatype", focus_nodes[focus[bad]], focus_records[focus[bad]], values[bad], detail=terms[t["datatype"][triples[bad]]])
+            if rule["node_kind"] is not None:
+                bad = ~np.isin(kinds[values], rule["node_kind"])
+                addViolations(name, rule, "nodeKind", focus_nodes[focus[bad]], focus_records[focus[bad]], values[bad])
+            if rule["pattern"] is not None:
+                distinct = np.unique(values)
+                matches = np.array([kinds[i] != term_kinds["BlankNode"] and rule["pattern"].search(store.terms[i]) is not None for i in distinct], dtype=bool)
+                bad = ~matches[np.searchsorted(distinct, values)] if len(values) > 0 else np.zeros(0, dtype=bool)
+                addViolations(name, rule, "pattern", focus_nodes[focus[bad]], focus_records[focus[bad]], values[bad])
+
+    columns = ["record", "rule", "category", "constraint", "focus", "value", "detail"]
+    violations = pd.concat(violations, ignore_index=True) if len(violations) > 0 else pd.DataFrame({column: pd.Series(dtype=int if column == "record" else object) for column in columns})
+    violations.insert(1, "file_path", np.array(store.file_paths + [None], dtype=object)[violations.record.to_numpy(dtype=int)])
+    violations.insert(2, "standard", standards[violations.record.to_numpy(dtype=int)] if n_records > 0 else None)
+    return compactTable(violations, categorical=["standard", "rule", "category", "constraint"])
+
+
+'''
+Check the shape rules in `rules` (by default, `shape_rules`) on the records in a list of
+file paths, of any of the metadata standards (the standard of each file is in its path,
+unless a `standard` is given), in one pass: the records are loaded into one `TripleStore`
+(see `loadTriples`; `document_loader` is used to expand JSON-LD, and parsed records are
+kept in `parse_cache`) and every rule is checked
+on all of them at once (see `evaluateShapes`).
+Output a DataFrame with one row per file: its metadata standard, the type (a categorical
+column) and message of the exception raised when loading it (None if it was loaded), its
+number of triples, and the number and list of rule violations ("rule: constraint (value)",
+so `conformanceIssues` makes a table of them; `evaluateShapes` gives them with more detail).
+'''
+@traced
+def validateShapes(file_paths, standard=None, rules=None, document_loader=None, parse_cache=None):
+    store = loadTriples(file_paths, standard, document_loader, parse_cache=parse_cache)
+    violations = evaluateShapes(store, rules)
+    n = len(file_paths)
+    issues_per_file = [[] for i in range(n)]
+    for record, rule, constraint, value in zip(violations.record.to_numpy(dtype=int), violations.rule.astype(object), violations.constraint.astype(object), violations.value):
+        issues_per_file[record].append(rule + ": " + constraint + ("" if pd.isna(value) else " (" + str(value) + ")"))
+    issue_counts = np.bincount(violations.record.to_numpy(dtype=int), minlength=n)
+    print(len(violations), "rule violation(s) found in", int((issue_counts > 0).sum()), "of", n, "files;", n - store.exception_types.count(None), "file(s) couldn't be loaded.")
+    return pd.DataFrame({
+        "file_path": list(file_paths), "standard": pd.Categorical(store.standards),
+        "exception_type": pd.Categorical(store.exception_types), "exception_message": pd.Series(store.exception_messages, dtype=object),
+        "triple_count": np.bincount(store.arrays()["record"], minlength=n), "issue_count": issue_counts, "issues": issues_per_file
+        })
+
+
+'''
+Summarize the results of `validateShapes` by metadata standard and rule (of `rules`, by
+default `shape_rules`): the number of records the rule was checked on (the records of the
+standards it's for that could be loaded), the number of violations, and the number and share
+of the records that meet the rule.
+'''
+def shapeSummary(results, rules=None):
+    if rules is None:
+        rules = shape_rules
+    loaded = results.loc[results.exception_type.isna()]
+    record_counts = loaded.groupby("standard", observed=True).size()
+    issues = conformanceIssues(loaded).merge(loaded[["file_path", "standard"]], on="file_path")
+    grouped = issues.groupby(["standard", "issue"], observed=True)
+    violation_counts, failing_counts = grouped.size(), grouped.file_path.nunique()
+    rows = []
+    for name, rule in rules.items():
+        for standard, record_count in record_counts.items():
+            if rule["standards"] is not None and not standard in rule["standards"]:
+                continue
+            failing = int(failing_counts.get((standard, name), 0))
+            rows.append({
+                "standard": standard, "rule": name, "category": rule["category"], "record_count": int(record_count),
+                "violation_count": int(violation_counts.get((standard, name), 0)), "conforming_count": int(record_count) - failing,
+                "conforming_proportion": (int(record_count) - failing) / record_count
+                })
+    return pd.DataFrame(rows, columns=["standard", "rule", "category", "record_count", "violation_count", "conforming_count", "conforming_proportion"])
+
+
+
+############################################################
+################## FINDING NEAR-DUPLICATES #################
+############################################################
+
+
+
+# The number of words in each shingle, the number of hash functions in each MinHash
+# signature, and the seed the hash functions are drawn from (signatures can only be compared
+# if they were made with the same settings)
+shingle_size = 3
+minhash_permutations = 128
+minhash_seed = 1
+# A prime larger than any shingle hash, for the hash functions (a*x + b) mod prime
+minhash_prime = (1 << 61) - 1
+word_pattern = re.compile(r"\w+")
+
+
+'''
+Return the 32-bit hashes of the distinct shingles of a record's text: every run of `k` words
+in a row (lowercased), so records that differ in a few words share most of their shingles.
+Each word is hashed once (with CRC-32, which is the same in every session) and saved in
+`word_hashes`, and the words' hashes are combined into the shingles' hashes with NumPy.
+A text with fewer than `k` words has a single shingle.
+'''
+def recordShingles(text, k=shingle_size, word_hashes=None):
+    if word_hashes is None:
+        word_hashes = {}
+    hashes = []
+    for word in word_pattern.findall(text.lower()):
+        h = word_hashes.get(word)
+        if h is None:
+            h = word_hashes[word] = zlib.crc32(word.encode("utf-8"))
+        hashes.append(h)
+    words = np.array(hashes, dtype=np.uint64)
+    if len(words) == 0:
+        return np.zeros(0, dtype=np.uint32)
+    k = min(k, len(words))
+    n = len(words) - k + 1
+    shingles = words[:n].copy()
+    for j in range(1, k):
+        shingles = shingles * np.uint64(1000003) + words[j:n+j]
+    return np.unique((shingles ^ (shingles >> np.uint64(32))) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+
+'''
+Make a MinHash signature of each record (read from the TXT files, so malformed records are
+included): for each of `num_perm` hash functions, the smallest hash of the record's
+shingles (see `recordShingles`).  The share of values two signatures have in common
+estimates the Jaccard similarity of the records' shingles.  Records are hashed in batches
+of about `batch_size` shingles, hashing every shingle of a batch with every hash function
+at once and taking each record's minimums with `np.minimum.reduceat`.
+Output a DataFrame with one row per file: its metadata standard and dataset (from its
+path), its number of distinct shingles, and its signature (an array of `num_perm` numbers).
+'''
+@traced
+def minhashSignatures(file_paths, k=shingle_size, num_perm=minhash_permutations, seed=minhash_seed, batch_size=2**15):
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 31, size=(num_perm, 1), dtype=np.uint64)
+    b = rng.integers(0, 1 << 32, size=(num_perm, 1), dtype=np.uint64)
+    n = len(file_paths)
+    signatures = np.full((n, num_perm), 0xFFFFFFFF, dtype=np.uint32)
+    shingle_counts = np.zeros(n, dtype=int)
+    word_hashes, batch, rows = {}, [], []
+
+    def hashBatch():
+        shingles = np.concatenate(batch).astype(np.uint64)
+        starts = np.cumsum([0] + [len(record) for record in batch[:-1]])
+        hashes = ((a * shingles + b) % np.uint64(minhash_prime)) & np.uint64(0xFFFFFFFF)
+        signatures[rows] = np.minimum.reduceat(hashes, starts, axis=1).T
+        batch.clear()
+        rows.clear()
+
+    for i, file_path in enumerate(file_paths):
+        with openRecord(file_path, "rb") as f:
+            text = traceRead(f, file_path).decode("utf-8", errors="replace")
+        with traceOp("shingle", file_path):
+            shingles = recordShingles(text, k, word_hashes)
+        shingle_counts[i] = len(shingles)
+        # Records without any words keep a signature of the largest values, and aren't grouped
+        if len(shingles) > 0:
+            batch.append(shingles)
+            rows.append(i)
+        if sum(len(record) for record in batch) >= batch_size:
+            with traceOp("minhash"):
+                hashBatch()
+    if len(batch) > 0:
+        with traceOp("minhash"):
+            hashBatch()
+
+    info = [recordPathInfo(file_path) for file_path in file_paths]
+    return pd.DataFrame({
+        "file_path": list(file_paths), "standard": pd.Categorical([standard for standard, dataset in info]),
+        "dataset": pd.Categorical([dataset for standard, dataset in info]), "shingle_count": shingle_counts,
+        "signature": list(signatures)
+        })
+
+
+'''
+Return the number of bands and rows per band (bands x rows = `num_perm`) to split
+signatures into for locality-sensitive hashing.  Records whose similarity is about
+(1 / bands) ** (1 / rows) are as likely as not to share a bucket, so this picks the highest
+such similarity that isn't above `threshold`, so that records at the threshold are likely to
+be compared (the records compared are checked against the threshold anyway).
+'''
+def lshParameters(threshold, num_perm=minhash_permutations):
+    options = [(bands, num_perm // bands) for bands in range(1, num_perm + 1) if num_perm % bands == 0]
+    below = [option for option in options if (1 / option[0]) ** (1 / option[1]) <= threshold]
+    if len(below) == 0:
+        return options[-1]
+    return max(below, key=lambda option: (1 / option[0]) ** (1 / option[1]))
+
+
+'''
+Group the records in `signatures` (from `minhashSignatures`) into clusters of near-duplicates,
+records whose estimated similarity is at least `threshold`, without comparing every pair
+of records.  Records are first split into groups by the columns in `by` (by default, by
+metadata standard, across datasets; use ["standard", "dataset"] for clusters within each
+dataset).  Each signature is split into bands (see `lshParameters`), and records whose
+values are the same in a band share a bucket (found by sorting); every pair of records in a
+bucket is compared, and records at least `threshold` similar are joined into the same
+cluster.  In buckets of more than `max_bucket_size` records, each record is compared only
+with the `max_bucket_size - 1` records before it in the bucket, so each record is compared
+with a limited number of records per band and the time taken grows about linearly with the
+number of records.
+Output a DataFrame with one row per record: its cluster (numbered from 0), the cluster's
+size, the cluster's first record, and the record's estimated similarity to it.
+'''
+@traced
+def nearDuplicateClusters(signatures, threshold=0.8, by=("standard",), max_bucket_size=100):
+    signatures = signatures.reset_index(drop=True)
+    n = len(signatures)
+    num_perm = len(signatures.signature.iloc[0]) if n > 0 else minhash_permutations
+    matrix = np.stack(signatures.signature.to_numpy()) if n > 0 else np.zeros((0, num_perm), dtype=np.uint32)
+    bands, rows = lshParameters(threshold, num_perm)
+    has_shingles = signatures.shingle_count.to_numpy() > 0
+    groups = signatures.groupby(list(by), observed=True, sort=False).indices if len(by) > 0 else {None: np.arange(n)}
+
+    # Pairs of records that share a bucket, where each band's values are hashed to one number
+    # (records whose different values get the same number are compared too, but aren't joined
+    # unless they're similar).  With the records sorted by bucket, the records `offset` places
+    # apart are pairs if they're in the same bucket, up to the size of the largest bucket
+    pairs = []
+    with traceOp("bucket"):
+        keys = np.zeros((n, bands), dtype=np.uint64)
+        for band in range(bands):
+            for column in matrix[:, band*rows:(band+1)*rows].T:
+                keys[:, band] = keys[:, band] * np.uint64(1000003) ^ column
+        for members in groups.values():
+            members = np.asarray(members)[has_shingles[members]]
+            for band in range(bands):
+                order = np.argsort(keys[members, band], kind="stable")
+                sorted_members, sorted_keys = members[order], keys[members, band][order]
+                for offset in range(1, min(len(sorted_members), max_bucket_size)):
+                    same = sorted_keys[offset:] == sorted_keys[:-offset]
+                    if not same.any():
+                        break
+                    pairs.append(np.stack([sorted_members[:-offset][same], sorted_members[offset:][same]], axis=1))
+    pairs = np.unique(np.sort(np.concatenate(pairs), axis=1), axis=0) if len(pairs) > 0 else np.zeros((0, 2), dtype=int)
+    with traceOp("compare"):
+        similar = pairs[(matrix[pairs[:, 0]] == matrix[pairs[:, 1]]).mean(axis=1) >= threshold]
+
+    # Join the similar pairs into clusters, each named after its first record
+    parent = np.arange(n)
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    for i, j in similar:
+        i, j = root(i), root(j)
+        if i != j:
+            parent[max(i, j)] = min(i, j)
+    roots = np.array([root(i) for i in range(n)], dtype=int)
+
+    clusters = pd.factorize(roots)[0]
+    sizes = np.bincount(clusters) if n > 0 else np.zeros(0, dtype=int)
+    similarity = (matrix == matrix[roots]).mean(axis=1) if n > 0 else np.zeros(0)
+    df = signatures.drop(columns=["signature"])
+    df["cluster"] = clusters
+    df["cluster_size"] = sizes[clusters]
+    df["first_record"] = signatures.file_path.to_numpy()[roots]
+    df["similarity"] = np.where(has_shingles, similarity, np.nan)
+    n_duplicates = int((df.cluster_size > 1).sum())
+    print(n_duplicates, "of", n, "records have near-duplicates (at least", f"{threshold:.0%}", "similar), in", df.cluster[df.cluster_size > 1].nunique(), "clusters.")
+    return df
+
+
+'''
+Summarize near-duplicate clusters (from `nearDuplicateClusters`) by the columns in `by` (by
+default, by metadata standard and dataset): the number of records, the number (and share)
+of records with at least one near-duplicate, the number of clusters of two or more records
+with records in the group, and the size of the largest of those clusters.
+'''
+def nearDuplicateSummary(clusters, by=("standard", "dataset")):
+    duplicate = clusters.cluster_size > 1
+    grouped = clusters.assign(near_duplicate=duplicate, duplicate_cluster=clusters.cluster.where(duplicate),
+                              duplicate_cluster_size=clusters.cluster_size.where(duplicate, 0)).groupby(list(by), observed=True)
+    summary = grouped.agg(
+        record_count=("file_path", "size"), near_duplicate_count=("near_duplicate", "sum"),
+        cluster_count=("duplicate_cluster", "nunique"), largest_cluster=("duplicate_cluster_size", "max")
+        )
+    summary["near_duplicate_proportion"] = summary.near_duplicate_count / summary.record_count
+    return summary.reset_index()
+
+
+
+############################################################
+#################### RUNNING IN BATCHES ####################
+############################################################
+
+
+
+# The parameters of each function that `runBatch` can run which take lists with one value
+# per file (the first of which is the list of file paths)
+batch_parameters = {
+    "xmlSyntaxErrors": ["file_paths"],
+    "jsonSyntaxErrors": ["file_paths"],
+    "findEmptyFields": ["file_paths"],
+    "contextInclusion": ["file_paths"],
+    "scanRecords": ["file_paths"],
+    "structuralConformance": ["file_paths"],
+    "minhashSignatures": ["file_paths"],
+    "validateShapes": ["file_paths"],
+    "correctXML": ["txt_errored_files", "error_list"],
+    "correctJSON": ["txt_errored_files"],
+}
+
+# The functions in `batch_parameters` that write files, which `runBatch` runs on one file at a
+# time, so that no file is corrected twice when another file in its chunk raises an exception
+batch_writers = {"correctXML", "correctJSON"}
+
+
+# A row of a result table for a file that raised an exception, with the exception's type and
+# message in the table's columns for them
+def failedRow(type_column="exception_type", message_column="exception_message"):
+    return lambda values, e, empty: pd.DataFrame({
+        "file_path": [values[0]], type_column: pd.Categorical([exceptionType(e)]), message_column: pd.Series([str(e)], dtype=object)
+        })
+
+
+'''
+The output `runBatch` gives for a file that a function in `batch_parameters` raised an
+exception for, in the function's usual format, so that outputs with one value per file
+still line up with the files: a function given the file's values (its path first), the
+exception, and the function's output for no files.  Tables with one row per file get a row
+with the exception, lists with one value per file get None, and files that couldn't be
+corrected are still incorrect.
+'''
+batch_failures = {
+    "xmlSyntaxErrors": failedRow(),
+    "jsonSyntaxErrors": failedRow(),
+    "findEmptyFields": lambda values, e, empty: ([], [None], [None]),
+    "contextInclusion": failedRow("error_type", "error_message"),
+    "scanRecords": failedRow(),
+    "structuralConformance": failedRow(),
+    "minhashSignatures": failedRow(),
+    "validateShapes": failedRow(),
+    "correctXML": lambda values, e, empty: ([values[0]],) + empty[1:] if isinstance(empty, tuple) else [values[0]],
+    "correctJSON": lambda values, e, empty: ([values[0]], [], [
+        {"file": values[0].replace(".txt", ".json"), "exception_type": type(e), "exception_message": str(e)}
+        ]) + empty[3:],
+}
+
+
+# pyld's exceptions can't be copied between processes as they are, so tell pickle how to
+# rebuild them
+copyreg.pickle(jsonld.JsonLdError, lambda e: (jsonld.JsonLdError, (e.args[0] if e.args else "", e.type, e.details, e.code)))
+
+
+'''
+Combine the outputs of running a function on consecutive chunks of files into the output
+the function would have returned if it had been run on all the files at once.
+'''
+def mergeResults(results):
+    first = results[0]
+    if isinstance(first, pd.DataFrame):
+        return pd.concat(results, ignore_index=True)
+    if isinstance(first, tuple):
+        return tuple(mergeResults([result[i] for result in results]) for i in range(len(first)))
+    if isinstance(first, list):
+        return [value for result in results for value in result]
+    return results
+
+
+'''
+Run a function on one chunk of files (in a worker process).  If the function raises an
+exception for the chunk, run it again on each file on its own (its output for the chunk is
+lost, but the functions that don't write files can be run again), so that only the files
+that raise an exception get the output in `batch_failures`, and return those files'
+exceptions.  The functions in `batch_writers` are run on each file on its own to begin with,
+so each file is only run once.
+'''
+def runChunk(function, chunk_lists, kwargs):
+    name = function.__name__
+    names = batch_parameters[name]
+    run = lambda lists: function(**dict(zip(names, lists)), **kwargs)
+    # Hide the messages each function prints per chunk; `runBatch` prints a summary instead
+    with contextlib.redirect_stdout(io.StringIO()):
+        if not name in batch_writers:
+            try:
+                return [run(chunk_lists)], []
+            except Exception:
+                pass
+        results, errors = [], []
+        for values in zip(*chunk_lists):
+            try:
+                results += [run([[value] for value in values])]
+            except Exception as e:
+                results += [batch_failures[name](values, e, run([[] for name in names]))]
+                errors += [{"file": values[0], "exception_type": type(e), "exception_message": str(e)}]
+        return results, errors
+
+
+'''
+Run one of the functions in `batch_parameters` on a large list of files by splitting the
+file paths (and any other per-file lists, such as the list of error messages for
+`correctXML`) into chunks of `chunk_size` files and running the chunks in `workers`
+processes at once (by default, one per CPU).  Any other arguments to the function can be
+given as keyword arguments.  For example:
+    utils.runBatch(utils.findEmptyFields, dublin_file_paths, empty_pattern=empty)
+    utils.runBatch(utils.correctXML, txt_errored_files, error_list, chunk_size=50)
+Output the function's usual output, in the same order as if it were run on all the files
+at once, and a list of the exceptions (one dictionary per file) for any files that the
+function raised an exception for (these files get the output in `batch_failures`).
+'''
+def runBatch(function, file_paths, *other_lists, workers=None, chunk_size=200, **kwargs):
+    names = batch_parameters[function.__name__]
+    lists = [list(file_paths)] + [list(other_list) for other_list in other_lists]
+    if len(lists) != len(names):
+        raise ValueError(function.__name__ + " takes " + str(len(names)) + " list(s) of values per file: " + ", ".join(names))
+    if workers is None:
+        workers = os.cpu_count() or 1
+    chunks = [[l[start:start+chunk_size] for l in lists] for start in range(0, len(lists[0]), chunk_size)]
+
+    results, errors = [], []
+    if workers == 1 or len(chunks) <= 1:
+        outputs = [runChunk(function, chunk, kwargs) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+            outputs = list(executor.map(runChunk, [function]*len(chunks), chunks, [kwargs]*len(chunks)))
+    for chunk_results, chunk_errors in outputs:
+        results += chunk_results
+        errors += chunk_errors
+
+    if len(results) == 0:
+        # Return empty output in the function's usual format
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = [function(**{name: [] for name in names}, **kwargs)]
+    print(function.__name__, "ran on", len(lists[0]), "files in", len(chunks), "chunk(s);", len(errors), "file(s) raised an exception.")
+    return mergeResults(results), errors
+
+
+
+############################################################
+################### RE-EVALUATING RECORDS ##################
+############################################################
+
+
+
+# The version of each function whose results `runIncremental` saves.  Increase a function's
+# version when what it checks changes, so that every file is checked again the next time.
+check_versions = {
+    "xmlSyntaxErrors": 2,
+    "jsonSyntaxErrors": 2,
+    "findEmptyFields": 1,
+    "contextInclusion": 3,
+    "scanRecords": 1,
+    "structuralConformance": 2,
+    "minhashSignatures": 1,
+    "validateShapes": 1,
+}
+
+
+# Turn a function's output into a DataFrame with one row per file, for the functions in
+# `check_versions` that don't output a DataFrame already
+result_tables = {
+    "findEmptyFields": lambda file_paths, result: pd.DataFrame({
+        "file_path": list(file_paths), "empty_field_count": result[1], "empty_fields": result[2]
+        }),
+}
+
+
+'''
+Return the SHA-256 hash of a record's contents (from a file path or a `RecordStore` path).
+'''
+def contentHash(file_path):
+    with openRecord(file_path, "rb") as f, traceOp("hash", file_path, f):
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+# A string that stays the same between sessions for the arguments given to a function
+# (compiled patterns by their pattern, functions by their name, indexes by their snapshots'
+# digest, and loaders by their class)
+def describeArgument(value):
+    if isinstance(value, re.Pattern):
+        return "re:" + value.pattern
+    if isinstance(value, (VocabularyIndex, OntologyIndex)):
+        return repr(value.digest)
+    if isinstance(value, dict):
+        return "{" + ", ".join(describeArgument(k) + ": " + describeArgument(v) for k, v in value.items()) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(describeArgument(v) for v in value) + "]"
+    if callable(value):
+        return getattr(value, "__qualname__", type(value).__name__)
+    if isinstance(value, (str, int, float, bool, type(None))):
+        return repr(value)
+    return type(value).__name__
+
+
+'''
+Return the version of a check: the function's version in `check_versions` and a hash of
+the arguments it's given, so that changing either one (e.g., a regex pattern) re-runs it.
+'''
+def checkVersion(function_name, kwargs):
+    if function_name == "scanRecords" and kwargs.get("checks") is None:
+        # The default checks can change too
+        kwargs = dict(kwargs, checks=dc_checks)
+    if function_name == "structuralConformance" and kwargs.get("index") is None:
+        # So are the vocabulary snapshots
+        if kwargs.get("standard") == "cidoc_crm":
+            kwargs = dict(kwargs, index=snapshotDigest(snapshots=ontology_snapshots, version=ontology_index_version))
+        else:
+            kwargs = dict(kwargs, index=snapshotDigest())
+    if function_name == "validateShapes" and kwargs.get("rules") is None:
+        # And the default shape rules
+        kwargs = dict(kwargs, rules=shape_rules)
+    # The cache of parsed records doesn't change the results
+    arguments = describeArgument(dict(sorted((key, value) for key, value in kwargs.items() if key != "parse_cache")))
+    return str(check_versions.get(function_name, 0)) + ":" + hashlib.sha256(arguments.encode("utf-8")).hexdigest()[:16]
+
+
+'''
+Manifest of the records each check was last run on: for each check (by name, e.g.,
+"dublin_core_xml_syntax"), the check's version (see `checkVersion`) and the content hash of
+every file it was run on, saved as a JSON file in the `path` folder.  Each check's results
+are saved next to it as a pickled DataFrame, so they can be merged with the results for
+changed files later (and read by `loadResults` without running the check).  Each check has
+its own files, so different checks can be run at the same time in different processes.
+'''
+class Manifest:
+    def __init__(self, path):
+        self.path = path
+        self.checks = {}
+
+    def entryPath(self, check):
+        return os.path.join(self.path, check + ".json")
+
+    def resultsPath(self, check):
+        return os.path.join(self.path, check + ".pkl")
+
+    # Return the manifest entry for a check, or None if it hasn't been run
+    def entry(self, check):
+        if not check in self.checks and os.path.exists(self.entryPath(check)):
+            with open(self.entryPath(check), "r") as f:
+                self.checks[check] = json.load(f)
+        return self.checks.get(check)
+
+    # Return the saved results of a check, or None if there aren't any
+    def loadResults(self, check):
+        if not os.path.exists(self.resultsPath(check)):
+            return None
+        return pd.read_pickle(self.resultsPath(check))
+
+    '''
+    Return the files in `file_paths` that need checking again: all of them if the check's
+    version has changed or its results weren't saved, otherwise only the files that are new
+    or whose contents have changed since the check was last run.
+    '''
+    def changed(self, check, file_paths, version, hashes):
+        entry = self.entry(check)
+        if entry is None or entry["version"] != version or not os.path.exists(self.resultsPath(check)):
+            return list(file_paths)
+        return [file_path for file_path in file_paths if entry["files"].get(str(file_path)) != hashes[file_path]]
+
+    # Save a check's results and the hashes of the files they're for
+    def update(self, check, version, hashes, results):
+        results = results.copy()
+        results["file_path"] = results["file_path"].astype(str)
+        writeAtomically(self.resultsPath(check), lambda f: results.to_pickle(f), "wb")
+        self.checks[check] = {"version": version, "files": {str(file_path): h for file_path, h in hashes.items()}}
+        writeAtomically(self.entryPath(check), lambda f: json.dump(self.checks[check], f))
+
+
+'''
+Run one of the functions in `check_versions` only on the files that have changed since it
+was last run as `check` (see `Manifest`), and merge the new results with the saved results
+for the other files.  Other per-file lists and keyword arguments are given as for
+`runBatch`.  For example:
+    utils.runIncremental(utils.scanRecords, dublin_file_paths, check="dublin_core_scan", manifest=manifest)
+With `workers`, the files are checked in that many processes at once with `runBatch`, and
+files the function raises an exception for get a row with the exception (and are checked
+again next time).
+Output a DataFrame with one row per file in `file_paths` (in the same order).  Without a
+manifest, the function is run on all the files.
+'''
+def runIncremental(function, file_paths, *other_lists, check=None, manifest=None, workers=None, **kwargs):
+    with traceStage(check or function.__name__):
+        return incrementalResults(function, file_paths, *other_lists, check=check, manifest=manifest, workers=workers, **kwargs)
+
+
+# Run a check for `runIncremental` (as a stage of the trace, if tracing is on)
+def incrementalResults(function, file_paths, *other_lists, check=None, manifest=None, workers=None, **kwargs):
+    name = function.__name__
+    if not name in check_versions:
+        raise ValueError("Results can't be saved for " + name)
+    names = batch_parameters[name]
+    lists = [list(file_paths)] + [list(other_list) for other_list in other_lists]
+    to_table = result_tables.get(name, lambda file_paths, result: result)
+    def run(lists):
+        if workers is None:
+            return function(**dict(zip(names, lists)), **kwargs), []
+        return runBatch(function, *lists, workers=workers, **kwargs)
+    if manifest is None:
+        return to_table(lists[0], run(lists)[0])
+    if check is None:
+        raise ValueError("A name for the check is needed to save its results in the manifest")
+
+    version = checkVersion(name, kwargs)
+    hashes = {file_path: contentHash(file_path) for file_path in lists[0]}
+    changed = set(manifest.changed(check, lists[0], version, hashes))
+    rows = [i for i, file_path in enumerate(lists[0]) if file_path in changed]
+    changed_lists = [[l[i] for i in rows] for l in lists]
+    new_results, errors = run(changed_lists)
+    new_results = to_table(changed_lists[0], new_results)
+
+    saved = manifest.loadResults(check)
+    if saved is None or len(rows) == len(lists[0]):
+        results = new_results
+    else:
+        saved = saved.loc[~saved.file_path.isin([str(file_path) for file_path in changed])]
+        results = pd.concat([saved, new_results], ignore_index=True) if len(new_results) > 0 else saved
+        results = results.set_index(results.file_path.astype(str)).loc[[str(file_path) for file_path in lists[0]]].reset_index(drop=True)
+        results = compactTable(results.infer_objects())
+    # Keep the paths given (e.g., so paths in a `RecordStore` are still read from the store)
+    results["file_path"] = lists[0]
+    # Leave the files that raised an exception out of the manifest, so they're checked again
+    failed = set(error["file"] for error in errors)
+    manifest.update(check, version, {file_path: h for file_path, h in hashes.items() if not file_path in failed}, results)
+    traceCount("manifest.checked", len(rows))
+    traceCount("manifest.reused", len(lists[0]) - len(rows))
+    print(check + ":", len(rows), "of", len(lists[0]), "files checked;", len(lists[0]) - len(rows), "unchanged results reused.")
+    return results
+
+
+
+############################################################
+###################### CHECKING URLS #######################
+############################################################
+
+
+
+'''
+Keep open HTTP(S) connections per host so that checking many URLs on the same host
+(e.g., schema.org, purl.org) doesn't open a new connection for every URL, and limit
+how many requests are sent to any one host at the same time with `max_per_host`.
+'''
+class HostConnectionPool:
+    def __init__(self, max_per_host=4, timeout=10):
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.ssl_context = ssl.create_default_context()
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.slots = {}
+
+    def slot(self, host_key):
+        with self.lock:
+            if not host_key in self.slots:
+                self.slots[host_key] = threading.BoundedSemaphore(self.max_per_host)
+            return self.slots[host_key]
+
+    # Return an idle connection to the host if there is one (and whether it was reused)
+    def acquire(self, host_key):
+        with self.lock:
+            idle = self.idle.get(host_key, [])
+            if len(idle) > 0:
+                return idle.pop(), True
+        return self.connect(host_key), False
+
+    def connect(self, host_key):
+        scheme, host, port = host_key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self.ssl_context)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def release(self, host_key, conn):
+        with self.lock:
+            self.idle.setdefault(host_key, []).append(conn)
+
+    def close(self):
+        with self.lock:
+            for conns in self.idle.values():
+                for conn in conns:
+                    conn.close()
+            self.idle = {}
+
+
+'''
+Send a single request and return the response status, reason, and headers.  Errors are
+raised the same way `urllib.request.urlopen` raises them (connection errors wrapped in
+a URLError, HTTP errors as an HTTPError) so the error messages match those in existing
+reports.  For GET requests, at most `read_bytes` of the body are read.
+'''
+def sendRequest(pool, method, url, headers=request_headers, read_bytes=1):
+    parts = urllib.parse.urlsplit(url)
+    scheme = parts.scheme.lower()
+    if not scheme in ("http", "https"):
+        raise urllib.error.URLError("unknown url type: " + scheme)
+    try:
+        host, port = parts.hostname, parts.port
+    except ValueError as e:
+        raise http.client.InvalidURL(str(e))
+    if not host:
+        raise urllib.error.URLError("no host given")
+    host_key = (scheme, host, port or (443 if scheme == "https" else 80))
+    selector = parts.path or "/"
+    if parts.query:
+        selector += "?" + parts.query
+
+    with pool.slot(host_key):
+        conn, reused = pool.acquire(host_key)
+        for attempt in (1, 2):
+            try:
+                try:
+                    conn.request(method, selector, headers=headers)
+                except OSError as e:
+                    raise urllib.error.URLError(e)
+                response = conn.getresponse()
+                break
+            except Exception as e:
+                conn.close()
+                # If the host closed an idle connection, try again once with a new connection
+                stale = isinstance(e, http.client.RemoteDisconnected) or isinstance(getattr(e, "reason", None), (ConnectionResetError, BrokenPipeError))
+                if reused and stale and attempt == 1:
+                    conn, reused = pool.connect(host_key), False
+                    continue
+                raise
+
+        try:
+            if method == "HEAD" or response.length == 0:
+                response.read()
+                fully_read = True
+            else:
+                response.read(read_bytes)
+                fully_read = response.isclosed()
+        except Exception:
+            conn.close()
+            raise
+        if fully_read and not response.will_close:
+            pool.release(host_key, conn)
+        else:
+            conn.close()
+
+    return response.status, response.reason, response.headers
+
+
+'''
+Check whether a URL exists, trying a HEAD request first and falling back to a GET
+request (that only reads the start of the response) if the host doesn't answer the
+HEAD request successfully (or the HEAD request fails, e.g. if the host resets the
+connection).  Redirects are followed like `urllib.request.urlopen` does.
+Returns "No error" or the error message as a string, the last HTTP status code received
+(None if no response was received), and the URL of the last response (after redirects).
+'''
+def checkURL(url, pool, headers=request_headers, max_redirects=10):
+    redirect_codes = (301, 302, 303, 307, 308)
+    status, current_url = None, url
+    for method in ("HEAD", "GET"):
+        try:
+            current_url, redirects = url.strip(), 0
+            while True:
+                status, reason, response_headers = sendRequest(pool, method, current_url, headers)
+                location = response_headers.get("location") or response_headers.get("uri")
+                if (status in redirect_codes) and location and (redirects < max_redirects):
+                    current_url = urllib.parse.urljoin(current_url, location)
+                    redirects += 1
+                    continue
+                break
+            if 200 <= status < 300:
+                return "No error", status, current_url  # Indicates a valid URL (though a manual check is needed to make sure it's a relevant URL)
+            if method == "GET":
+                if status in redirect_codes and location:
+                    reason = ("The HTTP server returned a redirect error that would lead to an infinite loop.\n"
+                              "The last 30x error message was:\n" + reason)
+                raise urllib.error.HTTPError(current_url, status, reason, response_headers, None)
+        except Exception as e:
+            # Some hosts refuse or drop HEAD requests, so try a GET request before giving up
+            if method == "HEAD":
+                continue
+            if not isinstance(e, urllib.error.HTTPError):
+                status = None
+            return str(e), status, current_url
+
+
+# Check a URL, timing the request(s) for the trace
+def tracedCheckURL(url, pool, headers=request_headers):
+    with traceOp("request", url):
+        return checkURL(url, pool, headers)
+
+
+'''
+Normalize a URL for use as a cache key: remove surrounding whitespace and any fragment,
+lowercase the scheme and host, drop default ports, and use "/" for an empty path.
+'''
+def normalizeURL(url):
+    url = url.strip()
+    try:
+        parts = urllib.parse.urlsplit(url)
+        scheme, host, port = parts.scheme.lower(), (parts.hostname or ""), parts.port
+    except ValueError:
+        return url
+    netloc = host
+    if parts.username:
+        netloc = parts.username + "@" + netloc
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        netloc += ":" + str(port)
+    return urllib.parse.urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+
+'''
+On-disk store of URL check results (an SQLite database at `path`), so re-running an
+evaluation only requests URLs that haven't been checked before or whose results are
+older than `ttl` seconds (or `error_ttl` seconds for URLs that returned an error, since
+those are more likely to be temporary).  When the store holds more than `max_entries`
+results, the oldest results are removed.
+'''
+class URLCache:
+    def __init__(self, path, ttl=30*24*60*60, error_ttl=24*60*60, max_entries=100000):
+        self.path, self.ttl, self.error_ttl, self.max_entries = path, ttl, error_ttl, max_entries
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS url_checks ("
+            "url TEXT PRIMARY KEY, status INTEGER, request_error TEXT, final_url TEXT, checked_at REAL)"
+            )
+        self.db.execute("CREATE INDEX IF NOT EXISTS url_checks_checked_at ON url_checks (checked_at)")
+        self.db.commit()
+
+    def isFresh(self, request_error, checked_at):
+        ttl = self.ttl if request_error == "No error" else self.error_ttl
+        return (time.time() - checked_at) <= ttl
+
+    # Return the saved result for a URL as a dictionary, or None if there isn't one, or
+    # if it's out of date (unless `allow_stale` is True)
+    def get(self, url, allow_stale=False):
+        row = self.db.execute(
+            "SELECT status, request_error, final_url, checked_at FROM url_checks WHERE url = ?", (normalizeURL(url),)
+            ).fetchone()
+        if row is None:
+            return None
+        status, request_error, final_url, checked_at = row
+        if not allow_stale and not self.isFresh(request_error, checked_at):
+            return None
+        return {"status": status, "request_error": request_error, "final_url": final_url, "checked_at": checked_at}
+
+    def put(self, url, status, request_error, final_url):
+        self.putMany([(url, status, request_error, final_url)])
+
+    def putMany(self, results):
+        now = time.time()
+        self.db.executemany(
+            "INSERT OR REPLACE INTO url_checks VALUES (?, ?, ?, ?, ?)",
+            [(normalizeURL(url), status, request_error, final_url, now) for url, status, request_error, final_url in results]
+            )
+        self.evict()
+        self.db.commit()
+
+    def evict(self):
+        total = self.db.execute("SELECT COUNT(*) FROM url_checks").fetchone()[0]
+        if total > self.max_entries:
+            self.db.execute(
+                "DELETE FROM url_checks WHERE url IN (SELECT url FROM url_checks ORDER BY checked_at LIMIT ?)",
+                (total - self.max_entries,)
+                )
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM url_checks").fetchone()[0]
+
+    def close(self):
+        self.db.close()
+
+
+'''
+Check a list of URLs concurrently, with at most `max_workers` requests in flight and at
+most `max_per_host` of them to the same host.  Each distinct URL is only requested once.
+If a `URLCache` is provided, URLs with an up-to-date result in the cache aren't requested
+again and new results are saved to it.  With `offline=True`, no requests are made: every
+URL's result comes from the cache, however old, and URLs that aren't in the cache are
+reported as "Not checked (offline)".
+Output a list with one value per URL in the input list (in the same order): "No error",
+the request's error message, or "Invalid format (no request made)" for any URL that is
+None.
+'''
+@traced
+def checkURLs(urls, headers=request_headers, timeout=10, max_workers=32, max_per_host=4, cache=None, offline=False):
+    unique_urls = list(dict.fromkeys([url for url in urls if url is not None]))
+    url_errors, to_request, from_cache = {}, [], 0
+    for url in unique_urls:
+        cached = cache.get(url, allow_stale=offline) if cache is not None and isinstance(url, str) else None
+        if cached is not None:
+            url_errors[url] = cached["request_error"]
+            from_cache += 1
+        elif offline:
+            url_errors[url] = "Not checked (offline)"
+        else:
+            to_request += [url]
+
+    if len(to_request) > 0:
+        pool = HostConnectionPool(max_per_host=max_per_host, timeout=timeout)
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(lambda url: tracedCheckURL(url, pool, headers), to_request))
+        finally:
+            pool.close()
+        for url, (request_error, status, final_url) in zip(to_request, results):
+            url_errors[url] = request_error
+        if cache is not None:
+            cache.putMany([(url, status, request_error, final_url) for url, (request_error, status, final_url) in zip(to_request, results) if isinstance(url, str)])
+
+    request_errors = []
+    for url in urls:
+        if url is None:
+            request_errors += ["Invalid format (no request made)"]
+        else:
+            request_errors += [url_errors[url]]
+    traceCount("url_cache.hits", from_cache)
+    traceCount("url_cache.misses", len(unique_urls) - from_cache)
+    print("Finished requests!", len(to_request), "of", len(unique_urls), "unique URL(s) requested,", from_cache, "from the cache.")
+    return request_errors
+
+
+
 ############################################################
 ################### CORRECTING METADATA ####################
 ############################################################
 
 
 
+# The XML prolog added to corrected Dublin Core records
+xml_prolog = '<?xml version="1.0" encoding="UTF-8"?>'
+# Splits a record into tags (including prologs and comments), the text between them, and any
+# "<" that doesn't start a tag
+xml_token = re.compile('<[^<>]*>|[^<]+|<')
+# lxml parser that recovers what it can from malformed XML instead of raising an exception
+xml_recover_parser = etree.XMLParser(recover=True)
+
+
+'''
+Add a fixer to a set of fixers (by default, `xml_fixers`) for `repairXML` to run, after the
+fixers added before it.  `applies` is a function given the parsing error message of a record
+that returns whether to run the fixer on it, and `fix` is a function given the list of the
+record's tokens (see `xml_token`) and a dictionary of settings (e.g., the tags to use) that
+makes one pass over the tokens and returns the new list of tokens and whether it changed
+anything.
+'''
+def registerFixer(name, applies, fix, fixers=None):
+    if fixers is None:
+        fixers = xml_fixers
+    fixers[name] = {"applies": applies, "fix": fix}
+    return fixers
+
+
+# Remove duplicated quotes surrounding text
+def dedupeQuotes(tokens, settings):
+    fixed, changed = [], False
+    for token in tokens:
+        if '""' in token:
+            token = token.replace('""', '"')
+            changed = True
+        fixed.append(token)
+    return fixed, changed
+
+
+'''
+Make sure the record has an rdf:RDF root tag with the RDF and Dublin Core namespaces: if the
+last closing tag has a matching opening tag that isn't a metadata field, replace the pair with
+the rdf:RDF tags; if the matching opening tag is a metadata field, add the rdf:RDF tags around
+the record (after the prolog, if there is one); and if there isn't a matching opening tag, add
+the rdf:RDF opening tag and replace the last closing tag.  If dcterms tags are used, the
+record is a qualified Dublin Core record and the rdf:RDF tag includes the DC terms namespace;
+otherwise it only includes the namespace for the 15 core fields.
+'''
+def wrapRDFRoot(tokens, settings):
+    if len(tokens) == 0 or not re.fullmatch("</[a-z]+>", tokens[-1]):
+        return tokens, False
+    last_close_tag = tokens[-1]
+    qualified, first_open_tag, prolog_index = False, None, None
+    for i, token in enumerate(tokens):
+        if token.startswith("<dcterms:"):
+            qualified = True
+        elif (first_open_tag is None) and token.startswith("<" + last_close_tag[2:-1]):
+            first_open_tag = token
+        elif (prolog_index is None) and token.startswith(prolog):
+            prolog_index = i
+    open_tag = settings["dc_prefix_open_tag_qual"] if qualified else settings["dc_prefix_open_tag_simple"]
+    close_tag = settings["dc_prefix_close_tag"]
+
+    if first_open_tag is not None and not ("dc" in first_open_tag):
+        fixed = [open_tag if token == first_open_tag else (close_tag if token == last_close_tag else token) for token in tokens]
+    elif first_open_tag is not None:
+        if prolog_index is not None:
+            fixed = tokens[:prolog_index+1] + ["\n", open_tag] + tokens[prolog_index+1:]
+        else:
+            fixed = [open_tag, "\n"] + tokens
+        fixed += ["\n", close_tag]
+    else:
+        fixed = [open_tag, "\n"] + [close_tag if token == last_close_tag else token for token in tokens]
+    return fixed, True
+
+
+# Replace a malformed rdf:Description opening tag with a well-formed one
+def fixRDFDescription(tokens, settings):
+    desc_tag = '<rdf:Description rdf:about="http://www.w3.org/TR/rdf-syntax-grammar">'
+    fixed, changed, malformed_tag = [], False, None
+    for token in tokens:
+        if (malformed_tag is None) and token.startswith("<rdf:Description rdf:about="):
+            malformed_tag = token
+        if (malformed_tag is not None) and (token == malformed_tag) and (token != desc_tag):
+            token = desc_tag
+            changed = True
+        fixed.append(token)
+    return fixed, changed
+
+
+# Add an XML prolog if the record doesn't start with one
+def addProlog(tokens, settings):
+    if len(tokens) > 0 and tokens[0].startswith("<?xml"):
+        return tokens, False
+    return [settings["xml_prolog"], "\n"] + tokens, True
+
+
+# The fixers `correctXML` runs on Dublin Core records, in order
+xml_fixers = OrderedDict()
+registerFixer("dedupe_quotes", lambda message: True, dedupeQuotes)
+registerFixer("wrap_rdf_root", lambda message: "Namespace prefix dc" in message, wrapRDFRoot)
+registerFixer("fix_rdf_description", lambda message: "Namespace prefix rdf for about on Description" in message, fixRDFDescription)
+registerFixer("add_prolog", lambda message: True, addProlog)
+
+
+'''
+Run each fixer in `fixers` (by default, all the fixers in `xml_fixers`) that applies to a
+record's parsing error `message`, in order, on the record's tokens.  Output the repaired
+record and a list of the names of the fixers that changed it.
+'''
+def repairXML(f_string, message, settings, fixers=None):
+    if fixers is None:
+        fixers = xml_fixers
+    tokens = xml_token.findall(f_string.strip())
+    fired = []
+    for name, fixer in fixers.items():
+        if fixer["applies"](message):
+            tokens, changed = fixer["fix"](tokens, settings)
+            if changed:
+                fired.append(name)
+    return "".join(tokens).strip(), fired
+
+
 '''
 Correct malformed Dublin Core XML by reading TXT versions of the files as strings
-and re-writing the corrected versions as XML files.  By default, include an XML prolog.
+and re-writing the corrected versions as XML files.  With `include_prolog=True`, add an
+XML prolog to records without one.
+Each record is repaired by the fixers in `xml_fixers` that apply to its error message (see
+`repairXML`) and checked once at the end by parsing it.  With `recover=True`, lxml's
+recovering parser is tried first, which is faster but may drop parts of the record it can't
+parse; records it can't recover are repaired by the fixers as usual.
+Output a list of the files that are still malformed (one dictionary per file).  With
+`report=True`, also output a DataFrame of which fixers changed each file and whether it was
+corrected.
 '''
+@traced
 def correctXML(
         txt_errored_files, error_list, 
         dc_prefix_open_tag_simple=dc_prefix_open_tag_simple, dc_prefix_open_tag_qual=dc_prefix_open_tag_qual, dc_prefix_close_tag=dc_prefix_close_tag,
-        dc_namespace=dc_namespace, dc_qual_namespace=dc_qual_namespace, rdf_namespace=rdf_namespace
+        dc_namespace=dc_namespace, dc_qual_namespace=dc_qual_namespace, rdf_namespace=rdf_namespace, include_prolog=False, recover=False, report=False
                ):
-    i, maxI = 0, len(error_list)
-    still_incorrect = []
-    while i < maxI:
-        txt_file, message = txt_errored_files[i], error_list[i]
-        
-        with open(txt_file, "r") as f:
-            f_string = f.read()
-            f_string = f_string.strip()  # Remove any leading and trailing whitespace
-
-            # Remove duplicated quotes surrounding text (not empty strings)
-            dup_quotes = re.findall(".+", f_string)
-            for dup_quote in dup_quotes:
-                dedup = dup_quote.replace('""', '"')
-                f_string = f_string.replace(dup_quote, dedup)
-            
-                if "Namespace prefix dc" in message:
-                    # If dcterms tags are used, the record is a qualified DC record and
-                    # should include the DC terms namespace
-                    if "<dcterms:" in f_string:
-                        dc_prefix_open_tag = dc_prefix_open_tag_qual
-                    # Otherwise, the record is a simple DC record and should only include
-                    # the namespace for the 15 core fields
-                    else:
-                        dc_prefix_open_tag = dc_prefix_open_tag_simple
-
-                    # Find the name of the first open and last closing tags and, if they are a pair,
-                    # replace them with tags that include the RDF and DC namespaces
-                    last_close_tag = re.findall("<\/[a-z]+>$", f_string)
-                    if len(last_close_tag) > 0:
-                        first_open_tag_pattern = "<" + last_close_tag[0][2:-1] + "[^<]*>"
-                        first_open_tag = re.findall(first_open_tag_pattern, f_string)
-                        if len(first_open_tag) > 0:
-                            # If the tags are a pair and they are not for a metadata field, replace them with the
-                            # DC prefix tags defining the relevant namespace(s)
-                            if not ("dc" in first_open_tag[0]):
-                                f_string = f_string.replace(first_open_tag[0], dc_prefix_open_tag)
-                                f_string = f_string.replace(last_close_tag[0], dc_prefix_close_tag)
-                            else:
-                                # If there is no pair of outermost tags surrounding all the metadata felds, add them,
-                                # being sure to place them after the XML prolog if it exists
-                                has_prolog = re.findall('<\?xml version="1.0"[^<]*>', f_string)
-                                if len(has_prolog) > 0:
-                                    f_string = f_string.replace(has_prolog[0], (has_prolog[0] + "\n" + dc_prefix_open_tag))
-                                else:
-                                    f_string = dc_prefix_open_tag + "\n" + f_string
-                                f_string = f_string + "\n" + dc_prefix_close_tag
-                                
-
-                        # If the last closing tag doesn't have a matching opening tag, add the matching opening
-                        # tag if there isn't already one that includes the DC and RDF namespaces, and replace
-                        # the last closing tag if it is different from the expected DC closing tag
-                        else:
-                            f_string = dc_prefix_open_tag + "\n" + f_string
-                            if last_close_tag[0] != dc_prefix_close_tag:
-                                f_string = f_string.replace(last_close_tag[0], dc_prefix_close_tag)
-
-
-                if "Namespace prefix rdf for about on Description" in message:
-                    # If the RDF description tag is malformed, replace it with a well-formed one
-                    rdf_desc_open_tag = re.findall('<rdf:Description rdf:about=.+>', f_string)
-                    if len(rdf_desc_open_tag) > 0:
-                        f_string = f_string.replace(rdf_desc_open_tag[0], '<rdf:Description rdf:about="http://www.w3.org/TR/rdf-syntax-grammar">')
-                    
-            f.close()
-
-            # To validate that the new data is well-formed, try parsing it as XML
-            # and, if successful, write the corrected file to a new directory 
+    settings = {
+        "dc_prefix_open_tag_simple": dc_prefix_open_tag_simple, "dc_prefix_open_tag_qual": dc_prefix_open_tag_qual,
+        "dc_prefix_close_tag": dc_prefix_close_tag, "xml_prolog": xml_prolog
+        }
+    fixers = OrderedDict([(name, fixer) for name, fixer in xml_fixers.items() if include_prolog or name != "add_prolog"])
+    still_incorrect, fixes = [], {"file_path": [], "fixers": [], "corrected": []}
+    for txt_file, message in zip(txt_errored_files, error_list):
+        with openRecord(txt_file) as f:
+            f_string = traceRead(f, txt_file)
+
+        fired, fixed_string = [], None
+        if recover:
             try:
-                f_string = f_string.strip()  # Remove any leading and trailing whitespace
-                root = ET.fromstring(f_string)
-                xml_file = txt_file.replace(".txt", ".xml")
-                corrected_file = xml_file.replace("cleaned", "corrected")
-                with open(corrected_file, "w") as f:
-                    f.write(f_string)
-                    f.close()
-            except Exception as e:
-                new_error = {"file": txt_file, "exception_type": type(e), "exception_message": str(e)}
-                still_incorrect += [new_error]
-
-        i += 1
-
+                root = etree.fromstring(f_string.strip().encode("utf-8"), xml_recover_parser)
+                if root is not None:
+                    recovered = etree.tostring(root, encoding="unicode")
+                    if include_prolog:
+                        recovered = xml_prolog + "\n" + recovered
+                    ET.fromstring(recovered)
+                    fixed_string, fired = recovered, ["lxml_recover"]
+            except Exception:
+                pass
+
+        # To validate that the new data is well-formed, try parsing it as XML
+        # and, if successful, write the corrected file to a new directory
+        try:
+            if fixed_string is None:
+                with traceOp("repair", txt_file):
+                    fixed_string, fired = repairXML(f_string, message, settings, fixers)
+                with traceOp("validate", txt_file):
+                    ET.fromstring(fixed_string)
+            xml_file = txt_file.replace(".txt", ".xml")
+            corrected_file = xml_file.replace("cleaned", "corrected")
+            with open(corrected_file, "w") as f:
+                f.write(fixed_string)
+            corrected = True
+        except Exception as e:
+            new_error = {"file": txt_file, "exception_type": type(e), "exception_message": str(e)}
+            still_incorrect.append(new_error)
+            corrected = False
+        fixes["file_path"].append(txt_file)
+        fixes["fixers"].append(fired)
+        fixes["corrected"].append(corrected)
+
+    if report:
+        return still_incorrect, pd.DataFrame(fixes)
     return still_incorrect
 
 
@@ -424,52 +3623,126 @@ def correctXML(
 #     return still_incorrect_list
     
 
-def correctJSON(txt_errored_files):
+# Splits a JSON record into the tokens `repairJSON` looks at: strings wrapped in doubled quotes
+# (""text""), strings, comments (//, #, or /* */), braces and brackets, and the other text
+json_token = re.compile(
+    '(?P<doubled>""(?=[^\\s,:}\\]"])(?:[^"\\\\]|\\\\.)*?"")'
+    '|(?P<string>"(?:[^"\\\\]|\\\\.)*")'
+    '|(?P<comment>//[^\\n]*|#[^\\n]*|/\\*[\\s\\S]*?\\*/)'
+    '|(?P<bracket>[{}\\[\\]])'
+    '|(?P<other>[^"/#{}\\[\\]]+|.)',
+    re.S
+    )
+closing_brackets = {"{": "}", "[": "]"}
+
+
+'''
+Repair a JSON record in one pass over its tokens (see `json_token`): remove comments, replace
+doubled quotes around text (""text"") with single quotes, add closing braces or brackets
+that are missing and remove closing braces or brackets that don't have an opening one.
+Output the repaired text and a list of the repairs made (one dictionary per repair, with the
+position in the original text and line number where it was made).
+'''
+def repairJSON(f_string):
+    repaired, repairs, stack = [], [], []
+    line, line_pos = 1, 0
+    for match in json_token.finditer(f_string):
+        kind, token, pos = match.lastgroup, match[0], match.start()
+        if kind == "other" or kind == "string":
+            repaired.append(token)
+            continue
+        # Count the lines up to this token (from the last token counted, so each line is counted once)
+        line += f_string.count("\n", line_pos, pos)
+        line_pos = pos
+        if kind == "doubled":
+            repaired.append(token[1:-1])
+            repairs.append({"position": pos, "line": line, "repair": "doubled_quotes", "text": token})
+        elif kind == "comment":
+            repairs.append({"position": pos, "line": line, "repair": "comment", "text": token})
+        elif token in closing_brackets:
+            stack.append(token)
+            repaired.append(token)
+        elif len(stack) > 0 and closing_brackets[stack[-1]] == token:
+            stack.pop()
+            repaired.append(token)
+        elif any(closing_brackets[opening] == token for opening in stack):
+            # Close the braces or brackets opened since the one this token closes
+            while closing_brackets[stack[-1]] != token:
+                missing = closing_brackets[stack.pop()]
+                repaired.append(missing)
+                repairs.append({"position": pos, "line": line, "repair": "missing_close", "text": missing})
+            stack.pop()
+            repaired.append(token)
+        else:
+            repairs.append({"position": pos, "line": line, "repair": "extra_close", "text": token})
+    line += f_string.count("\n", line_pos)
+    while len(stack) > 0:
+        missing = closing_brackets[stack.pop()]
+        repaired.append("\n" + missing)
+        repairs.append({"position": len(f_string), "line": line, "repair": "missing_close", "text": missing})
+    return "".join(repaired), repairs
+
+
+'''
+Load a JSON record that may be malformed: repair it with `repairJSON` and parse the repaired
+text.  Output the parsed data, the repaired text, and the list of repairs made.
+'''
+def loadJSON(f_string):
+    repaired, repairs = repairJSON(f_string)
+    return json.loads(repaired), repaired, repairs
+
+
+'''
+Correct malformed JSON files by reading TXT versions of the files, repairing them with
+`repairJSON`, and, if the repaired data can be parsed, writing it as a JSON file to a
+"corrected" directory.  Output a list of the files that are still malformed, a list of the
+comments removed from each file, and a list of the parsing errors of the files that are
+still malformed.  With `report=True`, also output a DataFrame of every repair made (one row
+per repair).
+'''
+@traced
+def correctJSON(txt_errored_files, report=False):
     still_incorrect = []
     comments_found = []
     new_syntax_errors = []
+    all_repairs = {"file_path": [], "position": [], "line": [], "repair": [], "text": []}
     for errored_file in txt_errored_files:
-        with open(errored_file, "r") as f:
-            f_string = f.read()
-            # Check for and remove invalid comments in format: //, #, or /* */
-            comments = re.findall("\n\s*\/\/\s*\w.+|\n\s*\/\*\s*.+\s*\*\/|\n\s*#\s*.+", f_string)
-            if len(comments) > 0:
-                comments_found += [{"errored_file": errored_file, "comment": comments}]
-                for comment in comments:
-                    f_string = f_string.replace(comment, "")
-            
-            # Check for double quotes surrounding field names and values (""..."" rather than "...")
-            double_quotes = re.findall("""[@\w]+"":[\s\[\{]*"".+""", f_string)
-            if len(double_quotes) > 0:
-                f_string = f_string.replace('""', '"')
-            
-            # Check for missing curly brace at end of file
-            open_brace = re.findall("\{", f_string)
-            close_brace = re.findall("\}", f_string)
-            if len(open_brace) == (len(close_brace) + 1):
-                f_string = f_string + "\n}"
-            elif (len(open_brace) > (len(close_brace) + 1)) or len(open_brace) < len(close_brace):
-                errored_json = errored_file.replace(".txt", ".json")
-                print("Please review file", errored_json, "manually and make sure that all open curly braces ({) are paired with a closing curly brace (}) and vice versa.")
-                still_incorrect += [errored_file]
-
-            f.close()
-
-            # To validate that the JSON data has been corrected, write a new file
-            # with the corrected string in a 'corrected' directory and try to load
-            # the file as JSON data
-            json_path = errored_file.replace(".txt", ".json")
-            corrected_file = json_path.replace("cleaned", "corrected")
-            with open(corrected_file, "w") as f_json:
-                f_json.write(f_string)
-                try:
-                    data = json.load(f_json)
-                except Exception as e:
-                    f_error = {"file": json_path, "exception_type": type(e), "exception_message": str(e)}
-                    new_syntax_errors += [f_error]
-                    still_incorrect += [errored_file]
-                f_json.close()
-
+        with openRecord(errored_file) as f:
+            f_string = traceRead(f, errored_file)
+
+        # Repair the data and parse it to check that it has been corrected
+        json_path = errored_file.replace(".txt", ".json")
+        error = None
+        try:
+            with traceOp("repair", errored_file):
+                data, repaired, repairs = loadJSON(f_string)
+        except Exception as e:
+            error = e
+            # Still malformed: repair it again only to find the repairs made
+            repaired, repairs = repairJSON(f_string)
+        comments = [repair["text"] for repair in repairs if repair["repair"] == "comment"]
+        if len(comments) > 0:
+            comments_found.append({"errored_file": errored_file, "comment": comments})
+        if report:
+            for repair in repairs:
+                all_repairs["file_path"].append(errored_file)
+                for key in ("position", "line", "repair", "text"):
+                    all_repairs[key].append(repair[key])
+
+        # If it has been corrected, write it to a new file in a 'corrected' directory
+        if error is not None:
+            f_error = {"file": json_path, "exception_type": type(error), "exception_message": str(error)}
+            new_syntax_errors.append(f_error)
+            still_incorrect.append(errored_file)
+            continue
+        corrected_file = json_path.replace("cleaned", "corrected")
+        with open(corrected_file, "w") as f_json:
+            f_json.write(repaired)
+
+    if report:
+        repairs_df = pd.DataFrame(all_repairs)
+        repairs_df["repair"] = repairs_df["repair"].astype("category")
+        return still_incorrect, comments_found, new_syntax_errors, repairs_df
     return still_incorrect, comments_found, new_syntax_errors
 
 